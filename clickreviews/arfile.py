@@ -0,0 +1,88 @@
+'''arfile.py: sequential reader for ar archives (clicks, snap v1 and debs)'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+
+AR_MAGIC = b'!<arch>\n'
+AR_HEADER_SIZE = 60
+AR_FMAG = b'`\n'
+
+
+class ArException(Exception):
+    '''This class represents ar archive exceptions'''
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class ArMember(object):
+    '''A member of an ar archive. This is a file-like object that reads the
+       member data straight from the archive, so members must be consumed
+       in order.'''
+    def __init__(self, fileobj, name, size, mode, mtime):
+        self._fileobj = fileobj
+        self.name = name
+        self.size = size
+        self.mode = mode
+        self.mtime = mtime
+        self._remaining = size
+
+    def read(self, n=-1):
+        if n is None or n < 0 or n > self._remaining:
+            n = self._remaining
+        data = self._fileobj.read(n)
+        if len(data) != n:
+            raise ArException("member '%s' truncated" % self.name)
+        self._remaining -= n
+        return data
+
+    def skip(self):
+        '''Skip whatever was not read of this member, including the
+           padding'''
+        while self._remaining > 0:
+            self.read(min(self._remaining, 1024 * 1024))
+        if self.size % 2:
+            self._fileobj.read(1)
+
+
+def iter_members(fileobj):
+    '''Yield an ArMember for each member of the ar archive in fileobj'''
+    if fileobj.read(len(AR_MAGIC)) != AR_MAGIC:
+        raise ArException("not an ar archive")
+
+    while True:
+        header = fileobj.read(AR_HEADER_SIZE)
+        if len(header) == 0:
+            return
+        if len(header) != AR_HEADER_SIZE or header[58:60] != AR_FMAG:
+            raise ArException("malformed member header")
+
+        # GNU ar terminates names with '/'
+        name = header[0:16].decode('ascii', 'replace').rstrip(' ')
+        if name.endswith('/') and name != '/' and name != '//':
+            name = name[:-1]
+        try:
+            mtime = int(header[16:28].strip() or b'0')
+            mode = int(header[40:48].strip() or b'0', 8)
+            size = int(header[48:58].strip())
+        except ValueError:
+            raise ArException("malformed member header for '%s'" % name)
+
+        member = ArMember(fileobj, name, size, mode, mtime)
+        yield member
+        member.skip()
@@ -17,6 +17,12 @@
 from __future__ import print_function
 import atexit
 import codecs
+import collections
+import concurrent.futures
+import contextlib
+import copy
+import fnmatch
+import hashlib
 import inspect
 import json
 import logging
@@ -24,16 +30,38 @@ import magic
 import os
 import re
 import shutil
+import stat
 import subprocess
 import sys
+import tarfile
 import tempfile
+import threading
+import time
 import types
 
+import clickreviews.arfile as arfile
+import clickreviews.elf as elf
+import clickreviews.squashfs as squashfs
+import clickreviews.unpack_cache as unpack_cache
+
 
 DEBUGGING = False
 UNPACK_DIR = None
 RAW_UNPACK_DIR = None
 TMP_DIR = None
+PKG_FS = None
+PKG_DIGESTS = dict()
+PKG_INDEX = None
+UNPACK_CACHE = None
+PROVIDED_DIRS = set()
+# Directories given to use_unpacked_dirs(). How they were unpacked is unknown
+GIVEN_DIRS = set()
+# Bump this when unpacking lays out the trees differently (eg, other modes)
+# so that trees cached by older versions aren't used
+UNPACK_FORMAT = 2
+JOBS = None
+HASH_CHUNK_SIZE = 1024 * 1024
+HASH_STATS = {'files': 0, 'bytes': 0, 'seconds': 0.0}
 VALID_SYSCALL = r'^[a-z0-9_]{2,64}$'
 # This needs to match up with snapcraft
 MKSQUASHFS_OPTS = ['-noappend', '-comp', 'xz', '-all-root', '-no-xattrs']
@@ -54,19 +82,35 @@ AA_PROFILE_NAME_ADVLEN = 100
 STORE_PKGNAME_SNAPV2_MAXLEN = 40
 
 
+def _is_shared(d):
+    '''Return True if d is not ours to remove'''
+    return d in PROVIDED_DIRS
+
+
 def cleanup_unpack():
+    # trees given by the caller or shared by another process aren't ours,
+    # so leave them be
     global UNPACK_DIR
     if UNPACK_DIR is not None and os.path.isdir(UNPACK_DIR):
-        recursive_rm(UNPACK_DIR)
+        if not _is_shared(UNPACK_DIR):
+            recursive_rm(UNPACK_DIR)
         UNPACK_DIR = None
     global RAW_UNPACK_DIR
     if RAW_UNPACK_DIR is not None and os.path.isdir(RAW_UNPACK_DIR):
-        recursive_rm(RAW_UNPACK_DIR)
+        if not _is_shared(RAW_UNPACK_DIR):
+            recursive_rm(RAW_UNPACK_DIR)
         RAW_UNPACK_DIR = None
     global TMP_DIR
     if TMP_DIR is not None and os.path.isdir(TMP_DIR):
         recursive_rm(TMP_DIR)
         TMP_DIR = None
+    global PKG_FS
+    if PKG_FS is not None:
+        PKG_FS.cleanup()
+        PKG_FS = None
+    global PKG_INDEX
+    PKG_INDEX = None
+    PKG_DIGESTS.clear()
 
 
 atexit.register(cleanup_unpack)
@@ -86,15 +130,22 @@ class ReviewException(Exception):
 
 class Review(object):
     '''Common review class'''
+    # The (type, version) of the packages, as returned by detect_package(),
+    # that the checks apply to. None for all of them.
+    package_formats = None
     magic_binary_file_descriptions = [
         'application/x-executable; charset=binary',
         'application/x-sharedlib; charset=binary',
         'application/x-object; charset=binary',
     ]
 
-    def __init__(self, fn, review_type, overrides=None):
+    def __init__(self, fn, review_type, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         self.pkg_filename = fn
         self._check_package_exists()
+        if context is None:
+            context = PackageContext(fn)
+        self.context = context
 
         self.review_type = review_type
         # TODO: rename as pkg_report
@@ -108,22 +159,24 @@ class Review(object):
 
         self.click_report_output = "json"
 
-        global UNPACK_DIR
-        if UNPACK_DIR is None:
-            UNPACK_DIR = unpack_pkg(fn)
-        self.unpack_dir = UNPACK_DIR
-
-        global RAW_UNPACK_DIR
-        if RAW_UNPACK_DIR is None:
-            RAW_UNPACK_DIR = raw_unpack_pkg(fn)
-        self.raw_unpack_dir = RAW_UNPACK_DIR
+        # Files are read from the package index and extracted on demand.
+        # The package is only fully unpacked when a check asks for
+        # unpack_dir, raw_unpack_dir or pkg_files. If the caller already
+        # unpacked it, that is used instead.
+        self.pkgfs = get_pkgfs(fn)
+        if unpack_dir is not None or raw_unpack_dir is not None:
+            use_unpacked_dirs(unpack_dir, raw_unpack_dir)
+        self._unpack_dir = None
+        self._unpacked = False
+        self._raw_unpack_dir = None
+        self._raw_unpacked = False
 
         self.is_click = False
         self.is_snap1 = False
         self.is_snap2 = False
         self.pkgfmt = {"type": "", "version": ""}
 
-        (self.pkgfmt["type"], pkgver) = detect_package(fn, self.unpack_dir)
+        (self.pkgfmt["type"], pkgver) = self.context.pkgfmt
 
         if self._pkgfmt_type() == "snap":
             if pkgver < 2:
@@ -138,14 +191,14 @@ class Review(object):
         else:
             error("Unknown package type: '%s'" % self._pkgfmt_type())
 
-        # Get a list of all unpacked files
-        self.pkg_files = []
-        self._list_all_files()
+        # List of all unpacked files, gathered on first use
+        self._pkg_files = None
 
         # Setup what is needed to get a list of all unpacked compiled binaries
-        self.mime = magic.open(magic.MAGIC_MIME)
-        self.mime.load()
+        self.mime = get_magic()
         self.pkg_bin_files = []
+        # Architecture of each of pkg_bin_files, None when unknown
+        self.pkg_bin_arches = dict()
         # Don't run this here since only cr_lint.py and cr_functional.py need
         # it now
         # self._list_all_compiled_binaries()
@@ -154,6 +207,49 @@ class Review(object):
 
         self.override_result_type = None
 
+    @property
+    def unpack_dir(self):
+        '''Directory with the fully unpacked package'''
+        if not self._unpacked:
+            self._unpack_dir = self.pkgfs.unpack_dir()
+            self._unpacked = True
+        return self._unpack_dir
+
+    @unpack_dir.setter
+    def unpack_dir(self, d):
+        self._unpack_dir = d
+        self._unpacked = True
+
+    @property
+    def raw_unpack_dir(self):
+        '''Directory with the raw (ar) members of the package'''
+        if not self._raw_unpacked:
+            self._raw_unpack_dir = self.pkgfs.raw_unpack_dir()
+            self._raw_unpacked = True
+        return self._raw_unpack_dir
+
+    @raw_unpack_dir.setter
+    def raw_unpack_dir(self, d):
+        self._raw_unpack_dir = d
+        self._raw_unpacked = True
+
+    @property
+    def pkg_index(self):
+        '''PackageIndex of the unpacked package'''
+        return get_package_index(self.unpack_dir)
+
+    @property
+    def pkg_files(self):
+        '''List of all files in the unpacked package'''
+        if self._pkg_files is None:
+            self._pkg_files = []
+            self._list_all_files()
+        return self._pkg_files
+
+    @pkg_files.setter
+    def pkg_files(self, files):
+        self._pkg_files = files
+
     def _check_innerpath_executable(self, fn):
         '''Check that the provided path exists and is executable'''
         return os.access(fn, os.X_OK)
@@ -168,20 +264,36 @@ class Review(object):
 
     def _extract_file(self, rel):
         '''Extract file'''
-        fn = os.path.join(self.unpack_dir, rel)
-        if not os.path.isfile(fn):
+        if os.path.isabs(rel):
+            # already in the unpacked tree, eg from pkg_files
+            if not os.path.isfile(rel):
+                error("Could not find '%s'" % rel)
+            return open_file_read(rel)
+        if not self.pkgfs.isfile(rel):
             error("Could not find '%s'" % rel)
-        return open_file_read(fn)
+        return self.pkgfs.open(rel)
 
     def _path_join(self, dirname, rest):
         return os.path.join(dirname, rest)
 
+    def _get_archive_digest(self, member=None, algorithm='sha512'):
+        '''Return the digest of the package, or of one of its ar members
+           (eg, 'data.tar.gz'), as computed when the package was first read.
+           None if there is no such member'''
+        digests = get_digests(self.pkg_filename)
+        if member is None:
+            return digests.package[algorithm]
+        if member not in digests.members:
+            return None
+        return digests.members[member][algorithm]
+
     def _get_sha512sum(self, fn):
         '''Get sha512sum of file'''
-        (rc, out) = cmd(['sha512sum', fn])
-        if rc != 0:
-            return None
-        return out.split()[0]
+        return hash_file(fn, 'sha512')
+
+    def _get_sha512sums(self, fns):
+        '''Get sha512sum of all fns at once, as a dict keyed by file'''
+        return hash_files(fns, 'sha512')
 
     def _pkgfmt_type(self):
         '''Return the package format type'''
@@ -202,9 +314,7 @@ class Review(object):
 
     def _list_all_files(self):
         '''List all files included in this click package.'''
-        for root, dirnames, filenames in os.walk(self.unpack_dir):
-            for f in filenames:
-                self.pkg_files.append(os.path.join(root, f))
+        self.pkg_files.extend(self.pkg_index.files())
 
     def _check_if_message_catalog(self, fn):
         '''Check if file is a message catalog (.mo file).'''
@@ -213,19 +323,30 @@ class Review(object):
         return False
 
     def _list_all_compiled_binaries(self):
-        '''List all compiled binaries in this click package.'''
+        '''List all compiled binaries in this click package. Only the ELF
+           header of each file is read.'''
+        index = self.pkg_index
         for i in self.pkg_files:
-            try:
-                res = self.mime.file(i)
-            except Exception:  # pragma: nocover
-                # workaround for zesty python3-magic
-                debug("could not detemine mime type of '%s'" % i)
+            if self._check_if_message_catalog(i) or i in self.pkg_bin_files:
                 continue
 
-            if res in self.magic_binary_file_descriptions and \
-               not self._check_if_message_catalog(i) and \
-               i not in self.pkg_bin_files:
+            entry = index.get(os.path.relpath(i, self.unpack_dir))
+            if entry is not None and \
+                    (entry.type != '-' or entry.size < len(elf.ELF_MAGIC)):
+                continue
+
+            header = elf.read_header(i)
+            if elf.is_binary(header):
                 self.pkg_bin_files.append(i)
+                self.pkg_bin_arches[i] = elf.get_architecture(header)
+
+    def _get_pkg_bin_arches(self):
+        '''Return the set of known architectures of pkg_bin_files'''
+        arches = set()
+        for i in self.pkg_bin_files:
+            if self.pkg_bin_arches.get(i) is not None:
+                arches.add(self.pkg_bin_arches[i])
+        return arches
 
     def _get_check_name(self, name, app='', extra=''):
         name = ':'.join([self.review_type, name])
@@ -329,9 +450,11 @@ class Review(object):
 
     def do_checks(self):
         '''Run all methods that start with check_'''
+        # look the checks up on the class so that properties (which may
+        # unpack the package) aren't evaluated just to list them
         methodList = [name for name, member in
-                      inspect.getmembers(self, inspect.ismethod)
-                      if isinstance(member, types.MethodType)]
+                      inspect.getmembers(type(self), inspect.isfunction)
+                      if isinstance(getattr(self, name), types.MethodType)]
         for methodname in methodList:
             if not methodname.startswith("check_"):
                 continue
@@ -417,6 +540,22 @@ def cmd_pipe(command1, command2):
     return [sp2.returncode, out]
 
 
+_UMASK_LOCK = threading.Lock()
+
+
+@contextlib.contextmanager
+def with_umask(mask):
+    '''Run the body, eg a cmd() whose files shouldn't lose any modes, with
+       the given umask. The umask is process wide, but the only other
+       threads here are the hash_files() ones, which don't create files'''
+    with _UMASK_LOCK:
+        old_mask = os.umask(mask)
+        try:
+            yield
+        finally:
+            os.umask(old_mask)
+
+
 def _unpack_cmd(cmd_args, d, dest):
     '''Low level unpack helper'''
     curdir = os.getcwd()
@@ -441,14 +580,309 @@ def _unpack_cmd(cmd_args, d, dest):
 def _unpack_snap_squashfs(snap_pkg, dest):
     '''Unpack a squashfs based snap package to dest'''
     d = tempfile.mkdtemp(prefix='review-')
-    return _unpack_cmd(['unsquashfs', '-f', '-d', d,
-                        os.path.abspath(snap_pkg)], d, dest)
+    # unsquashfs creates files with the modes in the squashfs less the
+    # umask. Don't alter them so the tree can be resquashed as is.
+    with with_umask(0o000):
+        dest = _unpack_cmd(['unsquashfs', '-f', '-d', d,
+                            os.path.abspath(snap_pkg)], d, dest)
+    return dest
+
+
+class _TeeReader(object):
+    '''File-like wrapper that copies everything read from fileobj to out
+       and feeds it to the hashlib objects in hashes'''
+    def __init__(self, fileobj, out=None, hashes=None):
+        self._fileobj = fileobj
+        self._out = out
+        self._hashes = hashes if hashes is not None else []
+
+    def read(self, n=-1):
+        data = self._fileobj.read(n)
+        if self._out is not None:
+            self._out.write(data)
+        for h in self._hashes:
+            h.update(data)
+        return data
+
+    def drain(self):
+        '''Read whatever is left'''
+        while self.read(1024 * 1024):
+            pass
+
+
+# Digests computed for every package read
+DIGEST_ALGORITHMS = ['sha512', 'sha256', 'md5']
+
+
+def _new_hashes():
+    return [hashlib.new(a) for a in DIGEST_ALGORITHMS]
+
+
+def _hexdigests(hashes):
+    return dict(zip(DIGEST_ALGORITHMS, [h.hexdigest() for h in hashes]))
+
+
+class ArchiveDigests(object):
+    '''Digests of a package file (by algorithm) and, for clicks and debs,
+       of each of its ar members (by member name, then algorithm)'''
+    def __init__(self, fn):
+        st = os.stat(fn)
+        self._signature = (st.st_size, st.st_mtime_ns)
+        self.package = dict()
+        self.members = dict()
+
+    def is_current(self, fn):
+        '''Return True if fn is unchanged since the digests were taken'''
+        try:
+            st = os.stat(fn)
+        except OSError:
+            return False
+        return self._signature == (st.st_size, st.st_mtime_ns)
+
+
+def get_digests(fn):
+    '''Return the ArchiveDigests of fn. Clicks and debs get them as a side
+       effect of being unpacked, anything else (or a package not unpacked
+       yet) is read once here and the result is reused afterwards'''
+    pkg = os.path.abspath(fn)
+    if pkg in PKG_DIGESTS and PKG_DIGESTS[pkg].is_current(pkg):
+        return PKG_DIGESTS[pkg]
+
+    try:
+        if is_squashfs(pkg):
+            digests = ArchiveDigests(pkg)
+            hashes = _new_hashes()
+            with open(pkg, 'rb') as fh:
+                _TeeReader(fh, hashes=hashes).drain()
+            digests.package = _hexdigests(hashes)
+            PKG_DIGESTS[pkg] = digests
+        else:
+            _unpack_deb(pkg, None, None)
+    except (arfile.ArException, ReviewException, OSError) as e:
+        error("could not compute digests of '%s': %s" % (fn, e))
+    return PKG_DIGESTS[pkg]
+
+
+def _safe_tar_members(tar):
+    '''Yield the members of tar, refusing anything that would be written
+       outside of the extraction directory'''
+    symlinks = set()
+    for info in tar:
+        raw_names = [info.name]
+        if info.islnk():
+            raw_names.append(info.linkname)
+        # extractall() writes to the name as is, so 'a/..' would go through
+        # the symlink 'a' even if the normalized name never does
+        for name in raw_names:
+            if '..' in name.split('/'):
+                raise ReviewException("'%s' points outside of the package" %
+                                      info.name)
+        path = os.path.normpath(info.name)
+        names = [os.path.normpath(name) for name in raw_names]
+        for name in names:
+            if name.startswith('/'):
+                raise ReviewException("'%s' points outside of the package" %
+                                      info.name)
+            # don't write (or chmod) through symlinks extracted earlier,
+            # whether the member replaces the symlink or is under it, and
+            # don't hardlink to them since os.link() follows symlinks
+            parent = name
+            while parent not in ['', '.']:
+                if parent in symlinks:
+                    raise ReviewException("'%s' would be written through "
+                                          "the symlink '%s'" %
+                                          (info.name, parent))
+                parent = os.path.dirname(parent)
+        if info.issym():
+            symlinks.add(path)
+        yield info
+
+
+def _extract_tar_stream(fileobj, dest):
+    '''Extract the (possibly compressed) tarball read from fileobj into
+       dest, keeping modes like dpkg-deb does'''
+    kwargs = dict()
+    if hasattr(tarfile, 'fully_trusted_filter'):
+        # _safe_tar_members() already did the checking and the 'data'
+        # filter would strip setuid/setgid bits we need to review
+        kwargs['filter'] = 'fully_trusted'
+    os.makedirs(dest, exist_ok=True)
+    with tarfile.open(fileobj=fileobj, mode='r|*') as tar:
+        tar.extractall(dest, members=_safe_tar_members(tar), **kwargs)
+
+
+def _unpack_deb(pkg, dest, raw_dest):
+    '''Read the ar members of pkg in a single sequential pass. The control
+       and data tarballs are extracted into dest (laid out like
+       'dpkg-deb -R') and the members themselves are written to raw_dest
+       (like 'ar x'). Either may be None. The digests of the package and
+       its members are stored for get_digests() along the way. Returns
+       False if some tarball uses a compression tarfile doesn't support,
+       in which case dest is incomplete.'''
+    complete = True
+    digests = ArchiveDigests(pkg)
+    pkg_hashes = _new_hashes()
+    with open(pkg, 'rb') as fh:
+        f = _TeeReader(fh, hashes=pkg_hashes)
+        for member in arfile.iter_members(f):
+            if member.name in ['', '.', '..'] or '/' in member.name:
+                raise ReviewException("invalid member name '%s'" %
+                                      member.name)
+            out = None
+            if raw_dest is not None:
+                out = open(os.path.join(raw_dest, member.name), 'wb')
+            member_hashes = _new_hashes()
+            try:
+                stream = _TeeReader(member, out, member_hashes)
+                subdir = None
+                if member.name.startswith('control.tar'):
+                    subdir = 'DEBIAN'
+                elif member.name.startswith('data.tar'):
+                    subdir = ''
+                if dest is not None and subdir is not None:
+                    try:
+                        _extract_tar_stream(stream,
+                                            os.path.join(dest, subdir))
+                    except tarfile.CompressionError as e:
+                        debug("'%s': %s" % (member.name, e))
+                        complete = False
+                stream.drain()
+            finally:
+                if out is not None:
+                    out.close()
+                    os.chmod(out.name, member.mode & 0o777)
+                    os.utime(out.name, (member.mtime, member.mtime))
+            digests.members[member.name] = _hexdigests(member_hashes)
+        f.drain()
+    digests.package = _hexdigests(pkg_hashes)
+    PKG_DIGESTS[pkg] = digests
+    return complete
+
+
+def _unpack_click_deb_dirs(pkg, want_tree=True, want_raw=False):
+    '''Unpack a click or deb into temporary directories. Returns the
+       unpacked tree and the directory with the raw ar members (None if not
+       wanted)'''
+    pkg = os.path.abspath(pkg)
+    d = tempfile.mkdtemp(prefix='review-') if want_tree else None
+    raw_d = tempfile.mkdtemp(prefix='review-') if want_raw else None
+    try:
+        complete = _unpack_deb(pkg, d, raw_d)
+    except (arfile.ArException, tarfile.TarError, ReviewException,
+            EOFError, OSError) as e:
+        for i in [d, raw_d]:
+            if i is not None and os.path.isdir(i):
+                recursive_rm(i)
+        error("unpacking failed:\n%s" % e)
+
+    if not complete:
+        # eg, zstd compressed tarballs. Let dpkg-deb deal with them
+        recursive_rm(d)
+        d = tempfile.mkdtemp(prefix='review-')
+        d = _unpack_cmd(['dpkg-deb', '-R', pkg, d], d, None)
+
+    return (d, raw_d)
 
 
 def _unpack_click_deb(pkg, dest):
-    d = tempfile.mkdtemp(prefix='review-')
-    return _unpack_cmd(['dpkg-deb', '-R',
-                        os.path.abspath(pkg), d], d, dest)
+    (d, raw_d) = _unpack_click_deb_dirs(pkg)
+    if dest is None:
+        dest = d
+    else:
+        shutil.move(d, dest)
+    return dest
+
+
+def set_unpack_cache(path, max_size=None):
+    '''Keep unpacked packages in path across runs, keyed by the sha512 of
+       the package, using at most max_size bytes. A path of None disables
+       the cache (the default)'''
+    global UNPACK_CACHE
+    if path is None:
+        UNPACK_CACHE = None
+    else:
+        UNPACK_CACHE = unpack_cache.UnpackCache(path, max_size)
+
+
+def _unpack_with_cache(pkg, want_tree=True, want_raw=False):
+    '''Like unpack_pkg_with_raw(), but copy the trees from UNPACK_CACHE
+       and add any that had to be unpacked. Either way the trees are ours'''
+    key = '%02x%s' % (UNPACK_FORMAT, get_digests(pkg).package['sha512'])
+    d = None
+    raw_d = None
+    if want_tree:
+        d = UNPACK_CACHE.lookup(key, 'unpack')
+    if want_raw:
+        raw_d = "" if is_squashfs(pkg) else UNPACK_CACHE.lookup(key, 'raw')
+
+    missing_tree = want_tree and d is None
+    missing_raw = want_raw and raw_d is None
+    if missing_tree and is_squashfs(pkg):
+        d = _unpack_snap_squashfs(pkg, None)
+        UNPACK_CACHE.insert(key, 'unpack', d)
+    elif missing_tree or missing_raw:
+        (new_d, new_raw_d) = _unpack_click_deb_dirs(pkg, missing_tree,
+                                                    missing_raw)
+        if missing_tree:
+            d = new_d
+            UNPACK_CACHE.insert(key, 'unpack', d)
+        if missing_raw:
+            raw_d = new_raw_d
+            UNPACK_CACHE.insert(key, 'raw', raw_d)
+    return (d, raw_d)
+
+
+def use_unpacked_dirs(unpack_dir, raw_unpack_dir=None):
+    '''Use unpack_dir (laid out like unpack_pkg() does) and, for clicks
+       and debs, raw_unpack_dir (like raw_unpack_pkg() does) instead of
+       unpacking the package again. The package file is still what the
+       index, digests and squashfs checks come from. These directories are
+       never removed by cleanup_unpack()'''
+    global UNPACK_DIR
+    global RAW_UNPACK_DIR
+    for d in [unpack_dir, raw_unpack_dir]:
+        if d is not None and not os.path.isdir(d):
+            error("'%s' is not a directory" % d)
+
+    if unpack_dir is not None:
+        UNPACK_DIR = os.path.abspath(unpack_dir)
+        PROVIDED_DIRS.add(UNPACK_DIR)
+        GIVEN_DIRS.add(UNPACK_DIR)
+    if raw_unpack_dir is not None:
+        RAW_UNPACK_DIR = os.path.abspath(raw_unpack_dir)
+        PROVIDED_DIRS.add(RAW_UNPACK_DIR)
+        GIVEN_DIRS.add(RAW_UNPACK_DIR)
+
+
+def share_unpacked_dirs(unpack_dir, raw_unpack_dir):
+    '''Use the trees another process unpacked (see unpack_pkg_with_raw())
+       from a worker process forked to run checks. What the worker
+       inherited is dropped without removing anything, and
+       cleanup_unpack() leaves the shared trees to their owner'''
+    global UNPACK_DIR
+    global RAW_UNPACK_DIR
+    global TMP_DIR
+    global PKG_FS
+    global PKG_INDEX
+    for d in [unpack_dir, raw_unpack_dir]:
+        if d:
+            PROVIDED_DIRS.add(d)
+    UNPACK_DIR = unpack_dir
+    RAW_UNPACK_DIR = raw_unpack_dir
+    TMP_DIR = None
+    PKG_FS = None
+    PKG_INDEX = None
+
+
+def get_unpacked_dir():
+    '''Return the directory the package was already fully unpacked to by
+       unpack_pkg(), be it in this run, by a parent process or from the
+       unpack cache, or None. Directories given to use_unpacked_dirs() are
+       not returned since how they were unpacked is unknown'''
+    if UNPACK_DIR is None or UNPACK_DIR in GIVEN_DIRS or \
+            not os.path.isdir(UNPACK_DIR):
+        return None
+    return UNPACK_DIR
 
 
 def unpack_pkg(fn, dest=None):
@@ -462,6 +896,9 @@ def unpack_pkg(fn, dest=None):
     if dest is not None and os.path.exists(dest):
         error("'%s' exists. Aborting." % dest)
 
+    if dest is None and UNPACK_CACHE is not None:
+        return _unpack_with_cache(pkg)[0]
+
     # check if its a squashfs based snap
     if is_squashfs(pkg):
         return _unpack_snap_squashfs(fn, dest)
@@ -490,26 +927,434 @@ def raw_unpack_pkg(fn, dest=None):
     if dest is not None and os.path.exists(dest):
         error("'%s' exists. Aborting." % dest)
 
-    d = tempfile.mkdtemp(prefix='review-')
-
-    curdir = os.getcwd()
-    os.chdir(d)
-    (rc, out) = cmd(['ar', 'x', pkg])
-    os.chdir(curdir)
-
-    if rc != 0:
-        if os.path.isdir(d):
-            recursive_rm(d)
-        error("'ar x' failed with '%d':\n%s" % (rc, out))
+    if dest is None and UNPACK_CACHE is not None:
+        return _unpack_with_cache(pkg, want_tree=False, want_raw=True)[1]
 
+    (d, raw_d) = _unpack_click_deb_dirs(pkg, want_tree=False, want_raw=True)
     if dest is None:
-        dest = d
+        dest = raw_d
     else:
-        shutil.move(d, dest)
+        shutil.move(raw_d, dest)
 
     return dest
 
 
+def unpack_pkg_with_raw(fn):
+    '''Unpack package and its raw members. Returns the (unpack_dir,
+       raw_unpack_dir) tuple, like unpack_pkg() and raw_unpack_pkg(), but
+       clicks and debs are only read once'''
+    if not os.path.isfile(fn):
+        error("Could not find '%s'" % fn)
+    pkg = os.path.abspath(fn)
+    if UNPACK_CACHE is not None:
+        return _unpack_with_cache(pkg, want_tree=True, want_raw=True)
+    if is_squashfs(pkg):
+        return (_unpack_snap_squashfs(pkg, None), "")
+    return _unpack_click_deb_dirs(pkg, want_tree=True, want_raw=True)
+
+
+# path: path relative to the top of the package (eg, 'meta/snap.yaml'). The
+#   control files of clicks and snap v1 packages are under 'DEBIAN/'
+# type: ls type character ('d', '-', 'l', 'b', 'c', 'p' or 's')
+# mode: full st_mode (file type and permission bits)
+# size: size of the file (0 for anything but regular files and symlinks)
+# target: symlink target for 'l' entries, otherwise None
+PackageEntry = collections.namedtuple('PackageEntry',
+                                      ['path', 'type', 'mode', 'size',
+                                       'target'])
+
+
+class PackageFS(object):
+    '''Read-only view of the files in a package. Entries are listed from
+       the archive index (the squashfs directory table or the members of
+       the control and data tarballs) and file contents are extracted only
+       when asked for.'''
+    tar_types = {tarfile.REGTYPE: ('-', stat.S_IFREG),
+                 tarfile.AREGTYPE: ('-', stat.S_IFREG),
+                 tarfile.LNKTYPE: ('-', stat.S_IFREG),
+                 tarfile.DIRTYPE: ('d', stat.S_IFDIR),
+                 tarfile.SYMTYPE: ('l', stat.S_IFLNK),
+                 tarfile.CHRTYPE: ('c', stat.S_IFCHR),
+                 tarfile.BLKTYPE: ('b', stat.S_IFBLK),
+                 tarfile.FIFOTYPE: ('p', stat.S_IFIFO),
+                 }
+
+    def __init__(self, fn):
+        self.pkg_filename = os.path.abspath(fn)
+        self._entries = None
+        self._is_squashfs = None
+        self._hardlinks = set()
+        self._extract_dir = None
+        self._extracted = dict()
+
+    def cleanup(self):
+        '''Remove any files extracted on demand'''
+        if self._extract_dir is not None and os.path.isdir(self._extract_dir):
+            recursive_rm(self._extract_dir)
+        self._extract_dir = None
+        self._extracted = dict()
+
+    def is_squashfs(self):
+        if self._is_squashfs is None:
+            self._is_squashfs = is_squashfs(self.pkg_filename)
+        return self._is_squashfs
+
+    def _iter_deb_tar(self, control=False):
+        '''Yield (path, tarinfo, tarfile) for each member of the data (or
+           control) tarball. Raises tarfile.CompressionError if the tarball
+           uses a compression tarfile doesn't support'''
+        want = 'data.tar'
+        prefix = ''
+        if control:
+            want = 'control.tar'
+            prefix = 'DEBIAN'
+        try:
+            with open(self.pkg_filename, 'rb') as f:
+                for member in arfile.iter_members(f):
+                    if not member.name.startswith(want):
+                        continue
+                    with tarfile.open(fileobj=member, mode='r|*') as tar:
+                        for info in tar:
+                            path = os.path.normpath(os.path.join(prefix,
+                                                                 info.name))
+                            if path == '.' or path.startswith('../') or \
+                                    path.startswith('/'):
+                                continue
+                            yield (path, info, tar)
+                    return
+        except tarfile.CompressionError:
+            raise
+        except (arfile.ArException, tarfile.TarError, EOFError,
+                OSError) as e:
+            error("could not read '%s': %s" % (self.pkg_filename, e))
+        error("could not find '%s.*' in '%s'" % (want, self.pkg_filename))
+
+    def _read_index(self):
+        entries = collections.OrderedDict()
+        if self.is_squashfs():
+            try:
+                for e in squashfs.list_entries(self.pkg_filename):
+                    if e.path == '.':
+                        continue
+                    size = e.size if e.type in ['-', 'l'] else 0
+                    entries[e.path[2:]] = PackageEntry(e.path[2:], e.type,
+                                                       e.mode, size,
+                                                       e.target)
+            except squashfs.SquashfsException as e:
+                debug("could not read squashfs index, unpacking: %s" % e)
+                return self._read_unpacked_index()
+            return entries
+
+        try:
+            self._read_deb_index(entries)
+        except tarfile.CompressionError as e:
+            debug("could not read deb index, unpacking: %s" % e)
+            self._hardlinks = set()
+            return self._read_unpacked_index()
+        return entries
+
+    def _read_deb_index(self, entries):
+        for control in [True, False]:
+            if control:
+                entries['DEBIAN'] = PackageEntry('DEBIAN', 'd',
+                                                 stat.S_IFDIR | 0o755, 0,
+                                                 None)
+            for (path, info, tar) in self._iter_deb_tar(control):
+                (ftype, fmt) = self.tar_types.get(info.type,
+                                                  ('-', stat.S_IFREG))
+                target = None
+                if info.issym():
+                    target = info.linkname
+                elif info.islnk():
+                    self._hardlinks.add(path)
+                size = info.size
+                if info.issym():
+                    size = len(info.linkname)
+                elif not info.isfile():
+                    size = 0
+                entries[path] = PackageEntry(path, ftype,
+                                             fmt | (info.mode & 0o7777),
+                                             size, target)
+
+    def _read_unpacked_index(self):
+        '''Build the index from the fully unpacked package'''
+        entries = collections.OrderedDict()
+        top = self.unpack_dir()
+        for root, dirnames, filenames in os.walk(top):
+            for f in dirnames + filenames:
+                fn = os.path.join(root, f)
+                st = os.lstat(fn)
+                rel = os.path.relpath(fn, top)
+                target = None
+                if stat.S_ISLNK(st.st_mode):
+                    target = os.readlink(fn)
+                entries[rel] = PackageEntry(rel, stat.filemode(st.st_mode)[0],
+                                            st.st_mode, st.st_size, target)
+        return entries
+
+    def entries(self):
+        '''Return the package index, as an ordered dict of
+           PackageEntry keyed by path'''
+        if self._entries is None:
+            self._entries = self._read_index()
+        return self._entries
+
+    def _normpath(self, rel):
+        return os.path.normpath(rel).lstrip('/')
+
+    def exists(self, rel):
+        return self._normpath(rel) in self.entries()
+
+    def isfile(self, rel):
+        rel = self._normpath(rel)
+        if rel not in self.entries():
+            return False
+        elif self.entries()[rel].type == 'l':
+            # symlinks may point anywhere, so resolve them in the tree
+            return os.path.isfile(os.path.join(self.unpack_dir(), rel))
+        return self.entries()[rel].type == '-'
+
+    def isdir(self, rel):
+        rel = self._normpath(rel)
+        if rel == '.':
+            return True
+        return rel in self.entries() and self.entries()[rel].type == 'd'
+
+    def listdir(self, rel='.'):
+        '''List the names of the entries in the rel directory'''
+        rel = self._normpath(rel)
+        names = []
+        for path in self.entries():
+            if os.path.dirname(path) == ('' if rel == '.' else rel):
+                names.append(os.path.basename(path))
+        return names
+
+    def _unpack(self):
+        '''Fill in whichever of UNPACK_DIR and RAW_UNPACK_DIR is missing.
+           When both are, clicks and debs are read only once for both'''
+        global UNPACK_DIR
+        global RAW_UNPACK_DIR
+        if UNPACK_DIR is None and RAW_UNPACK_DIR is None:
+            (UNPACK_DIR, RAW_UNPACK_DIR) = \
+                unpack_pkg_with_raw(self.pkg_filename)
+        elif UNPACK_DIR is None:
+            UNPACK_DIR = unpack_pkg(self.pkg_filename)
+        elif RAW_UNPACK_DIR is None:
+            RAW_UNPACK_DIR = raw_unpack_pkg(self.pkg_filename)
+
+    def unpack_dir(self):
+        '''Return the directory with the fully unpacked package, unpacking
+           it if needed'''
+        if UNPACK_DIR is None:
+            self._unpack()
+        return UNPACK_DIR
+
+    def raw_unpack_dir(self):
+        '''Return the directory with the raw members of the package,
+           unpacking them if needed'''
+        if RAW_UNPACK_DIR is None:
+            self._unpack()
+        return RAW_UNPACK_DIR
+
+    def _extract_member(self, rel):
+        '''Extract the single regular file rel and return its path'''
+        if self._extract_dir is None:
+            self._extract_dir = tempfile.mkdtemp(prefix='review-')
+        dest = os.path.join(self._extract_dir, rel)
+
+        if self.is_squashfs():
+            (rc, out) = cmd(['unsquashfs', '-n', '-f', '-d',
+                             self._extract_dir, self.pkg_filename, rel])
+            if rc != 0 or not os.path.isfile(dest):
+                error("could not extract '%s' from '%s':\n%s" %
+                      (rel, self.pkg_filename, out))
+            return dest
+
+        for (path, info, tar) in \
+                self._iter_deb_tar(rel.startswith('DEBIAN/')):
+            if path != rel:
+                continue
+            os.makedirs(os.path.dirname(dest), exist_ok=True)
+            with open(dest, 'wb') as f:
+                shutil.copyfileobj(tar.extractfile(info), f)
+            os.chmod(dest, info.mode & 0o777)
+            return dest
+        error("could not extract '%s' from '%s'" % (rel, self.pkg_filename))
+
+    def path(self, rel):
+        '''Return a filesystem path with the contents of rel'''
+        rel = self._normpath(rel)
+        # once fully unpacked, just use that
+        if UNPACK_DIR is not None:
+            return os.path.join(UNPACK_DIR, rel)
+        # hardlinks and symlinks need the rest of the tree
+        if rel not in self.entries() or self.entries()[rel].type != '-' or \
+                rel in self._hardlinks:
+            return os.path.join(self.unpack_dir(), rel)
+        if rel not in self._extracted:
+            self._extracted[rel] = self._extract_member(rel)
+        return self._extracted[rel]
+
+    def open(self, rel):
+        '''Open rel read-only'''
+        return open_file_read(self.path(rel))
+
+
+def get_pkgfs(fn):
+    '''Return the PackageFS shared by all the reviews of fn'''
+    global PKG_FS
+    if PKG_FS is None or PKG_FS.pkg_filename != os.path.abspath(fn):
+        if PKG_FS is not None:
+            PKG_FS.cleanup()
+        PKG_FS = PackageFS(fn)
+    return PKG_FS
+
+
+class PackageContext(object):
+    '''What all the reviews of a package have in common: its format and
+       the package metadata each of them parses. Pass the same context to
+       all the reviews of the package (see modules.init_main_class()) so
+       this is only done once. Everything is computed on first use.'''
+    def __init__(self, fn):
+        self.pkg_filename = fn
+        self._pkgfmt = None
+        self._memo = dict()
+
+    @property
+    def pkgfmt(self):
+        '''(type, version) of the package, as returned by
+           detect_package()'''
+        if self._pkgfmt is None:
+            self._pkgfmt = detect_package(self.pkg_filename)
+        return self._pkgfmt
+
+    def get(self, name, load):
+        '''Return what load() returns, calling it only the first time name
+           is asked for. Reviews may modify what they get, so each gets its
+           own copy.'''
+        if name not in self._memo:
+            self._memo[name] = load()
+        return copy.deepcopy(self._memo[name])
+
+
+# path: path relative to the top of the unpacked package
+# stat: os.lstat() result
+# type: ls type character ('d', '-', 'l', 'b', 'c', 'p' or 's')
+# target: symlink target for 'l' entries, otherwise None
+# size: st_size
+IndexEntry = collections.namedtuple('IndexEntry',
+                                    ['path', 'stat', 'type', 'target',
+                                     'size'])
+
+
+class PackageIndex(object):
+    '''Inventory of an unpacked package, built with a single os.scandir()
+       pass and shared by all the reviews of the package. Entries are kept
+       in the same order os.walk() would give them.'''
+    def __init__(self, top):
+        self.top = top
+        self._entries = collections.OrderedDict()
+        # names os.walk() would list as files (this excludes symlinks to
+        # directories)
+        self._files = []
+        self._by_basename = dict()
+        if top is not None:
+            self._scan('')
+
+    def _scan(self, rel):
+        try:
+            it = os.scandir(os.path.join(self.top, rel))
+        except OSError:
+            return
+
+        subdirs = []
+        with it:
+            for entry in it:
+                path = os.path.join(rel, entry.name)
+                try:
+                    st = entry.stat(follow_symlinks=False)
+                    is_dir = entry.is_dir()
+                except OSError:
+                    continue
+                target = None
+                if stat.S_ISLNK(st.st_mode):
+                    try:
+                        target = os.readlink(entry.path)
+                    except OSError:
+                        pass
+                self._entries[path] = IndexEntry(path, st,
+                                                 stat.filemode(st.st_mode)[0],
+                                                 target, st.st_size)
+                self._by_basename.setdefault(entry.name, []).append(path)
+                if not is_dir:
+                    self._files.append(path)
+                elif not stat.S_ISLNK(st.st_mode):
+                    subdirs.append(path)
+
+        for d in subdirs:
+            self._scan(d)
+
+    def path(self, rel):
+        '''Return the full path of rel'''
+        return os.path.join(self.top, rel)
+
+    def get(self, rel):
+        '''Return the IndexEntry for rel, or None'''
+        return self._entries.get(os.path.normpath(rel))
+
+    def entries(self):
+        '''Return all the IndexEntry, in os.walk() order'''
+        return list(self._entries.values())
+
+    def files(self):
+        '''Return the full paths of everything but directories (and
+           symlinks to them), like Review.pkg_files'''
+        return [self.path(f) for f in self._files]
+
+    def by_extension(self, ext):
+        '''Return the IndexEntry of non-directories ending in ext (eg,
+           '.desktop')'''
+        return [self._entries[f] for f in self._files if f.endswith(ext)]
+
+    def by_basename(self, name):
+        '''Return the IndexEntry of everything named name'''
+        return [self._entries[f] for f in self._by_basename.get(name, [])]
+
+    def symlinks(self, include_dirs=True):
+        '''Return the IndexEntry of all symlinks. Symlinks to directories
+           are skipped if include_dirs is False'''
+        paths = self._entries if include_dirs else self._files
+        return [self._entries[f] for f in paths
+                if self._entries[f].type == 'l']
+
+    def executables(self):
+        '''Return the IndexEntry of regular files with any execute bit'''
+        return [e for e in self._entries.values()
+                if e.type == '-' and e.stat.st_mode & 0o111]
+
+    def glob(self, pattern):
+        '''Return the full paths of the top-level entries matching the
+           shell pattern, like glob.glob("<top>/<pattern>")'''
+        found = []
+        for e in self._entries.values():
+            if os.path.dirname(e.path) != '':
+                continue
+            # like glob, '*' and '?' don't match a leading '.'
+            if e.path.startswith('.') and not pattern.startswith('.'):
+                continue
+            if fnmatch.fnmatchcase(e.path, pattern):
+                found.append(self.path(e.path))
+        return found
+
+
+def get_package_index(top):
+    '''Return the PackageIndex of top, shared by all the reviews'''
+    global PKG_INDEX
+    if PKG_INDEX is None or PKG_INDEX.top != top:
+        PKG_INDEX = PackageIndex(top)
+    return PKG_INDEX
+
+
 def create_tempdir():
     '''Create/reuse a temporary directory that is automatically cleaned up'''
     global TMP_DIR
@@ -528,6 +1373,82 @@ def open_file_read(path):
     return orig
 
 
+def set_jobs(jobs):
+    '''Use up to jobs workers for the parts of the review that run in
+       parallel. None (the default) uses one per CPU'''
+    global JOBS
+    if jobs is not None and jobs < 1:
+        error("jobs must be at least 1 (got %d)" % jobs)
+    JOBS = jobs
+
+
+def get_jobs():
+    '''Return how many workers to use'''
+    if JOBS is not None:
+        return JOBS
+    return os.cpu_count() or 1
+
+
+def _hash_file(fn, algorithm):
+    '''Return the hexdigest of fn (None if it can't be read) and how many
+       bytes were hashed'''
+    h = hashlib.new(algorithm)
+    size = 0
+    try:
+        with open(fn, 'rb') as f:
+            for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+                h.update(chunk)
+                size += len(chunk)
+    except (IOError, OSError):
+        return (None, size)
+    return (h.hexdigest(), size)
+
+
+def hash_file(fn, algorithm='sha512'):
+    '''Return the hexdigest of fn, read in chunks. None if fn can't be
+       read'''
+    return _hash_file(fn, algorithm)[0]
+
+
+def hash_files(fns, algorithm='sha512'):
+    '''Return a dict with the hash_file() of each of fns. Files are hashed
+       by a pool of get_jobs() threads (hashlib releases the GIL on large
+       updates). Totals are kept in HASH_STATS'''
+    fns = list(fns)
+    start = time.time()
+    if get_jobs() == 1 or len(fns) < 2:
+        results = [_hash_file(fn, algorithm) for fn in fns]
+    else:
+        with concurrent.futures.ThreadPoolExecutor(get_jobs()) as executor:
+            results = list(executor.map(lambda fn: _hash_file(fn, algorithm),
+                                        fns))
+    elapsed = time.time() - start
+
+    nbytes = sum([size for (digest, size) in results])
+    HASH_STATS['files'] += len(fns)
+    HASH_STATS['bytes'] += nbytes
+    HASH_STATS['seconds'] += elapsed
+    if len(fns) > 0:
+        debug("%s: hashed %d files (%d bytes) in %.3fs (%.1f MB/s)" %
+              (algorithm, len(fns), nbytes, elapsed,
+               nbytes / max(elapsed, 0.000001) / 1000000))
+    return dict(zip(fns, [digest for (digest, size) in results]))
+
+
+# libmagic handle shared by the reviews in this process
+_MAGIC = None
+
+
+def get_magic():
+    '''Return the libmagic mime handle of this process, loading its
+       database on first use'''
+    global _MAGIC
+    if _MAGIC is None:
+        _MAGIC = magic.open(magic.MAGIC_MIME)
+        _MAGIC.load()
+    return _MAGIC
+
+
 def recursive_rm(dirPath, contents_only=False):
     '''recursively remove directory'''
     try:
@@ -567,21 +1488,24 @@ def run_check(cls):
     sys.exit(rc)
 
 
+def _has_package_yaml(pkg, dir):
+    '''Check for meta/package.yaml in dir, or in the package index'''
+    if dir is None:
+        return get_pkgfs(pkg).exists("meta/package.yaml")
+    return os.path.exists(os.path.join(dir, "meta/package.yaml"))
+
+
 def detect_package(fn, dir=None):
-    '''Detect what type of package this is'''
+    '''Detect what type of package this is. If dir is not specified, the
+       package index is used instead of an unpacked directory.'''
     pkgtype = None
     pkgver = None
 
     if not os.path.isfile(fn):
         error("Could not find '%s'" % fn)
 
-    if dir is None:
-        unpack_dir = unpack_pkg(fn)
-    else:
-        unpack_dir = dir
-
-    if not os.path.isdir(unpack_dir):
-        error("Could not find '%s'" % unpack_dir)
+    if dir is not None and not os.path.isdir(dir):
+        error("Could not find '%s'" % dir)
 
     pkg = fn
     if not pkg.startswith('/'):
@@ -592,7 +1516,7 @@ def detect_package(fn, dir=None):
         # 16.04+ squashfs snaps
         pkgtype = "snap"
         pkgver = 2
-    elif os.path.exists(os.path.join(unpack_dir, "meta/package.yaml")):
+    elif _has_package_yaml(pkg, dir):
         # 15.04 ar-based snaps
         pkgtype = "snap"
         pkgver = 1
@@ -600,9 +1524,6 @@ def detect_package(fn, dir=None):
         pkgtype = "click"
         pkgver = 1
 
-    if dir is None and os.path.isdir(unpack_dir):
-        recursive_rm(unpack_dir)
-
     return (pkgtype, pkgver)
 
 
@@ -22,9 +22,13 @@ import os
 
 class ClickReviewBinPath(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         # bin-path is ignored by snappy install so don't bother with peerhooks
-        ClickReview.__init__(self, fn, "bin-path", overrides=overrides)
+        ClickReview.__init__(self, fn, "bin-path", overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         self.bin_paths_files = dict()
         self.bin_paths = dict()
@@ -30,6 +30,7 @@ from clickreviews.common import (
     error,
     open_file_read,
 )
+import clickreviews.yaml_loader as yaml_loader
 
 
 #
@@ -41,6 +42,8 @@ class ClickReviewException(ReviewException):
 
 class ClickReview(Review):
     '''This class represents click reviews'''
+    # The cr_* scripts only support clicks and 15.04 snaps (v1)
+    package_formats = [('click', 1), ('snap', 1)]
     # Convenience to break out common types of clicks (eg, app, scope,
     # click service)
     app_allowed_peer_hooks = ["account-application",
@@ -94,8 +97,11 @@ class ClickReview(Review):
                            "security-policy"]
 
     def __init__(self, fn, review_type, peer_hooks=None, overrides=None,
-                 peer_hooks_link=None):
-        Review.__init__(self, fn, review_type, overrides=overrides)
+                 peer_hooks_link=None, unpack_dir=None, raw_unpack_dir=None,
+                 context=None):
+        Review.__init__(self, fn, review_type, overrides=overrides,
+                        unpack_dir=unpack_dir, raw_unpack_dir=raw_unpack_dir,
+                        context=context)
 
         # The cr_* scripts only support 15.04 snaps (v1). Use sr_* scripts for
         # 16.04 (v2) or higher
@@ -119,15 +125,9 @@ class ClickReview(Review):
         self.peer_hooks_link = peer_hooks_link
 
         if self.is_snap1:
-            pkg_yaml = self._extract_package_yaml()
-            if pkg_yaml:
-                try:
-                    self.pkg_yaml = yaml.safe_load(pkg_yaml)
-                except Exception:
-                    error("Could not load package.yaml. Is it properly formatted?")
-                self._verify_package_yaml_structure()
-            else:
-                error("Could not load package.yaml.")
+            self.pkg_yaml = self.context.get('package_yaml',
+                                             self._load_package_yaml)
+            self._verify_package_yaml_structure()
 
             #  default to 'app'
             if 'type' not in self.pkg_yaml:
@@ -150,11 +150,7 @@ class ClickReview(Review):
 
         if self.is_click or self.is_snap1:
             # Get some basic information from the control file
-            control_file = self._extract_control_file()
-            tmp = list(Deb822.iter_paragraphs(control_file))
-            if len(tmp) != 1:
-                error("malformed control file: too many paragraphs")
-            control = tmp[0]
+            control = self.context.get('control', self._load_control_file)
             self.click_pkgname = control['Package']
             self.click_version = control['Version']
             if self.is_click:
@@ -163,14 +159,37 @@ class ClickReview(Review):
                 self.pkgfmt["version"] = str(control['Click-Version'])
 
             # Parse and store the manifest
-            manifest_json = self._extract_manifest_file()
-            try:
-                self.manifest = json.load(manifest_json)
-            except Exception:
-                error("Could not load manifest file. Is it properly formatted?")
+            self.manifest = self.context.get('manifest',
+                                             self._load_manifest_file)
             self._verify_manifest_structure()
 
-            self.valid_frameworks = self._extract_click_frameworks()
+            self.valid_frameworks = self.context.get(
+                'click_frameworks', self._extract_click_frameworks)
+
+    def _load_package_yaml(self):
+        '''Parse the snappy 15.04 package.yaml'''
+        pkg_yaml = self._extract_package_yaml()
+        if not pkg_yaml:
+            error("Could not load package.yaml.")
+        try:
+            return yaml_loader.safe_load(pkg_yaml)
+        except Exception:
+            error("Could not load package.yaml. Is it properly formatted?")
+
+    def _load_control_file(self):
+        '''Parse the control file'''
+        tmp = list(Deb822.iter_paragraphs(self._extract_control_file()))
+        if len(tmp) != 1:
+            error("malformed control file: too many paragraphs")
+        return tmp[0]
+
+    def _load_manifest_file(self):
+        '''Parse the manifest'''
+        manifest_json = self._extract_manifest_file()
+        try:
+            return json.load(manifest_json)
+        except Exception:
+            error("Could not load manifest file. Is it properly formatted?")
 
     def _extract_click_frameworks(self):
         '''Extract installed click frameworks'''
@@ -188,26 +207,25 @@ class ClickReview(Review):
 
     def _extract_manifest_file(self):
         '''Extract and read the manifest file'''
-        m = os.path.join(self.unpack_dir, "DEBIAN/manifest")
-        if not os.path.isfile(m):
+        m = "DEBIAN/manifest"
+        if not self.pkgfs.isfile(m):
             error("Could not find manifest file")
-        return open_file_read(m)
+        return self.pkgfs.open(m)
 
     def _extract_package_yaml(self):
         '''Extract and read the snappy 15.04 package.yaml'''
-        y = os.path.join(self.unpack_dir, "meta/package.yaml")
-        if not os.path.isfile(y):
+        y = "meta/package.yaml"
+        if not self.pkgfs.isfile(y):
             return None  # snappy packaging is still optional
-        return open_file_read(y)
+        return self.pkgfs.open(y)
 
     def _extract_hashes_yaml(self):
         '''Extract and read the snappy hashes.yaml'''
-        y = os.path.join(self.unpack_dir, "DEBIAN/hashes.yaml")
-        return open_file_read(y)
+        return self.pkgfs.open("DEBIAN/hashes.yaml")
 
     def _extract_control_file(self):
         '''Extract '''
-        fh = open_file_read(os.path.join(self.unpack_dir, "DEBIAN/control"))
+        fh = open_file_read(self.pkgfs.path("DEBIAN/control"))
         return fh.readlines()
 
     def _verify_manifest_structure(self):
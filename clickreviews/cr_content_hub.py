@@ -23,7 +23,8 @@ import os
 
 class ClickReviewContentHub(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         my_hook = 'content-hub'
         peer_hooks[my_hook] = dict()
@@ -31,7 +32,10 @@ class ClickReviewContentHub(ClickReview):
         peer_hooks[my_hook]['required'] = []
 
         ClickReview.__init__(self, fn, "content_hub", peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
@@ -28,7 +28,8 @@ from xdg.Exceptions import ParsingError as xdgParsingError
 
 class ClickReviewDesktop(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         my_hook = 'desktop'
         peer_hooks[my_hook] = dict()
@@ -36,7 +37,10 @@ class ClickReviewDesktop(ClickReview):
         peer_hooks[my_hook]['required'] = ["apparmor"]
 
         ClickReview.__init__(self, fn, "desktop", peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
@@ -24,8 +24,12 @@ import re
 
 class ClickReviewFramework(ClickReview):
     '''This class represents click framework reviews'''
-    def __init__(self, fn, overrides=None):
-        ClickReview.__init__(self, fn, "framework", overrides=overrides)
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
+        ClickReview.__init__(self, fn, "framework", overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         self.frameworks_file = dict()
         self.frameworks = dict()
@@ -27,8 +27,12 @@ from clickreviews.cr_common import ClickReview, open_file_read
 
 class ClickReviewFunctional(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
-        ClickReview.__init__(self, fn, "functional", overrides=overrides)
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
+        ClickReview.__init__(self, fn, "functional", overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
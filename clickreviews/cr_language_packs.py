@@ -23,7 +23,8 @@ import os
 
 class ClickReviewLanguagePacks(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         my_hook = 'language-packs'
         peer_hooks[my_hook] = dict()
@@ -34,7 +35,10 @@ class ClickReviewLanguagePacks(ClickReview):
                              fn,
                              "language_packs",
                              peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
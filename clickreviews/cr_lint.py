@@ -17,10 +17,10 @@
 from __future__ import print_function
 from debian.deb822 import Deb822
 import glob
+import mmap
 import os
 import re
 import stat
-import yaml
 
 from clickreviews.frameworks import Frameworks
 from clickreviews.cr_common import (
@@ -28,12 +28,13 @@ from clickreviews.cr_common import (
 )
 from clickreviews.common import (
     open_file_read,
-    cmd,
     error,
+    hash_files,
 )
 from clickreviews.common import (
     find_external_symlinks,
 )
+import clickreviews.yaml_loader as yaml_loader
 
 CONTROL_FILE_NAMES = ["control", "manifest", "preinst"]
 MINIMUM_CLICK_FRAMEWORK_VERSION = "0.4"
@@ -42,16 +43,23 @@ MINIMUM_CLICK_FRAMEWORK_VERSION = "0.4"
 class ClickReviewLint(ClickReview):
     '''This class represents click lint reviews'''
 
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         '''Set up the class.'''
-        ClickReview.__init__(self, fn, "lint", overrides=overrides)
+        ClickReview.__init__(self, fn, "lint", overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
         if not self.is_click and not self.is_snap1:
             return
 
-        if self.is_click and "md5sums" not in CONTROL_FILE_NAMES:
-            CONTROL_FILE_NAMES.append("md5sums")
+        # not CONTROL_FILE_NAMES itself, which is shared with the reviews
+        # of other packages
+        self.control_file_names = list(CONTROL_FILE_NAMES)
+        if self.is_click:
+            self.control_file_names.append("md5sums")
         elif self.is_snap1:
-            CONTROL_FILE_NAMES.append("hashes.yaml")
+            self.control_file_names.append("hashes.yaml")
         self.control_files = dict()
         self._list_control_files()
         # Valid values for Architecture in DEBIAN/control. Note:
@@ -155,7 +163,7 @@ class ClickReviewLint(ClickReview):
 
     def _list_control_files(self):
         '''List all control files with their full path.'''
-        for i in CONTROL_FILE_NAMES:
+        for i in self.control_file_names:
             self.control_files[i] = os.path.join(self.unpack_dir,
                                                  "DEBIAN/%s" % i)
 
@@ -361,18 +369,21 @@ class ClickReviewLint(ClickReview):
                     self._add_result(t, n, s)
                     return
 
-        curdir = os.getcwd()
         fh = open_file_read(self.control_files["md5sums"])
-        badsums = []
-        os.chdir(self.unpack_dir)
+        expected = []
         for line in fh.readlines():
             split_line = line.strip().split()
             fn = " ".join(split_line[1:])
-            (rc, out) = cmd(['md5sum', fn])
-            if line != out:
-                badsums.append(fn)
+            expected.append((fn, split_line[0] if split_line else None))
         fh.close()
-        os.chdir(curdir)
+
+        sums = hash_files(set([os.path.join(self.unpack_dir, fn)
+                               for (fn, md5) in expected]), 'md5')
+        badsums = []
+        for (fn, md5) in expected:
+            digest = sums[os.path.join(self.unpack_dir, fn)]
+            if digest is None or digest != md5:
+                badsums.append(fn)
 
         s = 'OK'
         if len(badsums) > 0:
@@ -578,8 +589,11 @@ exit 1
                     self._add_result(t, n, s)
                     return
 
-        links = find_external_symlinks(self.unpack_dir, self.pkg_files,
-                                       self.click_pkgname)
+        links = find_external_symlinks(
+            self.unpack_dir,
+            [self.pkg_index.path(e.path)
+             for e in self.pkg_index.symlinks(include_dirs=False)],
+            self.click_pkgname)
         if len(links) > 0:
             t = 'error'
             s = 'package contains external symlinks: %s' % ', '.join(links)
@@ -657,6 +671,7 @@ exit 1
         if not self.is_click and not self.is_snap1:
             return
 
+        bin_arches = self._get_pkg_bin_arches()
         for arch in self.pkg_arch:
             t = 'info'
             n = self._get_check_name('architecture_specified_needed')
@@ -670,6 +685,10 @@ exit 1
                 t = 'warn'
                 s = "Could not find compiled binaries for architecture '%s'" % \
                     arch
+            elif len(bin_arches) > 0 and arch not in bin_arches:
+                t = 'warn'
+                s = "Could not find compiled binaries for architecture " + \
+                    "'%s' (found: %s)" % (arch, ", ".join(sorted(bin_arches)))
             self._add_result(t, n, s)
 
     def check_maintainer(self):
@@ -851,7 +870,7 @@ exit 1
         s = 'OK'
         found = []
         for d in self.vcs_files:
-            entries = glob.glob("%s/%s" % (self.unpack_dir, d))
+            entries = self.pkg_index.glob(d)
             if len(entries) > 0:
                 for i in entries:
                     found.append(os.path.relpath(i, self.unpack_dir))
@@ -869,7 +888,7 @@ exit 1
         n = self._get_check_name('click_files')
         s = 'OK'
         found = []
-        entries = glob.glob("%s/*.click" % self.unpack_dir)
+        entries = self.pkg_index.glob("*.click")
         if len(entries) > 0:
             for i in entries:
                 found.append(os.path.relpath(i, self.unpack_dir))
@@ -893,6 +912,29 @@ exit 1
             s = 'found .click in toplevel dir'
         self._add_result(t, n, s)
 
+    def _find_in_file(self, fn, pattern):
+        '''Return the set of matches of the compiled bytes regex pattern in
+           fn'''
+        try:
+            with open(fn, 'rb') as f:
+                with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+                    return set([m.group(0) for m in pattern.finditer(mm)])
+        except (IOError, OSError, ValueError):
+            # ValueError: empty files can't be mmapped
+            return set()
+
+    def _is_text_file(self, fn):
+        '''Return True if libmagic says fn is text and it is valid UTF-8'''
+        mime = self.mime.file(fn)
+        if mime is None or 'charset=binary' in mime:
+            return False
+        try:
+            with open_file_read(fn) as f:
+                f.read()
+        except (IOError, OSError, UnicodeDecodeError):
+            return False
+        return True
+
     def check_contents_for_hardcoded_paths(self):
         '''Check for known hardcoded paths.'''
         if not self.is_click and not self.is_snap1:
@@ -902,23 +944,22 @@ exit 1
         t = 'info'
         n = self._get_check_name('hardcoded_paths')
         s = 'OK'
-        for dirpath, dirnames, filenames in os.walk(self.unpack_dir):
-            for filename in filenames:
-                full_fn = os.path.join(dirpath, filename)
-                (rc, out) = cmd(['file', '-b', full_fn])
-                if 'text' not in out:
-                    continue
-                try:
-                    lines = open_file_read(full_fn).readlines()
-                    for bad_path in PATH_BLACKLIST:
-                        if list(filter(lambda line: bad_path in line, lines)):
-                            t = 'error'
-                            s = "Hardcoded path '%s' found in '%s'." % (
-                                bad_path, full_fn)
-                except FileNotFoundError:
-                    pass
-                except UnicodeDecodeError:
-                    pass
+        # Search all the blacklisted paths at once, at the byte level. Only
+        # the few files with a match need classifying as text.
+        pattern = re.compile(b'|'.join([re.escape(p.encode('UTF-8'))
+                                        for p in PATH_BLACKLIST]))
+        for entry in self.pkg_index.entries():
+            if entry.type != '-':
+                continue
+            full_fn = self.pkg_index.path(entry.path)
+            found = self._find_in_file(full_fn, pattern)
+            if not found or not self._is_text_file(full_fn):
+                continue
+            for bad_path in PATH_BLACKLIST:
+                if bad_path.encode('UTF-8') in found:
+                    t = 'error'
+                    s = "Hardcoded path '%s' found in '%s'." % (
+                        bad_path, full_fn)
         self._add_result(t, n, s)
 
     def _verify_architecture(self, my_dict, test_str):
@@ -1213,8 +1254,25 @@ exit 1
                     return False
             return True
 
+        def _iter_files(files):
+            '''Yield the entries of files, which may only be loaded (and
+               found malformed) while iterating'''
+            it = iter(files)
+            while True:
+                try:
+                    entry = next(it)
+                except StopIteration:
+                    return
+                except Exception:
+                    error("Could not load hashes.yaml. Is it properly "
+                          "formatted?")
+                yield entry
+
+        # hashes.yaml lists every file of the package: check them as they
+        # are read instead of loading the whole list first
         try:
-            hashes_yaml = yaml.safe_load(self._extract_hashes_yaml())
+            hashes_yaml = yaml_loader.safe_load_streaming(
+                self._extract_hashes_yaml, 'files')
         except Exception:
             error("Could not load hashes.yaml. Is it properly formatted?")
 
@@ -1229,8 +1287,7 @@ exit 1
         t = 'info'
         n = self._get_check_name('hashes_archive-sha512_valid')
         s = 'OK'
-        fn = self._path_join(self.raw_unpack_dir, 'data.tar.gz')
-        sum = self._get_sha512sum(fn)
+        sum = self._get_archive_digest('data.tar.gz')
         if hashes_yaml['archive-sha512'] != sum:
             t = 'error'
             s = "hash mismatch: '%s' != '%s'" % (hashes_yaml['archive-sha512'],
@@ -1249,8 +1306,9 @@ exit 1
         # verify the individual files
         errors = []
         badsums = []
+        to_hash = []
         hash_files = set([])  # used to check with extra files
-        for entry in hashes_yaml['files']:
+        for entry in _iter_files(hashes_yaml['files']):
             if 'name' not in entry:
                 errors.append("'name' not found for entry '%s'" % entry)
                 continue
@@ -1324,12 +1382,15 @@ exit 1
                               (entry['mode'][1:], filemode, entry['name']))
                 continue
 
-            # ok, now all the cheap tests are done so we can check if we have a
-            # valid sha512sum
-            sum = self._get_sha512sum(fn)
-            if entry['sha512'] != sum:
-                badsums.append("'%s' != '%s' for '%s'" % (entry['sha512'], sum,
-                                                          entry['name']))
+            # ok, now all the cheap tests are done so queue the file to check
+            # if we have a valid sha512sum
+            to_hash.append((entry['name'], entry['sha512'], fn))
+
+        sums = self._get_sha512sums([fn for (name, sha512, fn) in to_hash])
+        for (name, sha512, fn) in to_hash:
+            sum = sums[fn]
+            if sha512 != sum:
+                badsums.append("'%s' != '%s' for '%s'" % (sha512, sum, name))
 
         t = 'info'
         n = self._get_check_name('sha512sums')
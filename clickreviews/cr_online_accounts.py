@@ -26,7 +26,8 @@ import lxml.etree as etree
 
 class ClickReviewAccounts(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         peer_hooks['account-application'] = dict()
         peer_hooks['account-application']['allowed'] = \
@@ -68,6 +69,9 @@ class ClickReviewAccounts(ClickReview):
                              "online_accounts",
                              peer_hooks=peer_hooks,
                              overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context,
                              peer_hooks_link="https://wiki.ubuntu.com/SecurityTeam/Specifications/OnlineAccountsConfinement")
         if not self.is_click and not self.is_snap1:
             return
@@ -23,7 +23,8 @@ import os
 
 class ClickReviewPushHelper(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         my_hook = 'push-helper'
         peer_hooks[my_hook] = dict()
@@ -31,7 +32,10 @@ class ClickReviewPushHelper(ClickReview):
         peer_hooks[my_hook]['required'] = ['apparmor']
 
         ClickReview.__init__(self, fn, "push_helper", peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         if not self.is_click and not self.is_snap1:
             return
@@ -30,7 +30,8 @@ KNOWN_SECTIONS = set(["ScopeConfig", "Appearance"])
 
 class ClickReviewScope(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         my_hook = 'scope'
         peer_hooks[my_hook] = dict()
@@ -38,7 +39,10 @@ class ClickReviewScope(ClickReview):
         peer_hooks[my_hook]['required'] = ['apparmor']
 
         ClickReview.__init__(self, fn, "scope", peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         if not self.is_click and not self.is_snap1:
             return
@@ -30,7 +30,8 @@ import os
 
 class ClickReviewSecurity(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         my_hook = 'apparmor'
         peer_hooks[my_hook] = dict()
@@ -49,7 +50,10 @@ class ClickReviewSecurity(ClickReview):
         peer_hooks[my_hook2]['required'] = []
 
         ClickReview.__init__(self, fn, "security", peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         if not self.is_click and not self.is_snap1:
             return
@@ -21,7 +21,8 @@ from clickreviews.cr_common import ClickReview
 
 class ClickReviewSkeleton(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         # Many test classes are for verify click hooks. 'peer_hooks' is used
         # to declare what hooks may be use with my_hook. When using this
         # mechanism, ClickReview.check_peer_hooks() is run for you.
@@ -32,7 +33,10 @@ class ClickReviewSkeleton(ClickReview):
         peer_hooks[my_hook]['required'] = ["desktop", "apparmor"]
 
         ClickReview.__init__(self, fn, "skeleton", peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         if not self.is_click and not self.is_snap1:
             return
@@ -23,9 +23,13 @@ import re
 
 class ClickReviewSystemd(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         # systemd isn't implemented as a hook any more so don't setup peerhooks
-        ClickReview.__init__(self, fn, "snappy-systemd", overrides=overrides)
+        ClickReview.__init__(self, fn, "snappy-systemd", overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         self.systemd_files = dict()  # click-show-files and tests
         self.systemd = dict()
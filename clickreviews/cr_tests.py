@@ -95,6 +95,16 @@ def _get_sha512sum(self, fn):
     return out.split()[0]
 
 
+def _get_sha512sums(self, fns):
+    '''Pretend we found performed a sha512 on each file'''
+    return dict([(fn, _get_sha512sum(self, fn)) for fn in fns])
+
+
+def _get_archive_digest(self, member=None, algorithm='sha512'):
+    '''Pretend we hashed the package while reading it'''
+    return _get_sha512sum(self, None)
+
+
 def _extract_statinfo(self, fn):
     '''Pretend we found performed an os.stat()'''
     return os.stat(os.path.realpath(__file__))
@@ -256,7 +266,12 @@ def _pkgfmt_version(self):
     return TEST_PKGFMT_VERSION
 
 
-def _detect_package(self, fn):
+def _unpack_pkg_with_raw(fn):
+    '''Pretend we unpacked the package'''
+    return (None, None)
+
+
+def _detect_package(fn, dir=None):
     '''Pretend we detected the package'''
     ver = 1
     if TEST_PKGFMT_TYPE == "snap" and TEST_PKGFMT_VERSION != "15.04":
@@ -286,6 +301,11 @@ def create_patches():
     patches.append(patch('clickreviews.common.Review._path_join', _path_join))
     patches.append(patch(
         'clickreviews.common.Review._get_sha512sum', _get_sha512sum))
+    patches.append(patch(
+        'clickreviews.common.Review._get_sha512sums', _get_sha512sums))
+    patches.append(patch(
+        'clickreviews.common.Review._get_archive_digest',
+        _get_archive_digest))
     patches.append(patch(
         'clickreviews.common.Review._extract_statinfo', _extract_statinfo))
     patches.append(patch(
@@ -293,6 +313,8 @@ def create_patches():
         _extract_click_frameworks))
     patches.append(patch('clickreviews.common.unpack_pkg', _mock_func))
     patches.append(patch('clickreviews.common.raw_unpack_pkg', _mock_func))
+    patches.append(patch('clickreviews.common.unpack_pkg_with_raw',
+                         _unpack_pkg_with_raw))
     patches.append(patch('clickreviews.common.detect_package',
                    _detect_package))
     patches.append(patch('clickreviews.common.Review._list_all_files',
@@ -25,7 +25,8 @@ import os
 
 class ClickReviewUrlDispatcher(ClickReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         peer_hooks = dict()
         my_hook = 'urls'
         peer_hooks[my_hook] = dict()
@@ -33,7 +34,10 @@ class ClickReviewUrlDispatcher(ClickReview):
         peer_hooks[my_hook]['required'] = []
 
         ClickReview.__init__(self, fn, "url_dispatcher", peer_hooks=peer_hooks,
-                             overrides=overrides)
+                             overrides=overrides,
+                             unpack_dir=unpack_dir,
+                             raw_unpack_dir=raw_unpack_dir,
+                             context=context)
 
         if not self.is_click and not self.is_snap1:
             return
@@ -0,0 +1,100 @@
+'''elf.py: classify ELF objects from their file header'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+from collections import namedtuple
+
+ELF_MAGIC = b'\x7fELF'
+# Size of the ELF64 file header. The ELF32 header is shorter, so this
+# covers both.
+ELF_HEADER_SIZE = 64
+
+ELFCLASS32 = 1
+ELFCLASS64 = 2
+ELFDATA2LSB = 1
+ELFDATA2MSB = 2
+
+ET_REL = 1
+ET_EXEC = 2
+ET_DYN = 3
+
+# The object types libmagic reports as application/x-object,
+# application/x-executable and application/x-sharedlib
+BINARY_TYPES = [ET_REL, ET_EXEC, ET_DYN]
+
+# e_machine -> {(class, data): architecture}. Architectures use the
+# Debian names that click manifests and snap.yaml use.
+EM_386 = 3
+EM_MIPS = 8
+EM_PPC = 20
+EM_PPC64 = 21
+EM_S390 = 22
+EM_ARM = 40
+EM_X86_64 = 62
+EM_AARCH64 = 183
+
+ARCHITECTURES = {
+    EM_386: {(ELFCLASS32, ELFDATA2LSB): 'i386'},
+    EM_MIPS: {(ELFCLASS32, ELFDATA2MSB): 'mips',
+              (ELFCLASS32, ELFDATA2LSB): 'mipsel',
+              (ELFCLASS64, ELFDATA2LSB): 'mips64el'},
+    EM_PPC: {(ELFCLASS32, ELFDATA2MSB): 'powerpc'},
+    EM_PPC64: {(ELFCLASS64, ELFDATA2MSB): 'ppc64',
+               (ELFCLASS64, ELFDATA2LSB): 'ppc64el'},
+    EM_S390: {(ELFCLASS64, ELFDATA2MSB): 's390x'},
+    EM_ARM: {(ELFCLASS32, ELFDATA2LSB): 'armhf'},
+    EM_X86_64: {(ELFCLASS64, ELFDATA2LSB): 'amd64'},
+    EM_AARCH64: {(ELFCLASS64, ELFDATA2LSB): 'arm64'},
+}
+
+ElfHeader = namedtuple('ElfHeader', ['elfclass', 'data', 'type', 'machine'])
+
+
+def parse_header(data):
+    '''Return the ElfHeader for the start of a file, or None if data is not
+       the start of an ELF object'''
+    if len(data) < 20 or not data.startswith(ELF_MAGIC):
+        return None
+    elfclass = data[4]
+    endian = data[5]
+    if elfclass not in [ELFCLASS32, ELFCLASS64] or \
+            endian not in [ELFDATA2LSB, ELFDATA2MSB]:
+        return None
+    byteorder = 'little' if endian == ELFDATA2LSB else 'big'
+    return ElfHeader(elfclass, endian,
+                     int.from_bytes(data[16:18], byteorder),
+                     int.from_bytes(data[18:20], byteorder))
+
+
+def read_header(fn):
+    '''Return the ElfHeader of fn, or None if fn is not an ELF object'''
+    try:
+        with open(fn, 'rb') as f:
+            return parse_header(f.read(ELF_HEADER_SIZE))
+    except OSError:
+        return None
+
+
+def get_architecture(header):
+    '''Return the Debian architecture for header, or None if unknown'''
+    return ARCHITECTURES.get(header.machine, {}).get(
+        (header.elfclass, header.data))
+
+
+def is_binary(header):
+    '''Return True if header is for an executable, shared library or
+       object'''
+    return header is not None and header.type in BINARY_TYPES
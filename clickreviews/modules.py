@@ -1,8 +1,11 @@
 import clickreviews
-import imp
+from clickreviews import common
+import collections
+import importlib
 import inspect
 import os
 import pkgutil
+import traceback
 
 IRRELEVANT_MODULES = ['cr_common', 'cr_tests', 'cr_skeleton',
                       'sr_common', 'sr_tests', 'sr_skeleton',
@@ -41,21 +44,41 @@ def get_modules():
     return narrow_down_modules(all_modules)
 
 
+def section_name(module_name):
+    '''
+    Return the name of the section of the review report with the
+    results of the given module.
+    '''
+    section = module_name.replace('cr_', 'click,snap.v1_')
+    return section.replace('sr_', 'snap.v2_')
+
+
+# module name -> Click*Review class (or None). Each module is imported
+# once, like any other import, so reviewing many packages in one process
+# doesn't execute the modules again.
+_MAIN_CLASSES = dict()
+
+
 def find_main_class(module_name):
     '''
     This function will find the Click*Review class in
     the specified module.
     '''
-    module = imp.load_source(module_name,
-                             '%s/%s.py' % (clickreviews.__path__[0],
-                                           module_name))
+    if module_name not in _MAIN_CLASSES:
+        _MAIN_CLASSES[module_name] = _load_main_class(module_name)
+    return _MAIN_CLASSES[module_name]
+
+
+def _load_main_class(module_name):
+    module = importlib.import_module('%s.%s' % (clickreviews.__name__,
+                                                module_name))
 
     classes = inspect.getmembers(module, inspect.isclass)
 
     def find_test_class(a):
         return (a[0].startswith('Click') or a[0].startswith('Snap')) and \
             not a[0].endswith('Exception') and \
-            a[1].__module__ == module_name
+            a[1].__module__ == module.__name__
     test_class = list(filter(find_test_class, classes))
     if not test_class:
         return None
@@ -63,19 +86,111 @@ def find_main_class(module_name):
     return init_object
 
 
-def init_main_class(module_name, click_file, overrides=None):
+def get_review_classes():
+    '''
+    Return the Click*Review class of each module with one, by module
+    name and in the order of get_modules(). All the modules are imported,
+    so this is what to call before forking workers.
+    '''
+    review_classes = collections.OrderedDict()
+    for module_name in get_modules():
+        init_object = find_main_class(module_name)
+        if init_object:
+            review_classes[module_name] = init_object
+    return review_classes
+
+
+def skips_package(module_name, pkgfmt):
+    '''
+    Return True if the module has a review class but its checks don't
+    apply to packages of pkgfmt, the (type, version) returned by
+    common.detect_package(). There is no need to instantiate the class:
+    its report would be empty_report().
+    '''
+    init_object = find_main_class(module_name)
+    return init_object is not None and \
+        init_object.package_formats is not None and \
+        pkgfmt not in init_object.package_formats
+
+
+def empty_report():
+    '''Return the report of a review without any results'''
+    return {'info': {}, 'warn': {}, 'error': {}}
+
+
+def init_main_class(module_name, click_file, overrides=None,
+                    unpack_dir=None, raw_unpack_dir=None, context=None):
     '''
     This function will instantiate the main Click*Review
     class of a given module and instantiate it with the
-    location of the .click file we want to inspect.
+    location of the .click file we want to inspect (and,
+    optionally, where it is already unpacked and the
+    common.PackageContext shared with the other modules).
     '''
 
     init_object = find_main_class(module_name)
     if not init_object:
         return None
     try:
-        ob = init_object(click_file, overrides)
+        ob = init_object(click_file, overrides, unpack_dir=unpack_dir,
+                         raw_unpack_dir=raw_unpack_dir, context=context)
     except TypeError as e:
         print('Could not init %s: %s' % (init_object, str(e)))
         raise
     return ob
+
+
+def run_checks_in_worker(module_name, click_file, overrides, unpack_dir,
+                         raw_unpack_dir):
+    '''
+    This function runs the checks of a given module in a worker process.
+    The package was already unpacked to unpack_dir and raw_unpack_dir by
+    the parent process, which owns (and later removes) them.
+
+    It returns the click_report of the review (None if the module has no
+    review class) and the formatted traceback of an exception, if any.
+    '''
+
+    common.share_unpacked_dirs(unpack_dir, raw_unpack_dir)
+    try:
+        review = init_main_class(module_name, click_file,
+                                 overrides=overrides)
+        if not review:
+            return (None, None)
+        review.do_checks()
+        return (review.click_report, None)
+    except Exception:
+        return (None, traceback.format_exc())
+    finally:
+        common.cleanup_unpack()
+
+
+def review_package(click_file, overrides=None):
+    '''
+    This function runs the checks of all modules on the given package,
+    one module after another, like click-review does.
+
+    It returns the reports by section (what click-review --json prints)
+    and the formatted tracebacks of the modules that raised an exception.
+    '''
+
+    results = dict()
+    tracebacks = []
+    try:
+        context = common.PackageContext(click_file)
+        for module_name in get_modules():
+            if skips_package(module_name, context.pkgfmt):
+                results[section_name(module_name)] = empty_report()
+                continue
+            try:
+                review = init_main_class(module_name, click_file,
+                                         overrides=overrides,
+                                         context=context)
+                if review:
+                    review.do_checks()
+                    results[section_name(module_name)] = review.click_report
+            except Exception:
+                tracebacks.append(traceback.format_exc())
+    finally:
+        common.cleanup_unpack()
+    return (results, tracebacks)
@@ -13,18 +13,35 @@
 #  You should have received a copy of the GNU General Public License
 #  along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
+import copy
+import glob
+import hashlib
 import json
+import marshal
 import os
 import re
 from socket import timeout
+import stat
 import sys
+import tempfile
 import time
 from urllib import request, parse
 from urllib.error import HTTPError, URLError
-import yaml
+
+import clickreviews.yaml_loader as yaml_loader
 
 DATA_DIR = os.path.join(os.path.expanduser('~/.cache/click-reviewers-tools/'))
 UPDATE_INTERVAL = 60 * 60 * 24 * 7
+# The files read by read_cr_file() are parsed once and kept here,
+# marshalled, for all the processes using them. marshal only rebuilds plain
+# data, so nothing found here can run code.
+COMPILED_DIR = os.path.join(DATA_DIR, 'compiled')
+# Change this when the marshalled data is no longer compatible
+COMPILED_VERSION = 2
+# (path, as_yaml) -> ((mtime, size), marshalled contents, or the parsed
+# contents if they can't be marshalled) of the files read by read_cr_file()
+# in this process
+_PARSED = dict()
 
 
 def _update_is_necessary(fn):
@@ -88,6 +105,107 @@ def get_remote_file(fn, url, data_dir=DATA_DIR):
         local_file.write(data)
 
 
+def _owned_by_us(st):
+    '''Return True if st is of something only we can write to'''
+    return st.st_uid == os.getuid() and \
+        not st.st_mode & (stat.S_IWGRP | stat.S_IWOTH)
+
+
+def _compiled_dir_is_usable():
+    '''Return True if COMPILED_DIR can be trusted, creating it if needed'''
+    if not os.path.exists(COMPILED_DIR):
+        os.makedirs(COMPILED_DIR, mode=0o700)
+    st = os.lstat(COMPILED_DIR)
+    return stat.S_ISDIR(st.st_mode) and _owned_by_us(st)
+
+
+def _read_compiled(compiled_fn):
+    '''Return the marshalled data in compiled_fn, None if it isn't there or
+       can't be trusted'''
+    try:
+        if not _compiled_dir_is_usable():
+            return None
+        with open(compiled_fn, 'rb') as f:
+            if not _owned_by_us(os.fstat(f.fileno())):
+                return None
+            compiled = f.read()
+        marshal.loads(compiled)
+        return compiled
+    except Exception:
+        return None  # not compiled yet, or unusable
+
+
+def _write_compiled(compiled_fn, prefix, compiled):
+    '''Keep compiled in compiled_fn for the other processes'''
+    tmp_fn = None
+    # the cache is optional: if it can't be written, fn is parsed each time
+    try:
+        if not _compiled_dir_is_usable():
+            return
+        # what was compiled for older versions of fn is not needed anymore
+        for old in glob.glob(os.path.join(COMPILED_DIR, prefix + '-*')):
+            os.unlink(old)
+        with tempfile.NamedTemporaryFile(dir=COMPILED_DIR,
+                                         delete=False) as f:
+            tmp_fn = f.name
+            f.write(compiled)
+        os.rename(tmp_fn, compiled_fn)
+        tmp_fn = None
+    except OSError:
+        pass
+    finally:
+        if tmp_fn is not None and os.path.exists(tmp_fn):
+            os.unlink(tmp_fn)
+
+
+def _compile_file(fn, as_yaml):
+    '''Return the marshalled, parsed contents of fn. They are kept in
+       COMPILED_DIR, named after fn and the hash of its contents, so fn is
+       only parsed again once it changes. Contents marshal can't store (eg,
+       YAML timestamps) are returned as parsed and not kept'''
+    with open(fn, 'rb') as f:
+        data = f.read()
+    h = hashlib.sha256(b'%d:%d:' % (COMPILED_VERSION, as_yaml))
+    h.update(data)
+    prefix = hashlib.sha256(os.path.abspath(fn).encode('UTF-8')).hexdigest()
+    compiled_fn = os.path.join(COMPILED_DIR,
+                               '%s-%s.marshal' % (prefix, h.hexdigest()))
+
+    compiled = _read_compiled(compiled_fn)
+    if compiled is not None:
+        return compiled
+
+    try:
+        if as_yaml:
+            d = yaml_loader.safe_load(data)
+        else:
+            d = json.loads(data.decode('UTF-8'))
+    except ValueError:
+        raise ValueError("Could not parse '%s'" % fn)
+    try:
+        compiled = marshal.dumps(d)
+    except ValueError:
+        return d
+
+    _write_compiled(compiled_fn, prefix, compiled)
+    return compiled
+
+
+def _parse_file(fn, as_yaml):
+    '''Return the parsed contents of fn. What was parsed is kept for as
+       long as fn is unchanged, and callers get their own copy of it'''
+    st = os.stat(fn)
+    key = (os.path.abspath(fn), as_yaml)
+    if key not in _PARSED or _PARSED[key][0] != (st.st_mtime_ns, st.st_size):
+        _PARSED[key] = ((st.st_mtime_ns, st.st_size),
+                        _compile_file(fn, as_yaml))
+    compiled = _PARSED[key][1]
+    if isinstance(compiled, bytes):
+        # much faster than copy.deepcopy()
+        return marshal.loads(compiled)
+    return copy.deepcopy(compiled)
+
+
 def read_cr_file(fn, url, local_copy_fn=None, as_yaml=False):
     '''read click reviews file from remote or local copy:
        - fn: where to store the cached file
@@ -96,22 +214,10 @@ def read_cr_file(fn, url, local_copy_fn=None, as_yaml=False):
     '''
     d = {}
     if local_copy_fn and os.path.exists(local_copy_fn):
-        try:
-            if as_yaml:
-                d = yaml.safe_load(open(local_copy_fn, 'r').read())
-            else:
-                d = json.loads(open(local_copy_fn, 'r').read())
-        except ValueError:
-            raise ValueError("Could not parse '%s'" % local_copy_fn)
+        d = _parse_file(local_copy_fn, as_yaml)
     else:
         if _update_is_necessary(fn) and _update_is_possible(url):
             get_remote_file(fn, url)
         if os.path.exists(fn):
-            try:
-                if as_yaml:
-                    d = yaml.safe_load(open(fn, 'r').read())
-                else:
-                    d = json.loads(open(fn, 'r').read())
-            except ValueError:
-                raise ValueError("Could not parse '%s'" % fn)
+            d = _parse_file(fn, as_yaml)
     return d
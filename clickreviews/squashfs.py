@@ -0,0 +1,313 @@
+'''squashfs.py: read file metadata from squashfs images'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import collections
+import lzma
+import stat
+import struct
+import zlib
+
+# This only implements what is needed to enumerate the entries of a squashfs
+# 4.0 image (superblock, id, inode and directory tables). File contents are
+# never read. See squashfs_fs.h from squashfs-tools for the on-disk format.
+SQUASHFS_MAGIC = 0x73717368
+SQUASHFS_MAJOR = 4
+SQUASHFS_METADATA_SIZE = 8192
+SQUASHFS_COMPRESSED_BIT = 1 << 15
+SQUASHFS_INVALID_FRAG = 0xffffffff
+
+SUPERBLOCK_FMT = '<IIIIIHHHHHHQQQQQQQQ'
+SUPERBLOCK_SIZE = struct.calcsize(SUPERBLOCK_FMT)
+
+COMPRESSION_GZIP = 1
+COMPRESSION_LZMA = 2
+COMPRESSION_LZO = 3
+COMPRESSION_XZ = 4
+COMPRESSION_LZ4 = 5
+COMPRESSION_ZSTD = 6
+
+# inode type: (ls type character, stat file type bits)
+INODE_TYPES = {
+    1: ('d', stat.S_IFDIR),
+    2: ('-', stat.S_IFREG),
+    3: ('l', stat.S_IFLNK),
+    4: ('b', stat.S_IFBLK),
+    5: ('c', stat.S_IFCHR),
+    6: ('p', stat.S_IFIFO),
+    7: ('s', stat.S_IFSOCK),
+    8: ('d', stat.S_IFDIR),
+    9: ('-', stat.S_IFREG),
+    10: ('l', stat.S_IFLNK),
+    11: ('b', stat.S_IFBLK),
+    12: ('c', stat.S_IFCHR),
+    13: ('p', stat.S_IFIFO),
+    14: ('s', stat.S_IFSOCK),
+}
+
+# path: './'-prefixed path of the entry ('.' is the root directory)
+# type: ls type character ('d', '-', 'l', 'b', 'c', 'p' or 's')
+# mode: full st_mode (file type and permission bits)
+# size: file size, symlink target length or directory listing size
+# major/minor: device numbers for 'b' and 'c' entries, otherwise None
+# target: symlink target for 'l' entries, otherwise None
+SquashfsEntry = collections.namedtuple('SquashfsEntry',
+                                       ['path', 'type', 'mode', 'uid',
+                                        'gid', 'size', 'mtime', 'major',
+                                        'minor', 'target'])
+
+
+class SquashfsException(Exception):
+    '''This class represents squashfs exceptions'''
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        return repr(self.value)
+
+
+class _MetadataCursor(object):
+    '''Sequential reader over a chain of metadata blocks'''
+    def __init__(self, image, pos, offset):
+        self.image = image
+        self.pos = pos
+        self.offset = offset
+
+    def read(self, length):
+        out = b''
+        while len(out) < length:
+            (data, next_pos) = self.image._read_metadata_block(self.pos)
+            if self.offset >= len(data):
+                self.pos = next_pos
+                self.offset = 0
+                continue
+            chunk = data[self.offset:self.offset + length - len(out)]
+            self.offset += len(chunk)
+            out += chunk
+        return out
+
+    def unpack(self, fmt):
+        return struct.unpack(fmt, self.read(struct.calcsize(fmt)))
+
+
+class SquashfsImage(object):
+    '''Read-only view of the metadata of a squashfs image'''
+    def __init__(self, fn):
+        self.filename = fn
+        try:
+            self._fh = open(fn, 'rb')
+        except (IOError, OSError) as e:
+            raise SquashfsException("could not open '%s': %s" % (fn, e))
+        self._blocks = dict()
+        try:
+            self._read_superblock()
+            self._read_id_table()
+        except Exception:
+            self.close()
+            raise
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+    def close(self):
+        if self._fh is not None:
+            self._fh.close()
+            self._fh = None
+
+    def _read_superblock(self):
+        '''Read and sanity check the superblock'''
+        data = self._fh.read(SUPERBLOCK_SIZE)
+        if len(data) != SUPERBLOCK_SIZE:
+            raise SquashfsException("superblock too short")
+
+        (magic, self.inode_count, self.mkfs_time, self.block_size,
+         self.fragment_count, self.compression, self.block_log, self.flags,
+         self.id_count, major, minor, self.root_inode, self.bytes_used,
+         self.id_table_start, self.xattr_id_table_start,
+         self.inode_table_start, self.directory_table_start,
+         self.fragment_table_start,
+         self.lookup_table_start) = struct.unpack(SUPERBLOCK_FMT, data)
+
+        if magic != SQUASHFS_MAGIC:
+            raise SquashfsException("bad magic (not a squashfs filesystem)")
+        if major != SQUASHFS_MAJOR:
+            raise SquashfsException("unsupported squashfs version %d.%d" %
+                                    (major, minor))
+        if self.block_size != 1 << self.block_log:
+            raise SquashfsException("block_size %d does not match "
+                                    "block_log %d" % (self.block_size,
+                                                      self.block_log))
+        if self.compression not in [COMPRESSION_GZIP,
+                                    COMPRESSION_LZMA,
+                                    COMPRESSION_XZ]:
+            raise SquashfsException("unsupported compression '%d'" %
+                                    self.compression)
+
+    def _decompress(self, data):
+        '''Decompress a metadata block'''
+        try:
+            if self.compression == COMPRESSION_GZIP:
+                return zlib.decompress(data)
+            elif self.compression == COMPRESSION_LZMA:
+                return lzma.decompress(data, format=lzma.FORMAT_ALONE)
+            return lzma.decompress(data, format=lzma.FORMAT_XZ)
+        except (zlib.error, lzma.LZMAError) as e:
+            raise SquashfsException("could not decompress metadata: %s" % e)
+
+    def _read_metadata_block(self, pos):
+        '''Return the uncompressed metadata block at pos and the position
+           of the block that follows it'''
+        if pos in self._blocks:
+            return self._blocks[pos]
+
+        self._fh.seek(pos)
+        header = self._fh.read(2)
+        if len(header) != 2:
+            raise SquashfsException("metadata block at %d past end of "
+                                    "image" % pos)
+        (length, ) = struct.unpack('<H', header)
+        compressed = not (length & SQUASHFS_COMPRESSED_BIT)
+        length &= ~SQUASHFS_COMPRESSED_BIT
+        data = self._fh.read(length)
+        if len(data) != length:
+            raise SquashfsException("metadata block at %d truncated" % pos)
+        if compressed:
+            data = self._decompress(data)
+        if len(data) == 0 or len(data) > SQUASHFS_METADATA_SIZE:
+            raise SquashfsException("metadata block at %d has invalid "
+                                    "size %d" % (pos, len(data)))
+
+        self._blocks[pos] = (data, pos + 2 + length)
+        return self._blocks[pos]
+
+    def _read_id_table(self):
+        '''Read the uid/gid lookup table'''
+        self.ids = []
+        if self.id_count == 0:
+            return
+        self._fh.seek(self.id_table_start)
+        data = self._fh.read(8)
+        if len(data) != 8:
+            raise SquashfsException("id table index truncated")
+        (first, ) = struct.unpack('<Q', data)
+        cursor = _MetadataCursor(self, first, 0)
+        self.ids = list(cursor.unpack('<%dI' % self.id_count))
+
+    def _lookup_id(self, idx):
+        if idx >= len(self.ids):
+            raise SquashfsException("invalid id index %d" % idx)
+        return self.ids[idx]
+
+    def _read_inode(self, block, offset):
+        '''Read the inode at block/offset of the inode table. Returns a tuple
+           of the SquashfsEntry fields (minus path) and, for directories,
+           the location of the directory listing.'''
+        cursor = _MetadataCursor(self, self.inode_table_start + block,
+                                 offset)
+        (itype, perms, uid_idx, gid_idx, mtime,
+         inode_number) = cursor.unpack('<HHHHII')
+        if itype not in INODE_TYPES:
+            raise SquashfsException("unknown inode type %d" % itype)
+        (ftype, fmt) = INODE_TYPES[itype]
+        mode = fmt | (perms & 0o7777)
+        uid = self._lookup_id(uid_idx)
+        gid = self._lookup_id(gid_idx)
+
+        size = 0
+        major = None
+        minor = None
+        target = None
+        listing = None
+        if itype == 1:
+            (start, nlink, size, dir_offset,
+             parent) = cursor.unpack('<IIHHI')
+            listing = (start, dir_offset, size)
+        elif itype == 8:
+            (nlink, size, start, parent, icount, dir_offset,
+             xattr) = cursor.unpack('<IIIIHHI')
+            listing = (start, dir_offset, size)
+        elif itype == 2:
+            (start, fragment, frag_offset, size) = cursor.unpack('<IIII')
+        elif itype == 9:
+            (start, size, sparse, nlink, fragment, frag_offset,
+             xattr) = cursor.unpack('<QQQIIII')
+        elif itype in [3, 10]:
+            (nlink, length) = cursor.unpack('<II')
+            target = cursor.read(length).decode('utf-8', 'replace')
+            size = length
+        elif itype in [4, 5, 11, 12]:
+            (nlink, rdev) = cursor.unpack('<II')
+            # new_encode_dev() format
+            major = (rdev >> 8) & 0xfff
+            minor = (rdev & 0xff) | ((rdev >> 12) & 0xfff00)
+
+        return ((ftype, mode, uid, gid, size, mtime, major, minor, target),
+                listing)
+
+    def _read_directory(self, listing):
+        '''Yield (name, inode block, inode offset) for each directory
+           entry'''
+        (start, offset, size) = listing
+        # the listing size includes 3 bytes for the implicit '.' and '..'
+        remaining = size - 3
+        if remaining <= 0:
+            return
+        cursor = _MetadataCursor(self, self.directory_table_start + start,
+                                 offset)
+        while remaining > 0:
+            (count, inode_block, inode_base) = cursor.unpack('<III')
+            remaining -= 12
+            for i in range(count + 1):
+                (inode_offset, inode_delta, itype,
+                 name_size) = cursor.unpack('<HhHH')
+                name = cursor.read(name_size + 1)
+                remaining -= 8 + name_size + 1
+                yield (name.decode('utf-8', 'surrogateescape'), inode_block,
+                       inode_offset)
+
+    def entries(self):
+        '''Yield a SquashfsEntry for every inode reachable from the root,
+           in the same (pre-order, sorted) order as 'unsquashfs -lls'.'''
+        root = (self.root_inode >> 16, self.root_inode & 0xffff)
+        stack = [('.', root)]
+        seen = set()
+        while stack:
+            (path, (block, offset)) = stack.pop()
+            (fields, listing) = self._read_inode(block, offset)
+            yield SquashfsEntry(path, *fields)
+            if listing is None:
+                continue
+            if (block, offset) in seen:
+                raise SquashfsException("directory loop at '%s'" % path)
+            seen.add((block, offset))
+            children = []
+            for (name, inode_block, inode_offset) in \
+                    self._read_directory(listing):
+                if name in ['', '.', '..'] or '/' in name:
+                    raise SquashfsException("invalid name '%s' in '%s'" %
+                                            (name, path))
+                children.append(("%s/%s" % (path, name),
+                                 (inode_block, inode_offset)))
+            stack += reversed(children)
+
+
+def list_entries(fn):
+    '''Return a list of SquashfsEntry for all the entries in the image'''
+    with SquashfsImage(fn) as img:
+        return list(img.entries())
@@ -17,17 +17,16 @@
 from __future__ import print_function
 import os
 import re
-import yaml
 
 
 from clickreviews.common import (
     Review,
     ReviewException,
     error,
-    open_file_read,
 )
 
 import clickreviews.snapd_base_declaration as snapd_base_declaration
+import clickreviews.yaml_loader as yaml_loader
 
 
 #
@@ -39,6 +38,8 @@ class SnapReviewException(ReviewException):
 
 class SnapReview(Review):
     '''This class represents snap reviews'''
+    # The sr_* scripts only support 16.04 snaps (v2) or higher
+    package_formats = [('snap', 2)]
     snappy_required = ["name",
                        "version",
                        ]
@@ -178,50 +179,21 @@ class SnapReview(Review):
         }
     }
 
-    def __init__(self, fn, review_type, overrides=None):
-        Review.__init__(self, fn, review_type, overrides=overrides)
+    def __init__(self, fn, review_type, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
+        Review.__init__(self, fn, review_type, overrides=overrides,
+                        unpack_dir=unpack_dir, raw_unpack_dir=raw_unpack_dir,
+                        context=context)
 
         if not self.is_snap2:
             return
 
-        snap_yaml = self._extract_snap_yaml()
-        try:
-            self.snap_yaml = yaml.safe_load(snap_yaml)
-        except Exception:  # pragma: nocover
-            error("Could not load snap.yaml. Is it properly formatted?")
+        self.snap_yaml = self.context.get('snap_yaml', self._load_snap_yaml)
 
-        # If local_copy is None, then this will check the server to see if
-        # we are up to date. However, if we are working within the development
-        # tree, use it unconditionally.
-        local_copy = None
-        branch_fn = os.path.join(os.path.dirname(__file__),
-                                 '../data/snapd-base-declaration.yaml')
-        if os.path.exists(branch_fn):
-            local_copy = branch_fn
-        p = snapd_base_declaration.SnapdBaseDeclaration(local_copy)
         # FIXME: don't hardcode series
         self.base_declaration_series = "16"
-        self.base_declaration = p.decl[self.base_declaration_series]
-
-        # Add in-progress interfaces
-        if self.base_declaration_series in self.inprogress_interfaces:
-            rel = self.base_declaration_series
-            for side in ['plugs', 'slots']:
-                if side not in self.base_declaration or \
-                        side not in self.inprogress_interfaces[rel]:
-                    continue
-
-                if side == 'plugs':
-                    oside = 'slots'
-                else:
-                    oside = 'plugs'
-
-                for iface in self.inprogress_interfaces[rel][side]:
-                    if iface in self.base_declaration[side] or \
-                            iface in self.base_declaration[oside]:
-                        # don't override anything in the base declaration
-                        continue
-                    self.base_declaration[side][iface] = self.inprogress_interfaces[rel][side][iface]
+        self.base_declaration = self.context.get('base_declaration',
+                                                 self._load_base_declaration)
 
         # to simplify checks, gather up all the interfaces into one dict()
         for side in ['plugs', 'slots']:
@@ -259,14 +231,57 @@ class SnapReview(Review):
                 if self.snap_yaml[k][iface] is None:
                     self.snap_yaml[k][iface] = {}
 
+    def _load_snap_yaml(self):
+        '''Parse the snappy 16.04 snap.yaml'''
+        snap_yaml = self._extract_snap_yaml()
+        try:
+            return yaml_loader.safe_load(snap_yaml)
+        except Exception:  # pragma: nocover
+            error("Could not load snap.yaml. Is it properly formatted?")
+
+    def _load_base_declaration(self):
+        '''Load the base declaration for base_declaration_series, with the
+           in-progress interfaces added'''
+        # If local_copy is None, then this will check the server to see if
+        # we are up to date. However, if we are working within the development
+        # tree, use it unconditionally.
+        local_copy = None
+        branch_fn = os.path.join(os.path.dirname(__file__),
+                                 '../data/snapd-base-declaration.yaml')
+        if os.path.exists(branch_fn):
+            local_copy = branch_fn
+        p = snapd_base_declaration.SnapdBaseDeclaration(local_copy)
+        base_declaration = p.decl[self.base_declaration_series]
+
+        # Add in-progress interfaces
+        if self.base_declaration_series in self.inprogress_interfaces:
+            rel = self.base_declaration_series
+            for side in ['plugs', 'slots']:
+                if side not in base_declaration or \
+                        side not in self.inprogress_interfaces[rel]:
+                    continue
+
+                if side == 'plugs':
+                    oside = 'slots'
+                else:
+                    oside = 'plugs'
+
+                for iface in self.inprogress_interfaces[rel][side]:
+                    if iface in base_declaration[side] or \
+                            iface in base_declaration[oside]:
+                        # don't override anything in the base declaration
+                        continue
+                    base_declaration[side][iface] = self.inprogress_interfaces[rel][side][iface]
+        return base_declaration
+
     # Since coverage is looked at via the testsuite and the testsuite mocks
     # this out, don't cover this
     def _extract_snap_yaml(self):  # pragma: nocover
         '''Extract and read the snappy 16.04 snap.yaml'''
-        y = os.path.join(self.unpack_dir, "meta/snap.yaml")
-        if not os.path.isfile(y):
+        y = "meta/snap.yaml"
+        if not self.pkgfs.isfile(y):
             error("Could not find snap.yaml.")
-        return open_file_read(y)
+        return self.pkgfs.open(y)
 
     # Since coverage is looked at via the testsuite and the testsuite mocks
     # this out, don't cover this
@@ -17,11 +17,31 @@
 from __future__ import print_function
 from clickreviews.sr_common import SnapReview, SnapReviewException
 from clickreviews.overrides import iface_attributes_noflag
+import collections
+import itertools
+import json
 import re
 
 # Specification:
 # https://docs.google.com/document/d/1QkglVjSzHC65lPthXV3ZlQcqPpKxuGEBL-FMuGP6ogs/edit#
 
+# attribute constraint -> compiled regex matching it. These are shared by all
+# the reviews in the process (eg, with click-review --batch).
+_MATCH_RES = dict()
+_MATCH_RES_MAX = 1024
+
+# interfaces with more combinations of alternate constraints than that are
+# not kept compiled
+_COMPILED_TABLES_MAX = 64
+
+
+def _match_re(against):
+    if against not in _MATCH_RES:
+        if len(_MATCH_RES) >= _MATCH_RES_MAX:
+            _MATCH_RES.clear()
+        _MATCH_RES[against] = re.compile(r'^(%s)$' % against)
+    return _MATCH_RES[against]
+
 
 class SnapDeclarationException(SnapReviewException):
     '''This class represents SnapDeclaration exceptions'''
@@ -29,9 +49,20 @@ class SnapDeclarationException(SnapReviewException):
 
 class SnapReviewDeclaration(SnapReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         SnapReview.__init__(self, fn, "declaration-snap-v2",
-                            overrides=overrides)
+                            overrides=overrides,
+                            unpack_dir=unpack_dir,
+                            raw_unpack_dir=raw_unpack_dir,
+                            context=context)
+
+        # interface -> (base declaration, snap declaration, compiled), see
+        # _compile_iface()
+        self._compiled_ifaces = dict()
+        # (side, interface, snap type, attributes) -> (base declaration,
+        # snap declaration, staged), see _evaluate_iface()
+        self._evaluated_ifaces = dict()
 
         if not self.is_snap2:
             return
@@ -339,7 +370,7 @@ class SnapReviewDeclaration(SnapReview):
         matched = False
 
         if isinstance(val, str):
-            if re.search(r'^(%s)$' % against, val):
+            if _match_re(against).search(val):
                 matched = True
         elif isinstance(val, list):
             matched = (sorted(against) == sorted(val))
@@ -416,21 +447,48 @@ class SnapReviewDeclaration(SnapReview):
 
         return (decl, base_decl, decl_type)
 
-    def _get_all_combinations(self, interface):
-        '''Return list of all base and snap declaration combinations where
-           each base/snap declaration pair represents a particular combination
-           of alternate constraints. Also return if there are alternate
-           constraints anywhere.
+    def _expand_side(self, d, side, interface):
+        '''Generate each combination of the alternate constraints of the
+           interface on side of declaration d, one at a time (see
+           _get_all_combinations())'''
+        cstrs = d[side][interface]
+        keys = [k for k in cstrs if isinstance(cstrs[k], list)]
+        for alternates in itertools.product(*[cstrs[k] for k in keys]):
+            tmp = dict(cstrs)
+            tmp.update(zip(keys, alternates))
+            yield {side: {interface: tmp}}
+
+    def _expand(self, d, interface):
+        '''Generate each combination of the plugs and slots alternate
+           constraints of the interface in declaration d'''
+        sides = [side for side in ['plugs', 'slots']
+                 if side in d and interface in d[side]]
+        if len(sides) < 2:
+            for side in sides:
+                yield from self._expand_side(d, side, interface)
+            return
 
-           For simple declarations, this will return the interface of the
+        for p in self._expand_side(d, 'plugs', interface):
+            for s in self._expand_side(d, 'slots', interface):
+                yield {'plugs': p['plugs'], 'slots': s['slots']}
+
+    def _get_all_combinations(self, interface):
+        '''Return a generator of all base and snap declaration combinations
+           where each base/snap declaration pair represents a particular
+           combination of alternate constraints. Also return if there are
+           alternate constraints anywhere. Combinations are only expanded
+           as they are needed, so checking can stop at any point without
+           the others being built.
+
+           For simple declarations, this will generate the interface of the
            base declaration and if a snap declaration is specified, the
            interface of the snap declaration (ie, a single base/snap
            declaration pair).
 
            For complex declarations with alternate constrainst, this will
-           return a list of pairs such that for each of base and snap
-           declarations, well expand like so (showing on the base declaration
-           for simplicity):
+           generate pairs such that for each of base and snap declarations,
+           we'll expand like so (showing on the base declaration for
+           simplicity):
 
                base = {
                    'slots': {
@@ -449,7 +507,7 @@ class SnapReviewDeclaration(SnapReview):
                    }
                }
 
-            then the list of 'base declarations' to check against is:
+            then the 'base declarations' to check against are:
 
                 decls['base'] = [
                     {'slots': {
@@ -500,80 +558,93 @@ class SnapReviewDeclaration(SnapReview):
 
             If the plugs side is defined for this interface, it will appear
             next to the slot as with a regular declaration. If the snap
-            declaration is defined, it will be stored in decls['snap'] in the
-            same way as the base declaration.
+            declaration is defined, it is expanded in the same way as the base
+            declaration.
 
-            In this manner, each one of the base declarations can be evaluated
-            and compared to any defined snap declarations.
+            Each one of the base declarations is paired with each one of the
+            snap declarations (or None without a snap declaration for the
+            interface), so it can be evaluated and compared to any defined
+            snap declarations.
         '''
-        def expand(d, side, interface, keys, templates):
-            if len(keys) == 0:
-                return templates
-
-            updated = []
-            key = keys[-1]
-            for i in d[side][interface][key]:
-                for t in templates:
-                    tmp = {side: {interface: {}}}
-                    # copy existing keys
-                    for template_key in t[side][interface]:
-                        tmp[side][interface][template_key] = \
-                            t[side][interface][template_key]
-                    tmp[side][interface][key] = i
-                    updated.append(tmp)
-
-            return expand(d, side, interface, keys[:-1], updated)
-
-        decls = {'base': [], 'snap': []}
-
         has_alternates = False
-        for dtype in ["base", "snap"]:
-            if dtype == "base":
-                d = self.base_declaration
-            else:
-                d = self.snap_declaration
-
-            tmp = {}
-            for side in ["plugs", "slots"]:
-                if dtype == "snap" and d is None:
-                    continue
+        for d in [self.base_declaration, self.snap_declaration]:
+            if d is None:
+                continue
+            for side in ['plugs', 'slots']:
                 if side not in d or interface not in d[side]:
                     continue
-
-                to_expand = []
-                template = {side: {interface: {}}}
                 for cstr in d[side][interface]:
                     if isinstance(d[side][interface][cstr], list):
-                        to_expand.append(cstr)
-                    else:
-                        template[side][interface][cstr] = \
-                            d[side][interface][cstr]
-
-                tmp[side] = []
-                tmp[side] += expand(d, side, interface, to_expand, [template])
-
-                if len(to_expand) > 0:
-                    has_alternates = True
-
-            # Now that we have all the slots combinations and all the plugs
-            # combinations, create combinations of those
-            if "plugs" in tmp and "slots" in tmp:
-                for p in tmp["plugs"]:
-                    for s in tmp["slots"]:
-                        decls[dtype].append({'plugs': p['plugs'],
-                                             'slots': s['slots']})
-            elif "plugs" in tmp:
-                decls[dtype] = tmp["plugs"]
-            elif "slots" in tmp:
-                decls[dtype] = tmp["slots"]
-
-        # We need at least one declaration per list, even if it is None
-        if len(decls['snap']) == 0:
-            decls['snap'].append(None)
-
-        return (decls, has_alternates)
-
-    def _verify_iface_by_declaration(self, base, snap, name, iface, interface, attribs, side, oside):
+                        has_alternates = True
+
+        def combinations():
+            for b in self._expand(self.base_declaration, interface):
+                # We need at least one snap declaration, even if it is None
+                found = False
+                if self.snap_declaration is not None:
+                    for s in self._expand(self.snap_declaration, interface):
+                        found = True
+                        yield (b, s)
+                if not found:
+                    yield (b, None)
+
+        return (combinations(), has_alternates)
+
+    def _compile_table(self, base, snap, interface):
+        '''Return the constraint table of a base/snap declaration pair
+           from _get_all_combinations(): for each side and each of
+           'installation' and 'connection', which declaration is used (as
+           chosen by _get_decl()) and its constraints for the interface on
+           that side and on the other side.
+        '''
+        table = dict()
+        for side in ['plugs', 'slots']:
+            for i in ['installation', 'connection']:
+                (decl, base_decl, decl_type) = self._get_decl(base, snap, side,
+                                                              interface, i)
+                cstrs = dict()
+                if side in decl and interface in decl[side]:
+                    cstrs = decl[side][interface]
+                oside = 'slots' if side == 'plugs' else 'plugs'
+                ocstrs = dict()
+                if oside in decl and interface in decl[oside]:
+                    ocstrs = decl[oside][interface]
+                table[(side, i)] = (cstrs, ocstrs, base_decl, decl_type)
+        return table
+
+    def _compile_iface(self, interface):
+        '''Return the constraint tables of all the base and snap declaration
+           combinations of the interface (see _get_all_combinations() and
+           _compile_table()) and if there are alternate constraints. The
+           result only depends on the declarations of the interface, so it
+           is reused for all the plugs and slots of the interface in this
+           review, unless there are more than _COMPILED_TABLES_MAX
+           combinations. Then the tables are generated one at a time, as
+           they are checked. The tables refer to the declarations of the
+           review, so they are not shared with other reviews.
+        '''
+        if interface in self._compiled_ifaces:
+            (base, snap, compiled) = self._compiled_ifaces[interface]
+            if base is self.base_declaration and \
+                    snap is self.snap_declaration:
+                return compiled
+
+        (combinations, has_alternates) = \
+            self._get_all_combinations(interface)
+        tables = (self._compile_table(b, s, interface)
+                  for (b, s) in combinations)
+        head = list(itertools.islice(tables, _COMPILED_TABLES_MAX + 1))
+        if len(head) > _COMPILED_TABLES_MAX:
+            # too many alternates to keep them all. Generate them as they
+            # are checked, every time.
+            return (itertools.chain(head, tables), has_alternates)
+        compiled = (head, has_alternates)
+
+        self._compiled_ifaces[interface] = (self.base_declaration,
+                                            self.snap_declaration, compiled)
+        return compiled
+
+    def _verify_iface_by_declaration(self, table, interface, attribs, side, oside, staged):
         # 'checked' is used to see if a particular check is made (eg, if
         # 'deny-connection' for this interface was performed).
         #
@@ -581,7 +652,8 @@ class SnapReviewDeclaration(SnapReview):
         #
         # _verify_iface_by_declaration() will return if something prompted
         # manual review (denied > 0) and if this is an exact match (ie, if
-        # checked == denied).
+        # checked == denied). What prompted manual review is added to
+        # 'staged', by check name (without the plug/slot and interface).
         checked = 0
         denied = 0
 
@@ -604,59 +676,41 @@ class SnapReviewDeclaration(SnapReview):
         # top-level allow/deny-installation/connection
         # Note: auto-connection is only for snapd, so don't include it here
         for i in ['installation', 'connection']:
+            (cstrs, ocstrs, base_decl, decl_type) = table[(side, i)]
             for j in ['deny', 'allow']:
                 decl_key = "%s-%s" % (j, i)
                 # flag if deny-* is true or allow-* is false
-                (decl, base_decl, decl_type) = self._get_decl(base, snap, side,
-                                                              interface, i)
-                if side in decl and interface in decl[side] and \
-                        decl_key in decl[side][interface] and \
-                        not isinstance(decl[side][interface][decl_key], dict):
+                if decl_key in cstrs and \
+                        not isinstance(cstrs[decl_key], dict):
                     checked += 1
-                    if self._search(decl[side][interface], decl_key,
-                                    j == 'deny'):
-                        self._add_result('error',
-                                         self._get_check_name("%s_%s" %
-                                                              (side, decl_key),
-                                                              app=iface,
-                                                              extra=interface),
-                                         err(decl_key, dtype=decl_type),
-                                         manual_review=True,
-                                         stage=True)
+                    if self._search(cstrs, decl_key, j == 'deny'):
+                        staged["%s_%s" % (side, decl_key)] = \
+                            err(decl_key, dtype=decl_type)
                         denied += 1
 
                         # if manual review after 'deny', don't look at allow
                         break
 
-        # deny/allow-installation snap-type
         snap_type = 'app'
         if 'type' in self.snap_yaml:
             snap_type = self.snap_yaml['type']
             if snap_type == 'os':
                 snap_type = 'core'
+
+        # deny/allow-installation snap-type
         decl_subkey = '%s-snap-type' % side[:-1]
+        (cstrs, ocstrs, base_decl, decl_type) = table[(side, 'installation')]
         for j in ['deny', 'allow']:
-            (decl, base_decl, decl_type) = self._get_decl(base, snap, side,
-                                                          interface,
-                                                          'installation')
             decl_key = "%s-installation" % j
             # flag if deny-*/snap-type matches or allow-*/snap-type doesn't
-            if side in decl and interface in decl[side] and \
-                    decl_key in decl[side][interface] and \
-                    isinstance(decl[side][interface][decl_key], dict) and \
-                    decl_subkey in decl[side][interface][decl_key]:
+            if decl_key in cstrs and isinstance(cstrs[decl_key], dict) and \
+                    decl_subkey in cstrs[decl_key]:
                 checked += 1
-                if self._search(decl[side][interface], decl_key,
-                                subkey=decl_subkey, subval=snap_type,
+                if self._search(cstrs, decl_key, subkey=decl_subkey,
+                                subval=snap_type,
                                 subval_inverted=(j == 'allow')):
-                    self._add_result('error',
-                                     self._get_check_name("%s_%s" %
-                                                          (side, decl_key),
-                                                          app=iface,
-                                                          extra=interface),
-                                     err(decl_key, decl_subkey, decl_type),
-                                     manual_review=True,
-                                     stage=True)
+                    staged["%s_%s" % (side, decl_key)] = \
+                        err(decl_key, decl_subkey, decl_type)
                     denied += 1
 
                     # if manual review after 'deny', don't look at allow
@@ -664,38 +718,24 @@ class SnapReviewDeclaration(SnapReview):
 
         # deny/allow-connection/installation on-classic with app snaps
         # Note: auto-connection is only for snapd, so don't include it here
-        snap_type = 'app'
-        if 'type' in self.snap_yaml:
-            snap_type = self.snap_yaml['type']
-            if snap_type == 'os':
-                snap_type = 'core'
         decl_subkey = 'on-classic'
         for i in ['installation', 'connection']:
+            (cstrs, ocstrs, base_decl, decl_type) = table[(side, i)]
             for j in ['deny', 'allow']:
-                (decl, base_decl, decl_type) = self._get_decl(base, snap, side,
-                                                              interface, i)
                 decl_key = "%s-%s" % (j, i)
                 # when an app snap, flag if deny-*/on-classic=false or
                 # allow-*/on-classic=true
                 # when not an app snap, flag if deny-*/on-classic=true or
                 # allow-*/on-classic=false
-                if side in decl and interface in decl[side] and \
-                        decl_key in decl[side][interface] and \
-                        isinstance(decl[side][interface][decl_key], dict) and \
-                        decl_subkey in decl[side][interface][decl_key]:
+                if decl_key in cstrs and \
+                        isinstance(cstrs[decl_key], dict) and \
+                        decl_subkey in cstrs[decl_key]:
                     checked += 1
-                    if self._search(decl[side][interface], decl_key,
-                                    subkey=decl_subkey,
+                    if self._search(cstrs, decl_key, subkey=decl_subkey,
                                     subval=(snap_type == 'app'),
                                     subval_inverted=(j == 'deny')):
-                        self._add_result('error',
-                                         self._get_check_name("%s_%s" %
-                                                              (side, decl_key),
-                                                              app=iface,
-                                                              extra=interface),
-                                         err(decl_key, decl_subkey, decl_type),
-                                         manual_review=True,
-                                         stage=True)
+                        staged["%s_%s" % (side, decl_key)] = \
+                            err(decl_key, decl_subkey, decl_type)
                         denied += 1
 
                         # if manual review after 'deny', don't look at allow
@@ -707,49 +747,33 @@ class SnapReviewDeclaration(SnapReview):
         for i in ['installation', 'connection']:
             if attribs is None:
                 continue
+            (cstrs, ocstrs, base_decl, decl_type) = table[(side, i)]
             for j in ['deny', 'allow']:
-                (decl, base_decl, decl_type) = self._get_decl(base, snap, side,
-                                                              interface, i)
                 decl_key = "%s-%s" % (j, i)
                 # flag if any deny-*/attribs match or any allow-*/attribs don't
-                if side in decl and interface in decl[side] and \
-                        decl_key in decl[side][interface] and \
-                        isinstance(decl[side][interface][decl_key], dict) and \
-                        decl_subkey in decl[side][interface][decl_key]:
+                if decl_key in cstrs and \
+                        isinstance(cstrs[decl_key], dict) and \
+                        decl_subkey in cstrs[decl_key]:
                     checked += 1
-                    if self._search(decl[side][interface], decl_key,
-                                    subkey=decl_subkey, subval=attribs,
+                    if self._search(cstrs, decl_key, subkey=decl_subkey,
+                                    subval=attribs,
                                     subval_inverted=(j == 'allow')):
-                        self._add_result('error',
-                                         self._get_check_name("%s_%s" %
-                                                              (side, decl_key),
-                                                              app=iface,
-                                                              extra=interface),
-                                         err(decl_key, decl_subkey, decl_type, attribs),
-                                         manual_review=True,
-                                         stage=True)
+                        staged["%s_%s" % (side, decl_key)] = \
+                            err(decl_key, decl_subkey, decl_type, attribs)
                         denied += 1
 
                         # if manual review after 'deny', don't look at allow
                         break
                 # Since base declaration mostly has slots side, if plugs, look
                 # at the other side for checking plug-attributes
-                elif base_decl and side == 'plugs' and oside in decl and \
-                        interface in decl[oside] and \
-                        decl_key in decl[oside][interface] and \
-                        decl_subkey in decl[oside][interface][decl_key]:
+                elif base_decl and side == 'plugs' and decl_key in ocstrs and \
+                        decl_subkey in ocstrs[decl_key]:
                     checked += 1
-                    if self._search(decl[oside][interface], decl_key,
-                                    subkey=decl_subkey, subval=attribs,
+                    if self._search(ocstrs, decl_key, subkey=decl_subkey,
+                                    subval=attribs,
                                     subval_inverted=(j == 'allow')):
-                        self._add_result('error',
-                                         self._get_check_name("%s_%s" %
-                                                              (side, decl_key),
-                                                              app=iface,
-                                                              extra=interface),
-                                         err(decl_key, decl_subkey, decl_type, attribs),
-                                         manual_review=True,
-                                         stage=True)
+                        staged["%s_%s" % (side, decl_key)] = \
+                            err(decl_key, decl_subkey, decl_type, attribs)
                         denied += 1
 
                         # if manual review after 'deny', don't look at allow
@@ -759,6 +783,61 @@ class SnapReviewDeclaration(SnapReview):
         # checked was denied (an exact match denial)
         return (denied > 0, checked == denied)
 
+    def _evaluate_iface(self, interface, attribs, side, oside):
+        '''Return what requires manual review for a plug or slot (side) of
+           the interface with the given attributes, by check name (without
+           the plug/slot and interface), as staged by
+           _verify_iface_by_declaration(). That only depends on the
+           declarations, the snap type and the attributes, so plugs and
+           slots (eg, the same interface plugged by many apps) with the
+           same ones are only evaluated once.
+        '''
+        snap_type = self.snap_yaml['type'] if 'type' in self.snap_yaml \
+            else None
+        try:
+            key = (side, interface, snap_type,
+                   json.dumps(attribs, sort_keys=True))
+        except TypeError:  # pragma: nocover
+            key = None  # not from YAML, don't reuse it
+        if key in self._evaluated_ifaces:
+            (base, snap, staged) = self._evaluated_ifaces[key]
+            if base is self.base_declaration and \
+                    snap is self.snap_declaration:
+                return staged
+
+        # To support alternates in the base and snap declaration, we need to
+        # try each combination of snap alternate constraint and base alternate
+        # constraint. If we have alternates and one passes and there are no
+        # exact denials, then don't report. Otherwise report if require manual
+        # review.
+        (tables, has_alternates) = self._compile_iface(interface)
+        require_manual = False
+        staged = collections.OrderedDict()
+
+        exact_deny = True
+        for table in tables:
+            (manual, exact) = \
+                self._verify_iface_by_declaration(table, interface, attribs,
+                                                  side, oside, staged)
+            if manual:
+                require_manual = True
+                if has_alternates and not exact:
+                    # this won't require manual review whatever the other
+                    # combinations are, so don't check them
+                    exact_deny = False
+                    break
+
+        if has_alternates and not exact_deny:
+            require_manual = False
+
+        # Report our staged results if required, otherwise all is ok
+        if not require_manual:
+            staged = collections.OrderedDict()
+        if key is not None:
+            self._evaluated_ifaces[key] = (self.base_declaration,
+                                           self.snap_declaration, staged)
+        return staged
+
     def _verify_iface(self, name, iface, interface, attribs=None):
         if name.endswith('slot'):
             side = 'slots'
@@ -784,32 +863,13 @@ class SnapReviewDeclaration(SnapReview):
             self._add_result(t, n, s)
             return
 
-        # To support alternates in the base and snap declaration, we need to
-        # try each combination of snap alternate constraint and base alternate
-        # constraint. If we have alternates and one passes and there are no
-        # exact denials, then don't report. Otherwise report if require manual
-        # review.
-        (decls, has_alternates) = self._get_all_combinations(interface)
-        require_manual = False
-
-        exact_deny = True
-        for b in decls['base']:
-            for s in decls['snap']:
-                (manual, exact) = \
-                    self._verify_iface_by_declaration(b, s, name, iface,
-                                                      interface, attribs, side,
-                                                      oside)
-                if manual:
-                    require_manual = True
-                    if has_alternates and not exact:
-                        exact_deny = False
-
-        if has_alternates and not exact_deny:
-            require_manual = False
-
-        # Apply our staged results if required, otherwise report all is ok
-        if require_manual:
-            self._apply_staged_results()
+        staged = self._evaluate_iface(interface, attribs, side, oside)
+        if staged:
+            for check_name in staged:
+                self._add_result('error',
+                                 self._get_check_name(check_name, app=iface,
+                                                      extra=interface),
+                                 staged[check_name], manual_review=True)
         else:
             self._add_result('info',
                              self._get_check_name("%s" % side, app=iface,
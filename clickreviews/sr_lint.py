@@ -20,13 +20,13 @@ from clickreviews.sr_common import (
 )
 from clickreviews.common import (
     find_external_symlinks,
+    get_package_index,
     STORE_PKGNAME_SNAPV2_MAXLEN,
 )
 from clickreviews.overrides import (
     redflagged_snap_types_overrides,
     desktop_file_exception
 )
-import glob
 import os
 import re
 
@@ -34,9 +34,13 @@ import re
 class SnapReviewLint(SnapReview):
     '''This class represents snap lint reviews'''
 
-    def __init__(self, fn, overrides=None):
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
         '''Set up the class.'''
-        SnapReview.__init__(self, fn, "lint-snap-v2", overrides=overrides)
+        SnapReview.__init__(self, fn, "lint-snap-v2", overrides=overrides,
+                            unpack_dir=unpack_dir,
+                            raw_unpack_dir=raw_unpack_dir,
+                            context=context)
         if not self.is_snap2:
             return
 
@@ -1129,8 +1133,11 @@ class SnapReviewLint(SnapReview):
         t = 'info'
         n = self._get_check_name('external_symlinks')
         s = 'OK'
-        links = find_external_symlinks(self._get_unpack_dir(), self.pkg_files,
-                                       self.snap_yaml['name'])
+        index = get_package_index(self._get_unpack_dir())
+        links = find_external_symlinks(
+            self._get_unpack_dir(),
+            [index.path(e.path) for e in index.symlinks(include_dirs=False)],
+            self.snap_yaml['name'])
         if len(links) > 0:
             t = 'error'
             s = 'package contains external symlinks: %s' % ', '.join(links)
@@ -1176,6 +1183,7 @@ class SnapReviewLint(SnapReview):
         if 'all' in self.snap_yaml['architectures']:
             return
 
+        bin_arches = self._get_pkg_bin_arches()
         for arch in self.snap_yaml['architectures']:
             t = 'info'
             n = self._get_check_name('architecture_specified_needed',
@@ -1186,6 +1194,10 @@ class SnapReviewLint(SnapReview):
                 t = 'info'
                 s = "Could not find compiled binaries for architecture '%s'" \
                     % arch
+            elif len(bin_arches) > 0 and arch not in bin_arches:
+                t = 'info'
+                s = "Could not find compiled binaries for architecture " + \
+                    "'%s' (found: %s)" % (arch, ", ".join(sorted(bin_arches)))
             self._add_result(t, n, s)
 
     def check_vcs(self):
@@ -1197,8 +1209,9 @@ class SnapReviewLint(SnapReview):
         n = self._get_check_name('vcs_files')
         s = 'OK'
         found = []
+        index = get_package_index(self._get_unpack_dir())
         for d in self.vcs_files:
-            entries = glob.glob("%s/%s" % (self._get_unpack_dir(), d))
+            entries = index.glob(d)
             if len(entries) > 0:
                 for i in entries:
                     found.append(os.path.relpath(i, self.unpack_dir))
@@ -22,7 +22,11 @@ from clickreviews.sr_common import (
 from clickreviews.common import (
     cmd,
     create_tempdir,
+    debug,
+    get_unpacked_dir,
+    hash_file,
     ReviewException,
+    with_umask,
     AA_PROFILE_NAME_MAXLEN,
     AA_PROFILE_NAME_ADVLEN,
     MKSQUASHFS_OPTS,
@@ -31,14 +35,21 @@ from clickreviews.overrides import (
     sec_mode_overrides,
     sec_browser_support_overrides,
 )
+from clickreviews.squashfs import SquashfsException
+import clickreviews.squashfs as squashfs
 import os
 import re
+import stat
 
 
 class SnapReviewSecurity(SnapReview):
     '''This class represents snap security reviews'''
-    def __init__(self, fn, overrides=None):
-        SnapReview.__init__(self, fn, "security-snap-v2", overrides=overrides)
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
+        SnapReview.__init__(self, fn, "security-snap-v2", overrides=overrides,
+                            unpack_dir=unpack_dir,
+                            raw_unpack_dir=raw_unpack_dir,
+                            context=context)
 
         if not self.is_snap2:
             return
@@ -51,6 +62,10 @@ class SnapReviewSecurity(SnapReview):
         '''Run unsquashfs -lls on a snap package'''
         return cmd(['unsquashfs', '-lls', snap_pkg])
 
+    def _squashfs_entries(self, snap_pkg):
+        '''Read the entries of a squashfs snap package'''
+        return squashfs.list_entries(snap_pkg)
+
     def check_security_plugs_browser_support_with_daemon(self):
         '''Check security plugs - browser-support not used with daemon'''
         def _plugref_is_interface(ref, iface):
@@ -146,14 +161,20 @@ class SnapReviewSecurity(SnapReview):
         fstime = out.strip()
 
         # For now, skip the checks on if have symlinks due to LP: #1555305
-        (rc, out) = cmd(['unsquashfs', '-lls', fn])
-        if rc != 0:
-            t = 'error'
-            n = self._get_check_name('squashfs_lls')
-            s = 'could not list contents of squashfs'
-            self._add_result(t, n, s)
-            return
-        elif 'lrwxrwxrwx' in out:
+        try:
+            has_symlinks = 'l' in [e.type for e in
+                                   self._squashfs_entries(fn)]
+        except SquashfsException:
+            (rc, out) = cmd(['unsquashfs', '-lls', fn])
+            if rc != 0:
+                t = 'error'
+                n = self._get_check_name('squashfs_lls')
+                s = 'could not list contents of squashfs'
+                self._add_result(t, n, s)
+                return
+            has_symlinks = 'lrwxrwxrwx' in out
+
+        if has_symlinks:
             t = 'info'
             n = self._get_check_name('squashfs_resquash_1555305')
             s = 'cannot reproduce squashfs'
@@ -163,55 +184,76 @@ class SnapReviewSecurity(SnapReview):
         # end LP: #1555305 workaround
 
         tmpdir = create_tempdir()  # this is autocleaned
-        tmp_unpack = os.path.join(tmpdir, 'squashfs-root')
-        tmp_repack = os.path.join(tmpdir, 'repack.snap')
+
+        # Resquash the tree the other checks use. Only a tree given with
+        # --unpacked-dir is unsquashed again since how it was unpacked is
+        # unknown
+        unpack_dir = self.unpack_dir
+        if unpack_dir != get_unpacked_dir():
+            unpack_dir = None
+
+        # The repack is only needed for its hash. mksquashfs seeks back to
+        # write the superblock so it can't write to a pipe, but it can write
+        # to a file in memory which is gone once closed instead of the disk
+        repack_fd = None
+        if hasattr(os, 'memfd_create'):
+            try:
+                repack_fd = os.memfd_create('repack.snap')
+            except OSError:
+                pass
+        if repack_fd is None:
+            tmp_repack = os.path.join(tmpdir, 'repack.snap')
+        else:
+            # mksquashfs doesn't inherit the fd, so use the one of this pid
+            tmp_repack = '/proc/%d/fd/%d' % (os.getpid(), repack_fd)
 
         curdir = os.getcwd()
         os.chdir(tmpdir)
-        # ensure we don't alter the permissions from the unsquashfs
-        old_umask = os.umask(000)
 
         try:
-            (rc, out) = cmd(['unsquashfs', '-d', tmp_unpack, fn])
-            if rc != 0:
-                raise ReviewException("could not unsquash '%s': %s" %
-                                      (os.path.basename(fn), out))
-            (rc, out) = cmd(['mksquashfs', tmp_unpack, tmp_repack,
+            if unpack_dir is None:
+                unpack_dir = os.path.join(tmpdir, 'squashfs-root')
+                # ensure we don't alter the permissions from the unsquashfs
+                with with_umask(0o000):
+                    (rc, out) = cmd(['unsquashfs', '-d', unpack_dir, fn])
+                if rc != 0:
+                    raise ReviewException("could not unsquash '%s': %s" %
+                                          (os.path.basename(fn), out))
+            (rc, out) = cmd(['mksquashfs', unpack_dir, tmp_repack,
                              '-fstime', fstime] + MKSQUASHFS_OPTS)
             if rc != 0:
                 raise ReviewException("could not mksquashfs '%s': %s" %
-                                      (os.path.relpath(tmp_unpack, tmpdir),
-                                       out))
+                                      (os.path.basename(unpack_dir), out))
+
+            # an empty memfd is left when mksquashfs wrote nothing
+            repack_sum = None
+            if os.path.isfile(tmp_repack) and \
+                    os.path.getsize(tmp_repack) > 0:
+                repack_sum = hash_file(tmp_repack)
         except ReviewException as e:
             t = 'error'
             n = self._get_check_name('squashfs_resquash')
             self._add_result(t, n, str(e))
             return
         finally:
-            os.umask(old_umask)
             os.chdir(curdir)
+            if repack_fd is not None:
+                os.close(repack_fd)
+            elif os.path.exists(tmp_repack):
+                os.unlink(tmp_repack)
 
         # Now calculate the hashes
         t = 'info'
         n = self._get_check_name('squashfs_repack_checksum')
         s = "OK"
 
-        (rc, out) = cmd(['sha512sum', fn])
-        if rc != 0:
+        # the snap was hashed when first read
+        orig_sum = self._get_archive_digest()
+        if repack_sum is None:
             t = 'error'
-            s = "could not determine checksum of '%s'" % os.path.basename(fn)
+            s = "could not determine checksum of 'repack.snap'"
             self._add_result(t, n, s)
             return
-        orig_sum = out.split()[0]
-
-        (rc, out) = cmd(['sha512sum', tmp_repack])
-        if rc != 0:
-            t = 'error'
-            s = "could not determine checksum of '%s'" % \
-                os.path.relpath(tmp_repack, tmpdir)
-            self._add_result(t, n, s)
-            return
-        repack_sum = out.split()[0]
 
         if orig_sum != repack_sum:
             if 'type' in self.snap_yaml and self.snap_yaml['type'] == 'os':
@@ -227,14 +269,50 @@ class SnapReviewSecurity(SnapReview):
                     "'mksquashfs <dir> <snap> %s'" % " ".join(MKSQUASHFS_OPTS)
         self._add_result(t, n, s)
 
-    def check_squashfs_files(self):
-        '''Check squashfs files'''
+    def _squashfs_mode_error(self, fname, ftype, mode, pkgname, snap_type):
+        '''Return the policy error for the type and mode of a squashfs
+           entry, if any'''
         def _check_allowed_perms(mode, allowed):
-            for p in mode[1:]:
+            for p in mode:
                 if p not in allowed:
                     return False
             return True
 
+        # Also see 'info ls', but we list only the Linux ones
+        if ftype not in ['b', 'c', 'd', 'l', 'p', 's', '-']:
+            return "unknown type '%s' for entry '%s'" % (ftype, fname)
+
+        if ftype == 'd' or ftype == '-':
+            perms = ['r', 'w', 'x', '-']
+            if ftype == 'd':  # allow sticky directories for stage-packages
+                perms.append('t')
+            if not _check_allowed_perms(mode, perms):
+                if pkgname not in sec_mode_overrides or \
+                    fname not in sec_mode_overrides[pkgname] or \
+                        sec_mode_overrides[pkgname][fname] != mode:
+                    return "unusual mode '%s' for entry '%s'" % (mode, fname)
+            # No point checking for world-writable, the squashfs is
+            # readonly
+            # if mode[-2] != '-':
+            #     return "'%s' is world-writable" % fn
+        elif ftype == 'l':
+            if mode != 'rwxrwxrwx':
+                return "unusual mode '%s' for symlink '%s'" % (mode, fname)
+        elif snap_type != 'os':
+            return "file type '%s' not allowed (%s)" % (ftype, fname)
+        return None
+
+    def _squashfs_owner_error(self, fname, user, group, snap_type):
+        '''Return the policy error for the owner of a squashfs entry, if
+           any'''
+        # we enforce 'root/root'
+        if snap_type != 'os' and (user != 'root' or group != 'root'):
+            return "unusual user/group '%s/%s' for '%s'" % (user, group,
+                                                            fname)
+        return None
+
+    def check_squashfs_files(self):
+        '''Check squashfs files'''
         if not self.is_snap2:
             return
 
@@ -246,6 +324,42 @@ class SnapReviewSecurity(SnapReview):
 
         fn = os.path.abspath(self.pkg_filename)
 
+        try:
+            entries = self._squashfs_entries(fn)
+        except SquashfsException as e:
+            debug("could not read squashfs directly, using unsquashfs "
+                  "-lls: %s" % e)
+            self._check_squashfs_files_lls(fn, pkgname, snap_type)
+            return
+
+        def _id_name(i):
+            if i == 0:
+                return 'root'
+            return str(i)
+
+        errors = []
+        for entry in entries:
+            mode = stat.filemode(entry.mode)[1:]
+            err = self._squashfs_mode_error(entry.path, entry.type, mode,
+                                            pkgname, snap_type)
+            if err is None:
+                err = self._squashfs_owner_error(entry.path,
+                                                 _id_name(entry.uid),
+                                                 _id_name(entry.gid),
+                                                 snap_type)
+            if err is not None:
+                errors.append(err)
+
+        t = 'info'
+        n = self._get_check_name('squashfs_files')
+        s = 'OK'
+        if len(errors) > 0:
+            t = 'error'
+            s = "found errors in file output: %s" % ", ".join(errors)
+        self._add_result(t, n, s)
+
+    def _check_squashfs_files_lls(self, fn, pkgname, snap_type):
+        '''Check squashfs files using the output of unsquashfs -lls'''
         (rc, out) = self._unsquashfs_lls(fn)
         if rc != 0:
             t = 'error'
@@ -277,47 +391,20 @@ class SnapReviewSecurity(SnapReview):
                 continue
 
             fname = fname_pat.sub('.', line)
-            ftype = tmp[0][0]
-
-            # Also see 'info ls', but we list only the Linux ones
             ftype = line[0]
-            if ftype not in ['b', 'c', 'd', 'l', 'p', 's', '-']:
-                errors.append("unknown type '%s' for entry '%s'" % (ftype,
-                                                                    fname))
-                continue
 
             # verify mode
             mode = tmp[0][1:]
-            if len(mode) != 9:
+            if ftype in ['b', 'c', 'd', 'l', 'p', 's', '-'] and \
+                    len(mode) != 9:
                 malformed.append("mode '%s' malformed for '%s'" % (mode,
                                                                    fname))
                 continue
-            if ftype == 'd' or ftype == '-':
-                perms = ['r', 'w', 'x', '-']
-                if ftype == 'd':  # allow sticky directories for stage-packages
-                    perms.append('t')
-                if not _check_allowed_perms(mode, perms):
-                    if pkgname not in sec_mode_overrides or \
-                        fname not in sec_mode_overrides[pkgname] or \
-                            sec_mode_overrides[pkgname][fname] != mode:
-                        errors.append("unusual mode '%s' for entry '%s'" %
-                                      (mode, fname))
-                        continue
-                # No point checking for world-writable, the squashfs is
-                # readonly
-                # if mode[-2] != '-':
-                #     errors.append("'%s' is world-writable" % fn)
-                #     continue
-            elif ftype == 'l':
-                if mode != 'rwxrwxrwx':
-                    errors.append("unusual mode '%s' for symlink '%s'" %
-                                  (mode, fname))
-                    continue
-            else:
-                if snap_type != 'os':
-                    errors.append("file type '%s' not allowed (%s)" % (ftype,
-                                                                       fname))
-                    continue
+            err = self._squashfs_mode_error(fname, ftype, mode, pkgname,
+                                            snap_type)
+            if err is not None:
+                errors.append(err)
+                continue
 
             # verify user and group
             if '/' not in tmp[1]:
@@ -325,10 +412,9 @@ class SnapReviewSecurity(SnapReview):
                                  (tmp[1], fname))
                 continue
             (user, group) = tmp[1].split('/')
-            # we enforce 'root/root'
-            if snap_type != 'os' and (user != 'root' or group != 'root'):
-                errors.append("unusual user/group '%s' for '%s'" % (tmp[1],
-                                                                    fname))
+            err = self._squashfs_owner_error(fname, user, group, snap_type)
+            if err is not None:
+                errors.append(err)
                 continue
 
             date_idx = 3
@@ -20,8 +20,12 @@ from clickreviews.sr_common import SnapReview
 
 class SnapReviewSkeleton(SnapReview):
     '''This class represents click lint reviews'''
-    def __init__(self, fn, overrides=None):
-        SnapReview.__init__(self, fn, "skeleton-snap-v2", overrides=overrides)
+    def __init__(self, fn, overrides=None, unpack_dir=None,
+                 raw_unpack_dir=None, context=None):
+        SnapReview.__init__(self, fn, "skeleton-snap-v2", overrides=overrides,
+                            unpack_dir=unpack_dir,
+                            raw_unpack_dir=raw_unpack_dir,
+                            context=context)
 
     def check_foo(self):
         '''Check foo'''
@@ -23,6 +23,7 @@ from unittest import TestCase
 from clickreviews.common import (
     check_results as common_check_results
 )
+from clickreviews.squashfs import SquashfsException
 
 # These should be set in the test cases
 TEST_SNAP_YAML = ""
@@ -31,6 +32,7 @@ TEST_PKGFMT_VERSION = "16.04"
 TEST_UNPACK_DIR = "/fake"
 TEST_SECURITY_PROFILES = dict()
 TEST_UNSQUASHFS_LLS = ""
+TEST_SQUASHFS_ENTRIES = None
 
 
 #
@@ -63,7 +65,12 @@ def _pkgfmt_type(self):
     return TEST_PKGFMT_TYPE
 
 
-def _detect_package(self, fn):
+def _unpack_pkg_with_raw(fn):
+    '''Pretend we unpacked the package'''
+    return (None, None)
+
+
+def _detect_package(fn, dir=None):
     '''Pretend we detected the package'''
     ver = 2
     if TEST_PKGFMT_VERSION == "15.04":
@@ -81,6 +88,13 @@ def _unsquashfs_lls(self, fn):
     return (0, TEST_UNSQUASHFS_LLS)
 
 
+def _squashfs_entries(self, fn):
+    '''Pretend we read the squashfs inode and directory tables'''
+    if TEST_SQUASHFS_ENTRIES is None:
+        raise SquashfsException("not a squashfs filesystem")
+    return TEST_SQUASHFS_ENTRIES
+
+
 def create_patches():
     # http://docs.python.org/3.4/library/unittest.mock-examples.html
     # Mock patching. Don't use decorators but instead patch in setUp() of the
@@ -96,6 +110,8 @@ def create_patches():
         _path_join))
     patches.append(patch('clickreviews.common.unpack_pkg', _mock_func))
     patches.append(patch('clickreviews.common.raw_unpack_pkg', _mock_func))
+    patches.append(patch('clickreviews.common.unpack_pkg_with_raw',
+                         _unpack_pkg_with_raw))
     patches.append(patch('clickreviews.common.detect_package',
                    _detect_package))
     patches.append(patch('clickreviews.sr_common.SnapReview._list_all_files',
@@ -122,6 +138,8 @@ def create_patches():
     # sr_security
     patches.append(patch("clickreviews.sr_security.SnapReviewSecurity._unsquashfs_lls",
                    _unsquashfs_lls))
+    patches.append(patch("clickreviews.sr_security.SnapReviewSecurity._squashfs_entries",
+                   _squashfs_entries))
 
     return patches
 
@@ -226,6 +244,10 @@ class TestSnapReview(TestCase):
         global TEST_UNSQUASHFS_LLS
         TEST_UNSQUASHFS_LLS = s
 
+    def set_test_squashfs_entries(self, entries):
+        global TEST_SQUASHFS_ENTRIES
+        TEST_SQUASHFS_ENTRIES = entries
+
     def setUp(self):
         '''Make sure our patches are applied everywhere'''
         patches = create_patches()
@@ -247,5 +269,7 @@ class TestSnapReview(TestCase):
         TEST_UNPACK_DIR = "/fake"
         global TEST_UNSQUASHFS_LLS
         TEST_UNSQUASHFS_LLS = ""
+        global TEST_SQUASHFS_ENTRIES
+        TEST_SQUASHFS_ENTRIES = None
 
         self._reset_test_data()
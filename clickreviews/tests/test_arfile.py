@@ -0,0 +1,67 @@
+'''test_arfile.py: tests for the arfile module'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+import io
+
+from clickreviews.arfile import ArException, iter_members
+
+
+def _ar_member(name, data, mode=0o100644):
+    fields = (name, 1234, 0, 0, mode, len(data))
+    header = ('%-16s%-12d%-6d%-6d%-8o%-10d' % fields).encode('ascii')
+    out = header + b'`\n' + data
+    if len(data) % 2:
+        out += b'\n'
+    return out
+
+
+class TestArFile(TestCase):
+    """Tests for the ar reader."""
+    def test_iter_members(self):
+        '''Test iter_members()'''
+        archive = io.BytesIO(b''.join([
+            b'!<arch>\n',
+            _ar_member('debian-binary', b'2.0\n'),
+            _ar_member('odd/', b'abc'),
+            _ar_member('data.tar.gz', b'xyz!')]))
+        seen = []
+        for member in iter_members(archive):
+            if member.name == 'odd':
+                # partially read members are skipped over
+                self.assertEqual(member.read(1), b'a')
+                seen.append((member.name, None))
+                continue
+            seen.append((member.name, member.read()))
+            self.assertEqual(member.mtime, 1234)
+            self.assertEqual(member.mode, 0o100644)
+        self.assertEqual(seen, [('debian-binary', b'2.0\n'),
+                                ('odd', None),
+                                ('data.tar.gz', b'xyz!')])
+
+    def test_iter_members_not_ar(self):
+        '''Test iter_members() - not an ar archive'''
+        with self.assertRaises(ArException):
+            list(iter_members(io.BytesIO(b'hsqs')))
+
+    def test_iter_members_truncated(self):
+        '''Test iter_members() - truncated member'''
+        archive = io.BytesIO(b''.join([
+            b'!<arch>\n',
+            _ar_member('data.tar.gz', b'xyz!')[:-2]]))
+        with self.assertRaises(ArException):
+            for member in iter_members(archive):
+                member.read()
@@ -0,0 +1,545 @@
+'''test_common.py: tests for the common module'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+from unittest.mock import patch
+import hashlib
+import io
+import os
+import shutil
+import subprocess
+import tarfile
+import tempfile
+
+import clickreviews.common as common
+from clickreviews.common import cleanup_unpack
+from clickreviews.tests import utils
+
+
+class TestPackageFS(TestCase):
+    """Tests for the on-demand package filesystem."""
+    def setUp(self):
+        self.addCleanup(cleanup_unpack)
+        super().setUp()
+
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def test_click_index(self):
+        '''Test PackageFS index of a click'''
+        package = utils.make_click(extra_files=['bin/foo', 'usr/lib/',
+                                                '/etc/passwd,bin/link'],
+                                   output_dir=self.mkdtemp())
+        fs = common.get_pkgfs(package)
+        self.assertTrue(fs.isfile('DEBIAN/control'))
+        self.assertTrue(fs.isfile('DEBIAN/manifest'))
+        self.assertTrue(fs.isfile('bin/foo'))
+        self.assertTrue(fs.isdir('usr/lib'))
+        self.assertFalse(fs.isfile('usr/lib'))
+        self.assertFalse(fs.exists('nonexistent'))
+        self.assertEqual(fs.entries()['bin/link'].type, 'l')
+        self.assertEqual(fs.entries()['bin/link'].target, '/etc/passwd')
+        self.assertEqual(sorted(fs.listdir('bin')), ['foo', 'link'])
+        # nothing was unpacked to build the index
+        self.assertEqual(common.UNPACK_DIR, None)
+
+    def test_click_extract_on_demand(self):
+        '''Test PackageFS extracts single files'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        fs = common.get_pkgfs(package)
+        fh = fs.open('DEBIAN/control')
+        self.assertTrue('Package: test\n' in fh.readlines())
+        fh.close()
+        fh = fs.open('meta/test.apparmor')
+        self.assertTrue('policy_groups' in fh.read())
+        fh.close()
+        self.assertEqual(common.UNPACK_DIR, None)
+
+    def test_click_extract_after_unpack(self):
+        '''Test PackageFS uses the unpacked tree when available'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        fs = common.get_pkgfs(package)
+        d = fs.unpack_dir()
+        self.assertEqual(fs.path('DEBIAN/control'),
+                         os.path.join(d, 'DEBIAN/control'))
+
+    def test_detect_package_click(self):
+        '''Test detect_package() - click without unpacking'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        self.assertEqual(common.detect_package(package), ('click', 1))
+        self.assertEqual(common.UNPACK_DIR, None)
+
+    def test_snap2_index(self):
+        '''Test PackageFS index of a snap'''
+        package = utils.make_snap2(output_dir=self.mkdtemp(),
+                                   extra_files=['bin/foo'])
+        fs = common.get_pkgfs(package)
+        self.assertTrue(fs.isfile('meta/snap.yaml'))
+        self.assertTrue(fs.isfile('bin/foo'))
+        self.assertTrue(fs.isdir('meta'))
+        self.assertEqual(common.detect_package(package), ('snap', 2))
+        self.assertEqual(common.UNPACK_DIR, None)
+
+    def test_click_unpack_with_raw(self):
+        '''Test unpack_pkg_with_raw() - tree and raw members in one pass'''
+        package = utils.make_click(extra_files=['bin/foo',
+                                                '/etc/passwd,bin/link'],
+                                   output_dir=self.mkdtemp())
+        (d, raw_d) = common.unpack_pkg_with_raw(package)
+        self.addCleanup(shutil.rmtree, d)
+        self.addCleanup(shutil.rmtree, raw_d)
+
+        self.assertTrue(os.path.isfile(os.path.join(d, 'DEBIAN/control')))
+        self.assertTrue(os.path.isfile(os.path.join(d, 'bin/foo')))
+        self.assertEqual(os.readlink(os.path.join(d, 'bin/link')),
+                         '/etc/passwd')
+
+        # the raw members are the same as what 'ar x' gives
+        expected = self.mkdtemp()
+        subprocess.check_call(['ar', 'x', package], cwd=expected)
+        self.assertEqual(sorted(os.listdir(raw_d)),
+                         sorted(os.listdir(expected)))
+        for f in os.listdir(expected):
+            with open(os.path.join(expected, f), 'rb') as fh:
+                data = fh.read()
+            with open(os.path.join(raw_d, f), 'rb') as fh:
+                self.assertEqual(fh.read(), data)
+
+    def test_click_unpack_single_pass(self):
+        '''Test PackageFS fills in both unpack dirs at once'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        fs = common.get_pkgfs(package)
+        d = fs.unpack_dir()
+        self.assertTrue(os.path.isdir(d))
+        self.assertTrue(os.path.isfile(os.path.join(common.RAW_UNPACK_DIR,
+                                                    'debian-binary')))
+        self.assertEqual(fs.raw_unpack_dir(), common.RAW_UNPACK_DIR)
+
+    def test_unpack_rejects_traversal(self):
+        '''Test unpacking refuses members outside of the package'''
+        output_dir = self.mkdtemp()
+        data = os.path.join(output_dir, 'data.tar.gz')
+        with tarfile.open(data, 'w:gz') as tar:
+            info = tarfile.TarInfo('../escaped')
+            tar.addfile(info, io.BytesIO(b''))
+        control = os.path.join(output_dir, 'control.tar.gz')
+        with tarfile.open(control, 'w:gz') as tar:
+            pass
+        binary = os.path.join(output_dir, 'debian-binary')
+        with open(binary, 'w') as f:
+            f.write('2.0\n')
+        package = os.path.join(output_dir, 'bad.deb')
+        subprocess.check_call(['ar', 'r', package, binary, control, data],
+                              stderr=subprocess.DEVNULL)
+
+        with self.assertRaises(SystemExit):
+            common.unpack_pkg(package)
+
+    def _extract_tar(self, members):
+        '''Extract a tarball with the given (TarInfo, data) members into a
+           new directory next to a file outside of it, which the members
+           try to get to through a symlink. Return that file.'''
+        tmp = self.mkdtemp()
+        victim = os.path.join(tmp, 'victim.txt')
+        with open(victim, 'w') as f:
+            f.write('victim')
+        os.chmod(victim, 0o600)
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            info = tarfile.TarInfo('./foo')
+            info.type = tarfile.SYMTYPE
+            info.linkname = victim
+            tar.addfile(info)
+            for (info, data) in members:
+                tar.addfile(info, io.BytesIO(data) if data else None)
+        buf.seek(0)
+        with self.assertRaises(common.ReviewException):
+            common._extract_tar_stream(buf, os.path.join(tmp, 'dest'))
+        return victim
+
+    def test_unpack_rejects_file_over_symlink(self):
+        '''Test unpacking refuses a file replacing a symlink'''
+        info = tarfile.TarInfo('./foo')
+        info.size = len(b'pwned')
+        victim = self._extract_tar([(info, b'pwned')])
+        with open(victim) as f:
+            self.assertEqual(f.read(), 'victim')
+
+    def test_unpack_rejects_dir_over_symlink(self):
+        '''Test unpacking refuses a directory replacing a symlink'''
+        info = tarfile.TarInfo('foo')
+        info.type = tarfile.DIRTYPE
+        info.mode = 0o777
+        victim = self._extract_tar([(info, None)])
+        self.assertEqual(os.stat(victim).st_mode & 0o777, 0o600)
+
+    def test_unpack_rejects_hardlink_to_symlink(self):
+        '''Test unpacking refuses a hardlink to a symlink'''
+        info = tarfile.TarInfo('bar')
+        info.type = tarfile.LNKTYPE
+        info.linkname = 'foo'
+        victim = self._extract_tar([(info, None)])
+        self.assertEqual(os.stat(victim).st_nlink, 1)
+
+    def test_unpack_rejects_dotdot_through_symlink(self):
+        '''Test unpacking refuses '..' after a symlink in a member name'''
+        tmp = self.mkdtemp()
+        evil = os.path.join(tmp, 'evil')
+        os.makedirs(os.path.join(evil, 'sub'))
+        buf = io.BytesIO()
+        with tarfile.open(fileobj=buf, mode='w') as tar:
+            info = tarfile.TarInfo('a')
+            info.type = tarfile.SYMTYPE
+            info.linkname = os.path.join(evil, 'sub')
+            tar.addfile(info)
+            # normalizes to 'x', but is written to evil/x
+            info = tarfile.TarInfo('a/../x')
+            info.size = len(b'pwned')
+            tar.addfile(info, io.BytesIO(b'pwned'))
+        buf.seek(0)
+        with self.assertRaises(common.ReviewException):
+            common._extract_tar_stream(buf, os.path.join(tmp, 'dest'))
+        self.assertFalse(os.path.exists(os.path.join(evil, 'x')))
+
+    def _file_digests(self, fn):
+        with open(fn, 'rb') as f:
+            data = f.read()
+        return {'sha512': hashlib.sha512(data).hexdigest(),
+                'sha256': hashlib.sha256(data).hexdigest(),
+                'md5': hashlib.md5(data).hexdigest()}
+
+    def test_click_digests(self):
+        '''Test get_digests() - click and its members'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        digests = common.get_digests(package)
+        self.assertEqual(digests.package, self._file_digests(package))
+
+        expected = self.mkdtemp()
+        subprocess.check_call(['ar', 'x', package], cwd=expected)
+        self.assertEqual(sorted(digests.members), sorted(os.listdir(expected)))
+        for f in os.listdir(expected):
+            self.assertEqual(digests.members[f],
+                             self._file_digests(os.path.join(expected, f)))
+
+    def test_click_digests_from_unpack(self):
+        '''Test get_digests() - reuses the unpack pass'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        fs = common.get_pkgfs(package)
+        fs.unpack_dir()
+        digests = common.PKG_DIGESTS[os.path.abspath(package)]
+        self.assertIs(common.get_digests(package), digests)
+
+        # a modified package is read again
+        st = os.stat(package)
+        os.utime(package, ns=(st.st_atime_ns, st.st_mtime_ns + 1000000000))
+        self.assertIsNot(common.get_digests(package), digests)
+        self.assertEqual(common.get_digests(package).package,
+                         self._file_digests(package))
+
+    def test_snap2_digests(self):
+        '''Test get_digests() - snap'''
+        package = utils.make_snap2(output_dir=self.mkdtemp())
+        digests = common.get_digests(package)
+        self.assertEqual(digests.package, self._file_digests(package))
+        self.assertEqual(digests.members, {})
+
+    def test_click_unpack_cache(self):
+        '''Test unpacking through the unpack cache'''
+        cache_dir = self.mkdtemp()
+        common.set_unpack_cache(cache_dir)
+        self.addCleanup(common.set_unpack_cache, None)
+        package = utils.make_click(output_dir=self.mkdtemp())
+
+        fs = common.get_pkgfs(package)
+        d = fs.unpack_dir()
+        raw_d = fs.raw_unpack_dir()
+        self.assertEqual(sorted(os.listdir(cache_dir)),
+                         ['%02x%s-%s' % (common.UNPACK_FORMAT,
+                                         common.get_digests(package)
+                                         .package['sha512'], kind)
+                          for kind in ['raw', 'unpack']])
+        self.assertTrue(os.path.isfile(os.path.join(d, 'DEBIAN/control')))
+
+        # the trees are ours to remove, and the next run gets copies of
+        # the cached ones
+        cleanup_unpack()
+        self.assertFalse(os.path.exists(d))
+        self.assertFalse(os.path.exists(raw_d))
+        common.UNPACK_DIR = common.unpack_pkg(package)
+        common.RAW_UNPACK_DIR = common.raw_unpack_pkg(package)
+        self.assertFalse(common.UNPACK_DIR.startswith(cache_dir))
+        self.assertTrue(os.path.isfile(os.path.join(common.UNPACK_DIR,
+                                                    'DEBIAN/control')))
+        self.assertIn('debian-binary', os.listdir(common.RAW_UNPACK_DIR))
+
+        # unpacking to a given destination doesn't go through the cache
+        dest = os.path.join(self.mkdtemp(), 'dest')
+        self.assertEqual(common.unpack_pkg(package, dest), dest)
+
+    def _fake_snap(self):
+        '''Return a package that looks like a squashfs, along with a fake
+           unsquashfs first in PATH which records its umask instead of
+           unpacking it'''
+        output_dir = self.mkdtemp()
+        unsquashfs = os.path.join(output_dir, 'unsquashfs')
+        with open(unsquashfs, 'w') as f:
+            f.write('#!/bin/sh\numask > "$3/umask"\n')
+        os.chmod(unsquashfs, 0o775)
+        path = "%s:%s" % (output_dir, os.environ['PATH'])
+        patcher = patch.dict(os.environ, {'PATH': path})
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+        package = os.path.join(output_dir, 'test.snap')
+        with open(package, 'wb') as f:
+            f.write(b'hsqs' + b'\0' * 92)
+        return package
+
+    def test_snap_unpack_umask(self):
+        '''Test unpacking a snap doesn't let the umask alter the modes'''
+        package = self._fake_snap()
+        old_umask = os.umask(0o022)
+        try:
+            common.UNPACK_DIR = common.unpack_pkg(package)
+        finally:
+            self.assertEqual(os.umask(old_umask), 0o022)
+        with open(os.path.join(common.UNPACK_DIR, 'umask')) as f:
+            self.assertEqual(int(f.read(), 8), 0)
+        # this run unsquashfs'ed it, so it can be resquashed
+        self.assertEqual(common.get_unpacked_dir(), common.UNPACK_DIR)
+
+    def test_snap_unpack_cache_resquashed(self):
+        '''Test trees from the unpack cache are resquashed'''
+        cache_dir = self.mkdtemp()
+        common.set_unpack_cache(cache_dir)
+        self.addCleanup(common.set_unpack_cache, None)
+        package = self._fake_snap()
+
+        common.UNPACK_DIR = common.unpack_pkg(package)
+        self.assertEqual(common.get_unpacked_dir(), common.UNPACK_DIR)
+
+        # the copy from the cache is too
+        cleanup_unpack()
+        common.UNPACK_DIR = common.unpack_pkg(package)
+        self.assertFalse(common.UNPACK_DIR.startswith(cache_dir))
+        self.assertEqual(common.get_unpacked_dir(), common.UNPACK_DIR)
+        # trees cached by versions unpacking differently aren't used
+        self.assertTrue(os.listdir(cache_dir)[0].startswith(
+            '%02x' % common.UNPACK_FORMAT))
+
+        # but not the trees given by the caller
+        cleanup_unpack()
+        common.use_unpacked_dirs(self.mkdtemp())
+        self.assertIsNone(common.get_unpacked_dir())
+
+    def test_review_unpacked_dir(self):
+        '''Test Review() with an already unpacked package'''
+        output_dir = self.mkdtemp()
+        package = utils.make_click(output_dir=output_dir)
+        d = os.path.join(output_dir, 'unpacked')
+        subprocess.check_call(['dpkg-deb', '-R', package, d])
+        raw_d = os.path.join(output_dir, 'raw')
+        os.mkdir(raw_d)
+        subprocess.check_call(['ar', 'x', package], cwd=raw_d)
+
+        review = common.Review(package, 'test', unpack_dir=d,
+                               raw_unpack_dir=raw_d)
+        self.assertEqual(review.unpack_dir, d)
+        self.assertEqual(review.raw_unpack_dir, raw_d)
+        self.assertEqual(review.pkgfs.path('DEBIAN/control'),
+                         os.path.join(d, 'DEBIAN/control'))
+
+        # the caller's directories are left alone
+        cleanup_unpack()
+        self.assertTrue(os.path.isdir(d))
+        self.assertTrue(os.path.isdir(raw_d))
+
+
+class TestHashFiles(TestCase):
+    """Tests for the in-process file hashing."""
+    def setUp(self):
+        self.addCleanup(common.set_jobs, None)
+        super().setUp()
+
+    def _make_files(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        files = []
+        for i in range(10):
+            fn = os.path.join(d, 'file%d' % i)
+            with open(fn, 'wb') as f:
+                f.write(os.urandom(1024) * (i + 1))
+            files.append(fn)
+        return files
+
+    def test_hash_files(self):
+        '''Test hash_files() matches hashlib'''
+        files = self._make_files()
+        for jobs in [1, 4]:
+            common.set_jobs(jobs)
+            sums = common.hash_files(files, 'md5')
+            for fn in files:
+                with open(fn, 'rb') as f:
+                    self.assertEqual(sums[fn],
+                                     hashlib.md5(f.read()).hexdigest())
+
+    def test_hash_files_missing(self):
+        '''Test hash_files() - unreadable files'''
+        files = self._make_files()
+        sums = common.hash_files(files + ['/nonexistent',
+                                          os.path.dirname(files[0])])
+        self.assertEqual(sums['/nonexistent'], None)
+        self.assertEqual(sums[os.path.dirname(files[0])], None)
+        self.assertNotEqual(sums[files[0]], None)
+
+    def test_hash_files_stats(self):
+        '''Test hash_files() keeps count of what it hashed'''
+        files = self._make_files()
+        before = dict(common.HASH_STATS)
+        common.hash_files(files)
+        self.assertEqual(common.HASH_STATS['files'], before['files'] + 10)
+        self.assertEqual(common.HASH_STATS['bytes'],
+                         before['bytes'] + 1024 * 55)
+        self.assertGreaterEqual(common.HASH_STATS['seconds'],
+                                before['seconds'])
+
+    def test_get_sha512sum(self):
+        '''Test Review._get_sha512sum()'''
+        files = self._make_files()
+        with open(files[0], 'rb') as f:
+            expected = hashlib.sha512(f.read()).hexdigest()
+        self.assertEqual(common.Review._get_sha512sum(None, files[0]),
+                         expected)
+        self.assertEqual(common.Review._get_sha512sums(None, files)[files[0]],
+                         expected)
+
+
+class TestPackageIndex(TestCase):
+    """Tests for the shared inventory of unpacked packages."""
+    def setUp(self):
+        self.addCleanup(cleanup_unpack)
+        super().setUp()
+
+    def _make_tree(self):
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        for sub in ['bin', 'lib/sub', '.git']:
+            os.makedirs(os.path.join(d, sub))
+        for f in ['bin/app', 'lib/sub/foo.so', 'lib/foo.desktop',
+                  'app.desktop', 'README']:
+            with open(os.path.join(d, f), 'w') as fh:
+                fh.write('x' * len(f))
+        os.chmod(os.path.join(d, 'bin/app'), 0o755)
+        os.symlink('/etc/passwd', os.path.join(d, 'bin/link'))
+        os.symlink('/usr', os.path.join(d, 'usr'))
+        return d
+
+    def test_files(self):
+        '''Test PackageIndex.files() is what os.walk() gives'''
+        d = self._make_tree()
+        expected = []
+        for root, dirnames, filenames in os.walk(d):
+            for f in filenames:
+                expected.append(os.path.join(root, f))
+        self.assertEqual(common.PackageIndex(d).files(), expected)
+
+    def test_lookups(self):
+        '''Test PackageIndex lookups'''
+        d = self._make_tree()
+        index = common.PackageIndex(d)
+        self.assertEqual(index.get('lib/sub/foo.so').size, 14)
+        self.assertEqual(index.get('lib/sub').type, 'd')
+        self.assertEqual(index.get('nonexistent'), None)
+        self.assertEqual(sorted([e.path for e in
+                                 index.by_extension('.desktop')]),
+                         ['app.desktop', 'lib/foo.desktop'])
+        self.assertEqual([e.path for e in index.by_basename('foo.so')],
+                         ['lib/sub/foo.so'])
+        self.assertEqual(sorted([e.path for e in index.symlinks()]),
+                         ['bin/link', 'usr'])
+        self.assertEqual([e.target for e in
+                          index.symlinks(include_dirs=False)],
+                         ['/etc/passwd'])
+        self.assertEqual([e.path for e in index.executables()], ['bin/app'])
+        self.assertEqual(index.glob('.git*'), [os.path.join(d, '.git')])
+        self.assertEqual(sorted(index.glob('*')),
+                         sorted([os.path.join(d, f) for f in
+                                 ['bin', 'lib', 'app.desktop', 'README',
+                                  'usr']]))
+
+    def test_shared(self):
+        '''Test get_package_index() is shared until cleanup'''
+        d = self._make_tree()
+        index = common.get_package_index(d)
+        self.assertIs(common.get_package_index(d), index)
+        cleanup_unpack()
+        self.assertIsNot(common.get_package_index(d), index)
+
+    def test_missing(self):
+        '''Test PackageIndex of nothing'''
+        self.assertEqual(common.PackageIndex(None).files(), [])
+        self.assertEqual(common.PackageIndex('/nonexistent').files(), [])
+
+
+class TestPackageContext(TestCase):
+    """Tests for what the reviews of a package share."""
+    def setUp(self):
+        self.addCleanup(cleanup_unpack)
+        super().setUp()
+
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def test_pkgfmt(self):
+        '''Test PackageContext.pkgfmt'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        context = common.PackageContext(package)
+        self.assertEqual(context.pkgfmt, ('click', 1))
+
+    def test_get(self):
+        '''Test PackageContext.get() loads once and returns copies'''
+        context = common.PackageContext('/nonexistent')
+        loads = []
+
+        def load():
+            loads.append(1)
+            return {'foo': ['bar']}
+
+        d = context.get('foo', load)
+        self.assertEqual(d, {'foo': ['bar']})
+        d['foo'].append('baz')
+        self.assertEqual(context.get('foo', load), {'foo': ['bar']})
+        self.assertEqual(len(loads), 1)
+
+    def test_reviews_share_context(self):
+        '''Test the manifest is only parsed once for all the reviews'''
+        from clickreviews import cr_common, cr_desktop, cr_lint
+        package = utils.make_click(output_dir=self.mkdtemp())
+        context = common.PackageContext(package)
+        orig = cr_common.ClickReview._load_manifest_file
+        with patch.object(cr_common.ClickReview, '_load_manifest_file',
+                          autospec=True, side_effect=orig) as mock_load:
+            lint = cr_lint.ClickReviewLint(package, context=context)
+            desktop = cr_desktop.ClickReviewDesktop(package, context=context)
+        self.assertEqual(mock_load.call_count, 1)
+        self.assertEqual(lint.manifest, desktop.manifest)
+        self.assertIsNot(lint.manifest, desktop.manifest)
@@ -23,6 +23,7 @@ from clickreviews.cr_lint import MINIMUM_CLICK_FRAMEWORK_VERSION
 from clickreviews.tests import utils
 import clickreviews.cr_tests as cr_tests
 
+import hashlib
 import os
 import shutil
 import stat
@@ -248,6 +249,23 @@ class TestClickReviewLint(cr_tests.TestClickReview):
         expected_counts = {'info': None, 'warn': 0, 'error': 0}
         self.check_results(r, expected_counts)
 
+    def test_check_architecture_specified_needed_mismatch(self):
+        '''Test check_architecture_specified_needed() - other arch'''
+        self.set_test_control("Architecture", "armhf")
+        self.set_test_manifest("architecture", "armhf")
+        c = ClickReviewLint(self.test_name)
+        c.pkg_arch = ['armhf']
+        c.pkg_bin_files = ["path/to/some/compiled/binary"]
+        c.pkg_bin_arches = {"path/to/some/compiled/binary": "amd64"}
+        c.check_architecture_specified_needed()
+        r = c.click_report
+        expected_counts = {'info': None, 'warn': 1, 'error': 0}
+        self.check_results(r, expected_counts)
+        name = c._get_check_name('architecture_specified_needed')
+        self.assertEqual(r['warn'][name]['text'],
+                         "Could not find compiled binaries for architecture "
+                         "'armhf' (found: amd64)")
+
     def test_check_manifest_missing_arch(self):
         '''Test check_manifest_architecture() (missing)'''
         self.set_test_manifest("architecture", None)
@@ -1694,6 +1712,18 @@ class TestClickReviewLint(cr_tests.TestClickReview):
         expected_counts = {'info': 4, 'warn': 0, 'error': 0}
         self.check_results(r, expected_counts)
 
+    def test_check_snappy_hashes_archive_files_malformed_entry(self):
+        '''Test check_snappy_hashes() - malformed entry after valid ones'''
+        self.set_test_pkgfmt("snap", "15.04")
+        c = ClickReviewLint(self.test_name)
+        yaml = self._create_hashes_yaml()
+        c.pkg_files = self._test_pkg_files
+        self.set_test_hashes_yaml(yaml)
+        # 'files' is the last key, so this is its last entry
+        cr_tests.TEST_HASHES_YAML += "-   {name: b, when: 2020-13-45}\n"
+        with self.assertRaises(SystemExit):
+            c.check_snappy_hashes()
+
     def test_check_snappy_hashes_1504(self):
         '''Test check_snappy_hashes() - 15.04'''
         self.set_test_pkgfmt("snap", "15.04")
@@ -1994,3 +2024,91 @@ class ClickReviewLintTestCase(TestCase):
 
         errors = list(c.click_report['error'].keys())
         self.assertEqual(errors, ['lint:dot_click'])
+
+    def _write_md5sums(self, c, files, bad=None):
+        '''Write a md5sums file for files in c.unpack_dir'''
+        md5sums = os.path.join(self.mkdtemp(), 'md5sums')
+        with open(md5sums, 'w') as f:
+            for fn in files:
+                digest = 'deadbeef'
+                if fn != bad:
+                    with open(os.path.join(c.unpack_dir, fn), 'rb') as fh:
+                        digest = hashlib.md5(fh.read()).hexdigest()
+                f.write("%s  %s\n" % (digest, fn))
+        c.control_files['md5sums'] = md5sums
+
+    def test_check_md5sums(self):
+        '''Test check_md5sums()'''
+        package = utils.make_click(extra_files=['bin/foo'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+        self._write_md5sums(c, ['bin/foo', 'meta/test.apparmor'])
+        curdir = os.getcwd()
+
+        c.check_md5sums()
+        self.assertEqual(os.getcwd(), curdir)
+        self.assertEqual(c.click_report['error'], {})
+        self.assertEqual(c.click_report['info']['lint:md5sums']['text'], 'OK')
+
+    def test_check_md5sums_bad(self):
+        '''Test check_md5sums() - bad and missing files'''
+        package = utils.make_click(extra_files=['bin/foo'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+        self._write_md5sums(c, ['bin/foo', 'meta/test.apparmor'],
+                            bad='bin/foo')
+        with open(c.control_files['md5sums'], 'a') as f:
+            f.write("deadbeef  nonexistent\n")
+
+        c.check_md5sums()
+        self.assertEqual(c.click_report['error']['lint:md5sums']['text'],
+                         'found bad checksums: bin/foo, nonexistent')
+
+    def test_extract_file(self):
+        '''Test _extract_file() - relative and unpacked paths'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+        with c._extract_file('DEBIAN/control') as f:
+            control = f.read()
+        fn = os.path.join(c.unpack_dir, 'DEBIAN/control')
+        with c._extract_file(fn) as f:
+            self.assertEqual(f.read(), control)
+
+    def test_list_all_compiled_binaries(self):
+        '''Test _list_all_compiled_binaries()'''
+        package = utils.make_click(extra_files=['/bin/ls:bin/ls',
+                                                '/bin/ls,bin/link',
+                                                'share/foo.mo'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+        ls = os.path.join(c.unpack_dir, 'bin/ls')
+        self.assertEqual(c.pkg_bin_files, [ls])
+        self.assertIn(ls, c.pkg_bin_arches)
+
+    def test_check_contents_for_hardcoded_paths(self):
+        '''Test check_contents_for_hardcoded_paths()'''
+        # binaries may mention the path and empty files are fine
+        src = os.path.join(self.mkdtemp(), 'binary')
+        with open(src, 'wb') as f:
+            f.write(b'\x7fELF\x00\x01\x02/opt/click.ubuntu.com/\xff\xfe\x00')
+        package = utils.make_click(extra_files=['%s:binary' % src, 'empty'],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+
+        c.check_contents_for_hardcoded_paths()
+        self.assertEqual(c.click_report['error'], {})
+
+    def test_check_contents_for_hardcoded_paths_found(self):
+        '''Test check_contents_for_hardcoded_paths() - found in text'''
+        src = os.path.join(self.mkdtemp(), 'run.sh')
+        with open(src, 'w') as f:
+            f.write('#!/bin/sh\nexec /opt/click.ubuntu.com/foo/bin/foo\n')
+        package = utils.make_click(extra_files=['%s:run.sh' % src],
+                                   output_dir=self.mkdtemp())
+        c = ClickReviewLint(package)
+        fn = os.path.join(c.unpack_dir, 'run.sh')
+
+        c.check_contents_for_hardcoded_paths()
+        self.assertEqual(
+            c.click_report['error']['lint:hardcoded_paths']['text'],
+            "Hardcoded path '/opt/click.ubuntu.com/' found in '%s'." % fn)
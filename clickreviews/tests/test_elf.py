@@ -0,0 +1,91 @@
+'''test_elf.py: tests for the elf module'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+import os
+import shutil
+import struct
+import tempfile
+
+import clickreviews.elf as elf
+
+
+def _elf_header(elfclass, data, type, machine):
+    fmt = '<HH' if data == elf.ELFDATA2LSB else '>HH'
+    return elf.ELF_MAGIC + bytes([elfclass, data, 1]) + b'\0' * 9 + \
+        struct.pack(fmt, type, machine) + b'\0' * 44
+
+
+class TestElf(TestCase):
+    """Tests for the ELF header classifier."""
+    def test_parse_header(self):
+        '''Test parse_header()'''
+        header = elf.parse_header(_elf_header(elf.ELFCLASS64, elf.ELFDATA2LSB,
+                                              elf.ET_DYN, elf.EM_AARCH64))
+        self.assertEqual(header.elfclass, elf.ELFCLASS64)
+        self.assertEqual(header.type, elf.ET_DYN)
+        self.assertEqual(header.machine, elf.EM_AARCH64)
+        self.assertTrue(elf.is_binary(header))
+        self.assertEqual(elf.get_architecture(header), 'arm64')
+
+    def test_parse_header_big_endian(self):
+        '''Test parse_header() - big endian'''
+        header = elf.parse_header(_elf_header(elf.ELFCLASS64, elf.ELFDATA2MSB,
+                                              elf.ET_EXEC, elf.EM_S390))
+        self.assertEqual(header.machine, elf.EM_S390)
+        self.assertEqual(elf.get_architecture(header), 's390x')
+
+    def test_architectures(self):
+        '''Test get_architecture()'''
+        for (elfclass, data, machine, arch) in [
+                (elf.ELFCLASS32, elf.ELFDATA2LSB, elf.EM_ARM, 'armhf'),
+                (elf.ELFCLASS32, elf.ELFDATA2LSB, elf.EM_386, 'i386'),
+                (elf.ELFCLASS64, elf.ELFDATA2LSB, elf.EM_X86_64, 'amd64'),
+                (elf.ELFCLASS64, elf.ELFDATA2LSB, elf.EM_PPC64, 'ppc64el'),
+                (elf.ELFCLASS64, elf.ELFDATA2LSB, 0xffff, None)]:
+            header = elf.parse_header(_elf_header(elfclass, data, elf.ET_EXEC,
+                                                  machine))
+            self.assertEqual(elf.get_architecture(header), arch)
+
+    def test_not_binary(self):
+        '''Test is_binary() - not executable, library or object'''
+        ET_CORE = 4
+        header = elf.parse_header(_elf_header(elf.ELFCLASS64, elf.ELFDATA2LSB,
+                                              ET_CORE, elf.EM_X86_64))
+        self.assertFalse(elf.is_binary(header))
+        self.assertFalse(elf.is_binary(None))
+
+    def test_parse_header_not_elf(self):
+        '''Test parse_header() - not ELF'''
+        self.assertEqual(elf.parse_header(b''), None)
+        self.assertEqual(elf.parse_header(b'\x7fELF'), None)
+        self.assertEqual(elf.parse_header(b'#!/bin/sh\n' + b'\0' * 54), None)
+        self.assertEqual(elf.parse_header(b'\x7fELF\x03\x01' + b'\0' * 58),
+                         None)
+
+    def test_read_header(self):
+        '''Test read_header()'''
+        d = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, d)
+        fn = os.path.join(d, 'lib.so')
+        with open(fn, 'wb') as f:
+            f.write(_elf_header(elf.ELFCLASS32, elf.ELFDATA2LSB, elf.ET_DYN,
+                                elf.EM_ARM) + b'\0' * 1024)
+        self.assertEqual(elf.read_header(fn),
+                         (elf.ELFCLASS32, elf.ELFDATA2LSB, elf.ET_DYN,
+                          elf.EM_ARM))
+        self.assertEqual(elf.read_header(os.path.join(d, 'nonexistent')),
+                         None)
@@ -1,6 +1,13 @@
-from clickreviews import modules, cr_tests
+from unittest import TestCase
+from unittest.mock import patch
+from clickreviews import common, modules, cr_tests
+from clickreviews.common import cleanup_unpack
+from clickreviews.tests import utils
 import clickreviews
 import glob
+import os
+import shutil
+import tempfile
 
 
 class TestModules(cr_tests.TestClickReview):
@@ -28,3 +35,111 @@ class TestModules(cr_tests.TestClickReview):
         self.assertEqual(count, len(self.modules),
                          'Not all files in clickreviews/[cs]r_*.py contain '
                          'classes named Click|Snap*Review.')
+
+
+class TestModulesNoMock(TestCase):
+    '''Tests without mocks where they are not needed.'''
+    def setUp(self):
+        self.addCleanup(cleanup_unpack)
+        super().setUp()
+
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def _unpack(self, package):
+        '''Unpack package like click-review does before starting workers'''
+        pkgfs = common.get_pkgfs(package)
+        dirs = (pkgfs.unpack_dir(), pkgfs.raw_unpack_dir())
+        for d in dirs:
+            # shared with the workers, so this test owns them
+            self.addCleanup(common.recursive_rm, d)
+            self.addCleanup(common.PROVIDED_DIRS.discard, d)
+        return dirs
+
+    def test_run_checks_in_worker(self):
+        '''Test run_checks_in_worker() matches running the checks here'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        review = modules.init_main_class('cr_lint', package)
+        review.do_checks()
+        cleanup_unpack()
+
+        (unpack_dir, raw_unpack_dir) = self._unpack(package)
+        (report, tb) = modules.run_checks_in_worker('cr_lint', package, None,
+                                                    unpack_dir,
+                                                    raw_unpack_dir)
+        self.assertEqual(tb, None)
+        self.assertEqual(report, review.click_report)
+        # the shared trees are left to their owner
+        self.assertTrue(os.path.isdir(unpack_dir))
+        self.assertTrue(os.path.isdir(raw_unpack_dir))
+
+    def test_run_checks_in_worker_exception(self):
+        '''Test run_checks_in_worker() - exception'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        (unpack_dir, raw_unpack_dir) = self._unpack(package)
+        (report, tb) = modules.run_checks_in_worker('cr_lint', package, 1,
+                                                    unpack_dir,
+                                                    raw_unpack_dir)
+        self.assertEqual(report, None)
+        self.assertIn('Traceback', tb)
+
+    def test_find_main_class_cached(self):
+        '''Test find_main_class() loads each module once'''
+        self.assertIs(modules.find_main_class('cr_lint'),
+                      modules.find_main_class('cr_lint'))
+
+    def test_find_main_class_imported(self):
+        '''Test find_main_class() uses the imported module'''
+        from clickreviews import cr_lint
+        self.assertIs(modules.find_main_class('cr_lint'),
+                      cr_lint.ClickReviewLint)
+
+    def test_get_review_classes(self):
+        '''Test get_review_classes()'''
+        review_classes = modules.get_review_classes()
+        self.assertEqual(list(review_classes), modules.get_modules())
+        self.assertIs(review_classes['sr_lint'],
+                      modules.find_main_class('sr_lint'))
+
+    def test_skips_package(self):
+        '''Test skips_package()'''
+        self.assertFalse(modules.skips_package('cr_lint', ('click', 1)))
+        self.assertFalse(modules.skips_package('cr_lint', ('snap', 1)))
+        self.assertTrue(modules.skips_package('cr_lint', ('snap', 2)))
+        self.assertTrue(modules.skips_package('sr_lint', ('click', 1)))
+        self.assertFalse(modules.skips_package('sr_lint', ('snap', 2)))
+
+    def test_section_name(self):
+        '''Test section_name()'''
+        self.assertEqual(modules.section_name('cr_lint'),
+                         'click,snap.v1_lint')
+        self.assertEqual(modules.section_name('sr_security'),
+                         'snap.v2_security')
+
+    def test_review_package(self):
+        '''Test review_package()'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        review = modules.init_main_class('cr_lint', package)
+        review.do_checks()
+        cleanup_unpack()
+
+        (results, tracebacks) = modules.review_package(package)
+        self.assertEqual(tracebacks, [])
+        self.assertEqual(results['click,snap.v1_lint'], review.click_report)
+        # snap.v2 modules don't check clicks
+        self.assertEqual(results['snap.v2_lint'],
+                         {'info': {}, 'warn': {}, 'error': {}})
+
+    def test_review_package_skips_other_formats(self):
+        '''Test review_package() doesn't instantiate snap.v2 modules for
+           clicks'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        with patch('clickreviews.sr_common.SnapReview.__init__',
+                   side_effect=AssertionError('instantiated')):
+            (results, tracebacks) = modules.review_package(package)
+        self.assertEqual(tracebacks, [])
+        self.assertEqual(results['snap.v2_security'], modules.empty_report())
+        self.assertEqual(common.UNPACK_DIR, None)
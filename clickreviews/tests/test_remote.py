@@ -1,8 +1,16 @@
+import os
+import shutil
+import tempfile
 import time
 from unittest import TestCase
 from unittest.mock import patch
 
-from clickreviews.remote import UPDATE_INTERVAL, _update_is_necessary
+from clickreviews import remote
+from clickreviews.remote import (
+    UPDATE_INTERVAL,
+    _update_is_necessary,
+    read_cr_file,
+)
 
 
 class RemoteTestCase(TestCase):
@@ -17,6 +25,28 @@ class RemoteTestCase(TestCase):
         self.mock_time.return_value = now
         self.addCleanup(p.stop)
 
+    def mkdtemp(self):
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def patch_compiled_dir(self):
+        '''Compile to a temporary dir, starting with nothing parsed'''
+        compiled_dir = os.path.join(self.mkdtemp(), 'compiled')
+        p = patch('clickreviews.remote.COMPILED_DIR', compiled_dir)
+        p.start()
+        self.addCleanup(p.stop)
+        p = patch.dict('clickreviews.remote._PARSED', clear=True)
+        p.start()
+        self.addCleanup(p.stop)
+        return compiled_dir
+
+    def write_data(self, contents, name='data.yaml'):
+        fn = os.path.join(self.mkdtemp(), name)
+        with open(fn, 'w') as f:
+            f.write(contents)
+        return fn
+
     def test_no_update_needed(self):
         now = time.time()
         self.patch_time(now)
@@ -36,3 +66,113 @@ class RemoteTestCase(TestCase):
         self.mock_path.getmtime.return_value = now - UPDATE_INTERVAL - 10
 
         self.assertTrue(_update_is_necessary('some-file'))
+
+    def test_read_cr_file_local_copy_cached(self):
+        '''Test read_cr_file() parses an unchanged local copy once'''
+        self.patch_compiled_dir()
+        fn = self.write_data('{"foo": ["bar"]}', 'data.json')
+
+        d = read_cr_file(None, None, local_copy_fn=fn)
+        self.assertEqual(d, {'foo': ['bar']})
+        # callers get their own copy
+        d['foo'].append('baz')
+        with patch('clickreviews.remote.json.loads') as mock_loads:
+            self.assertEqual(read_cr_file(None, None, local_copy_fn=fn),
+                             {'foo': ['bar']})
+            self.assertFalse(mock_loads.called)
+
+        # parsed again once changed
+        with open(fn, 'w') as f:
+            f.write('{"foo": ["bar", "norf"]}')
+        self.assertEqual(read_cr_file(None, None, local_copy_fn=fn),
+                         {'foo': ['bar', 'norf']})
+
+    def test_read_cr_file_compiled(self):
+        '''Test read_cr_file() uses what another process compiled'''
+        compiled_dir = self.patch_compiled_dir()
+        fn = self.write_data('foo:\n  - bar\n')
+        self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                      as_yaml=True), {'foo': ['bar']})
+        self.assertEqual(len(os.listdir(compiled_dir)), 1)
+
+        remote._PARSED.clear()  # as in a new process
+        with patch('clickreviews.remote.yaml_loader.safe_load') as mock_load:
+            self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                          as_yaml=True), {'foo': ['bar']})
+            self.assertFalse(mock_load.called)
+
+    def test_read_cr_file_compiled_changed(self):
+        '''Test read_cr_file() compiles a changed file again'''
+        compiled_dir = self.patch_compiled_dir()
+        fn = self.write_data('foo:\n  - bar\n')
+        read_cr_file(None, None, local_copy_fn=fn, as_yaml=True)
+        with open(fn, 'w') as f:
+            f.write('foo:\n  - norf\n')
+
+        remote._PARSED.clear()
+        self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                      as_yaml=True), {'foo': ['norf']})
+        # only the latest version is kept
+        self.assertEqual(len(os.listdir(compiled_dir)), 1)
+
+    def test_read_cr_file_compiled_corrupt(self):
+        '''Test read_cr_file() ignores unusable compiled files'''
+        compiled_dir = self.patch_compiled_dir()
+        fn = self.write_data('foo:\n  - bar\n')
+        read_cr_file(None, None, local_copy_fn=fn, as_yaml=True)
+        for f in os.listdir(compiled_dir):
+            with open(os.path.join(compiled_dir, f), 'wb') as fh:
+                fh.write(b'garbage')
+
+        remote._PARSED.clear()
+        self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                      as_yaml=True), {'foo': ['bar']})
+
+    def test_read_cr_file_compiled_unwritable(self):
+        '''Test read_cr_file() without a usable COMPILED_DIR'''
+        compiled_dir = self.patch_compiled_dir()
+        # a file where the directory should be
+        with open(compiled_dir, 'w') as f:
+            f.write('')
+        fn = self.write_data('foo:\n  - bar\n')
+        self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                      as_yaml=True), {'foo': ['bar']})
+
+    def test_read_cr_file_compiled_untrusted(self):
+        '''Test read_cr_file() ignores a COMPILED_DIR others can write to'''
+        compiled_dir = self.patch_compiled_dir()
+        fn = self.write_data('foo:\n  - bar\n')
+        read_cr_file(None, None, local_copy_fn=fn, as_yaml=True)
+        compiled = os.listdir(compiled_dir)
+        self.assertEqual(os.stat(compiled_dir).st_mode & 0o777, 0o700)
+        os.chmod(compiled_dir, 0o777)
+
+        remote._PARSED.clear()
+        with patch('clickreviews.remote.yaml_loader.safe_load',
+                   return_value={'foo': ['bar']}) as mock_load:
+            self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                          as_yaml=True), {'foo': ['bar']})
+            self.assertTrue(mock_load.called)
+        # nor written to
+        self.assertEqual(os.listdir(compiled_dir), compiled)
+
+    def test_read_cr_file_compiled_rename_fails(self):
+        '''Test read_cr_file() doesn't leave temporary files behind'''
+        compiled_dir = self.patch_compiled_dir()
+        fn = self.write_data('foo:\n  - bar\n')
+        with patch('clickreviews.remote.os.rename',
+                   side_effect=OSError('no')):
+            self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                          as_yaml=True), {'foo': ['bar']})
+        self.assertEqual(os.listdir(compiled_dir), [])
+
+    def test_read_cr_file_not_marshallable(self):
+        '''Test read_cr_file() with data marshal can't store'''
+        compiled_dir = self.patch_compiled_dir()
+        fn = self.write_data('when: 2018-01-01 00:00:00\n')
+        d = read_cr_file(None, None, local_copy_fn=fn, as_yaml=True)
+        self.assertEqual(d['when'].year, 2018)
+        d['when'] = None
+        self.assertEqual(read_cr_file(None, None, local_copy_fn=fn,
+                                      as_yaml=True)['when'].year, 2018)
+        self.assertEqual(os.listdir(compiled_dir), [])
@@ -0,0 +1,60 @@
+'''test_show_files.py: tests for the show_files module'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+import contextlib
+import io
+import shutil
+import tempfile
+
+from clickreviews import common
+from clickreviews import show_files
+from clickreviews.tests import utils
+
+
+class TestShowFiles(TestCase):
+    '''Tests for the show_files module.'''
+    def setUp(self):
+        self.addCleanup(common.cleanup_unpack)
+        super().setUp()
+
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def _show_files(self, package, context=None):
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            show_files.show_files(package, context=context)
+        return out.getvalue()
+
+    def test_show_files_click(self):
+        '''Test show_files() - click'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        out = self._show_files(package)
+        for section in ['control', 'manifest', 'hooks']:
+            self.assertIn('= %s =\n' % section, out)
+        self.assertNotIn('= snap.yaml =', out)
+
+    def test_show_files_context(self):
+        '''Test show_files() leaves the package unpacked for the caller'''
+        package = utils.make_click(output_dir=self.mkdtemp())
+        context = common.PackageContext(package)
+        out = self._show_files(package, context=context)
+        self.assertEqual(self._show_files(package, context=context), out)
+        self.assertNotEqual(common.UNPACK_DIR, None)
@@ -0,0 +1,85 @@
+'''test_squashfs.py: tests for the squashfs module'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+import os
+import shutil
+import stat
+import tempfile
+
+import clickreviews.squashfs as squashfs
+from clickreviews.squashfs import SquashfsException
+from clickreviews.tests import utils
+
+
+class TestSquashfs(TestCase):
+    """Tests for the squashfs reader."""
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def test_list_entries(self):
+        '''Test list_entries()'''
+        package = utils.make_snap2(output_dir=self.mkdtemp(),
+                                   extra_files=['bin/foo',
+                                                'usr/lib/',
+                                                '/etc/passwd,bin/link'])
+        entries = squashfs.list_entries(package)
+        paths = [e.path for e in entries]
+        self.assertEqual(paths[0], '.')
+        for p in ['./bin', './bin/foo', './bin/link', './meta',
+                  './meta/icon.png', './meta/snap.yaml', './usr',
+                  './usr/lib']:
+            self.assertTrue(p in paths, "Could not find '%s'" % p)
+        # same order as 'unsquashfs -lls'
+        self.assertLess(paths.index('./bin/link'),
+                        paths.index('./meta/icon.png'))
+
+        by_path = dict((e.path, e) for e in entries)
+        self.assertEqual(by_path['./bin'].type, 'd')
+        self.assertTrue(stat.S_ISDIR(by_path['./bin'].mode))
+        self.assertEqual(by_path['./bin/foo'].type, '-')
+        self.assertEqual(by_path['./bin/foo'].size, 0)
+        self.assertEqual(by_path['./bin/link'].type, 'l')
+        self.assertEqual(by_path['./bin/link'].target, '/etc/passwd')
+        icon = by_path['./meta/icon.png']
+        self.assertEqual(icon.size, os.path.getsize(
+            os.path.join(os.getcwd(), 'clickreviews/data/icon.png')))
+        # MKSQUASHFS_OPTS has -all-root
+        for e in entries:
+            self.assertEqual(e.uid, 0)
+            self.assertEqual(e.gid, 0)
+
+    def test_list_entries_not_squashfs(self):
+        '''Test list_entries() - not a squashfs'''
+        fn = os.path.join(self.mkdtemp(), 'foo.snap')
+        with open(fn, 'wb') as f:
+            f.write(b'\0' * 4096)
+        self.assertRaises(SquashfsException, squashfs.list_entries, fn)
+
+    def test_list_entries_truncated(self):
+        '''Test list_entries() - truncated superblock'''
+        fn = os.path.join(self.mkdtemp(), 'foo.snap')
+        with open(fn, 'wb') as f:
+            f.write(b'hsqs')
+        self.assertRaises(SquashfsException, squashfs.list_entries, fn)
+
+    def test_list_entries_missing(self):
+        '''Test list_entries() - missing file'''
+        fn = os.path.join(self.mkdtemp(), 'nonexistent.snap')
+        self.assertRaises(SquashfsException, squashfs.list_entries, fn)
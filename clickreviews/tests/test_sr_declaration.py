@@ -15,7 +15,9 @@
 # along with this program.  If not, see <http://www.gnu.org/licenses/>.
 
 from clickreviews.sr_declaration import SnapReviewDeclaration, SnapDeclarationException
+import clickreviews.sr_declaration as sr_declaration
 import clickreviews.sr_tests as sr_tests
+from unittest.mock import MagicMock, patch
 import yaml
 
 
@@ -1384,8 +1386,230 @@ slots:
 
         (decls, has_alt) = c._get_all_combinations(iface)
         self.assertTrue(has_alt)
-        self.assertTrue(len(decls['base']) == 0)
-        self.assertTrue(len(decls['snap']) == 8)
+        self.assertTrue(len(list(c._expand(c.base_declaration, iface))) == 0)
+        self.assertTrue(len(list(c._expand(c.snap_declaration, iface))) == 8)
+        # nothing to pair the snap declarations with
+        self.assertEqual(list(decls), [])
+
+        base = {
+            'slots': {
+                iface: {
+                    'allow-installation': [True, False],
+                }
+            },
+        }
+        self._set_base_declaration(c, base)
+        (decls, has_alt) = c._get_all_combinations(iface)
+        self.assertTrue(has_alt)
+        decls = list(decls)
+        self.assertEqual(len(decls), 16)
+        self.assertEqual(decls[0], (
+            {'slots': {iface: {'allow-installation': True}}},
+            {'slots': {iface: {'foo': '1', 'bar': '2', 'baz': '4',
+                               'norf': '5'}},
+             'plugs': {iface: {'qux': '7', 'quux': '8'}}}))
+        self.assertEqual(decls[-1], (
+            {'slots': {iface: {'allow-installation': False}}},
+            {'slots': {iface: {'foo': '1', 'bar': '3', 'baz': '4',
+                               'norf': '6'}},
+             'plugs': {iface: {'qux': '7', 'quux': '9'}}}))
+
+    def test__get_all_combinations_no_snap_declaration(self):
+        '''Test _get_all_combinations() - no snap declaration'''
+        c = SnapReviewDeclaration(self.test_name)
+        iface = 'someiface'
+        base = {
+            'plugs': {
+                iface: {
+                    'allow-connection': True,
+                }
+            },
+            'slots': {
+                iface: {
+                    'allow-installation': [True, False],
+                }
+            },
+        }
+        self._set_base_declaration(c, base)
+        c.snap_declaration = None
+
+        (decls, has_alt) = c._get_all_combinations(iface)
+        self.assertTrue(has_alt)
+        self.assertEqual(list(decls), [
+            ({'plugs': {iface: {'allow-connection': True}},
+              'slots': {iface: {'allow-installation': True}}}, None),
+            ({'plugs': {iface: {'allow-connection': True}},
+              'slots': {iface: {'allow-installation': False}}}, None),
+        ])
+
+    def test__get_all_combinations_lazy(self):
+        '''Test _get_all_combinations() only expands what is used'''
+        c = SnapReviewDeclaration(self.test_name)
+        iface = 'someiface'
+        # 100^4 combinations
+        alternates = [str(i) for i in range(100)]
+        base = {
+            'plugs': {
+                iface: {
+                    'a': alternates,
+                    'b': alternates,
+                }
+            },
+            'slots': {
+                iface: {
+                    'c': alternates,
+                    'd': alternates,
+                }
+            },
+        }
+        self._set_base_declaration(c, base)
+        c.snap_declaration = None
+
+        (decls, has_alt) = c._get_all_combinations(iface)
+        self.assertTrue(has_alt)
+        self.assertEqual(next(decls), (
+            {'plugs': {iface: {'a': '0', 'b': '0'}},
+             'slots': {iface: {'c': '0', 'd': '0'}}}, None))
+        self.assertEqual(next(decls), (
+            {'plugs': {iface: {'a': '0', 'b': '0'}},
+             'slots': {iface: {'c': '0', 'd': '1'}}}, None))
+
+    def test__compile_iface(self):
+        '''Test _compile_iface()'''
+        c = SnapReviewDeclaration(self.test_name)
+        iface = 'someiface'
+        base = {
+            'plugs': {},
+            'slots': {
+                iface: {
+                    'allow-installation': [True, False],
+                    'deny-connection': True,
+                }
+            },
+        }
+        self._set_base_declaration(c, base)
+        snap = {
+            'plugs': {
+                iface: {
+                    'allow-connection': True,
+                }
+            },
+        }
+        c.snap_declaration = snap
+
+        (tables, has_alt) = c._compile_iface(iface)
+        self.assertTrue(has_alt)
+        self.assertEqual(len(tables), 2)
+        for (table, allowed) in zip(tables, [True, False]):
+            # the base declaration for the slots side, both sides for
+            # connection of the plugs side from the snap declaration
+            (cstrs, ocstrs, base_decl, decl_type) = \
+                table[('slots', 'installation')]
+            self.assertEqual(cstrs, {'allow-installation': allowed,
+                                     'deny-connection': True})
+            self.assertEqual(ocstrs, {})
+            self.assertTrue(base_decl)
+            self.assertEqual(decl_type, 'base')
+            (cstrs, ocstrs, base_decl, decl_type) = \
+                table[('plugs', 'connection')]
+            self.assertEqual(cstrs, snap['plugs'][iface])
+            self.assertEqual(ocstrs, {})
+            self.assertFalse(base_decl)
+            self.assertEqual(decl_type, 'snap')
+
+        # compiled once per review and per declarations
+        self.assertIs(c._compile_iface(iface)[0], tables)
+        c.snap_declaration = None
+        self.assertIsNot(c._compile_iface(iface)[0], tables)
+
+        # other reviews with the same declarations compile their own
+        c2 = SnapReviewDeclaration(self.test_name)
+        self._set_base_declaration(c2, base)
+        c2.snap_declaration = snap
+        self.assertIsNot(c2._compile_iface(iface)[0], tables)
+
+    def test__match_regex(self):
+        '''Test _match() with a regex'''
+        c = SnapReviewDeclaration(self.test_name)
+        self.assertTrue(c._match('foo|ba.', 'bar'))
+        self.assertTrue(c._match('foo|ba.', 'foo'))
+        self.assertFalse(c._match('foo|ba.', 'foobar'))
+        self.assertFalse(c._match('foo|ba.', 'xbar'))
+
+    def test__match_regex_bounded(self):
+        '''Test _match() doesn't keep every regex compiled'''
+        c = SnapReviewDeclaration(self.test_name)
+        with patch.dict(sr_declaration._MATCH_RES, clear=True), \
+                patch.object(sr_declaration, '_MATCH_RES_MAX', 2):
+            for i in range(5):
+                self.assertTrue(c._match('foo%d|ba.' % i, 'foo%d' % i))
+                self.assertLessEqual(len(sr_declaration._MATCH_RES), 2)
+            self.assertTrue(c._match('foo0|ba.', 'bar'))
+
+    def test_check_declaration_alternates_discard_staged(self):
+        '''Test check_declaration - alternates don't report for others'''
+        # checked in this order
+        slots = {'iface-bar': {'interface': 'bar'},
+                 'iface-foo': {'interface': 'foo'}}
+        self.set_test_snap_yaml("slots", slots)
+        c = SnapReviewDeclaration(self.test_name)
+        base = {
+            'slots': {
+                # the second alternate isn't an exact denial, so this
+                # doesn't require manual review
+                'bar': {
+                    'allow-installation': [
+                        False,
+                        {'slot-snap-type': ['app']},
+                    ],
+                    'deny-connection': True,
+                },
+                'foo': {
+                    'deny-installation': True,
+                },
+            },
+        }
+        self._set_base_declaration(c, base)
+        c.check_declaration()
+        r = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 1}
+        self.check_results(r, expected_counts)
+
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'declaration-snap-v2:slots:iface-bar:bar'
+        expected['info'][name] = {"text": "OK"}
+        name = 'declaration-snap-v2:slots_deny-installation:iface-foo:foo'
+        expected['error'][name] = {"text": "human review required due to 'deny-installation' constraint from base declaration"}
+        self.check_results(r, expected=expected)
+
+    def test_check_declaration_alternates_short_circuit(self):
+        '''Test check_declaration - alternates stop at first passing'''
+        slots = {'iface-foo': {'interface': 'foo'}}
+        self.set_test_snap_yaml("slots", slots)
+        c = SnapReviewDeclaration(self.test_name)
+        # 10^5 combinations, but the first one passes
+        base = {
+            'slots': {
+                'foo': {
+                    'allow-installation': [{'slot-snap-type': ['app']}] * 10,
+                    'allow-connection': [True] * 10,
+                    'deny-connection': [True] * 10,
+                    'allow-auto-connection': [True] * 10,
+                    'deny-auto-connection': [True] * 10,
+                },
+            },
+        }
+        self._set_base_declaration(c, base)
+        c._verify_iface_by_declaration = \
+            MagicMock(wraps=c._verify_iface_by_declaration)
+        c.check_declaration()
+        r = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(r, expected_counts)
+        self.assertEqual(c._verify_iface_by_declaration.call_count, 1)
 
     def test_check_declaration_unknown_interface(self):
         '''Test check_declaration - unknown interface'''
@@ -1442,6 +1666,84 @@ slots:
         expected['error'][name] = {"text": "interface 'bar' not found in base declaration"}
         self.check_results(r, expected=expected)
 
+    def test_check_declaration_apps_same_interface(self):
+        '''Test check_declaration - apps - same interface evaluated once'''
+        apps = {'app1': {'plugs': ['foo', 'bar']},
+                'app2': {'plugs': ['foo']},
+                'app3': {'plugs': ['bar', 'foo']}}
+        self.set_test_snap_yaml("apps", apps)
+
+        c = SnapReviewDeclaration(self.test_name)
+        base = {
+            'plugs': {
+                'foo': {
+                    'deny-connection': True
+                },
+                'bar': {
+                    'allow-installation': True
+                }
+            },
+            'slots': {}
+        }
+        self._set_base_declaration(c, base)
+        c._verify_iface_by_declaration = \
+            MagicMock(wraps=c._verify_iface_by_declaration)
+        c.check_declaration_apps()
+        r = c.click_report
+        expected_counts = {'info': 2, 'warn': 0, 'error': 3}
+        self.check_results(r, expected_counts)
+        self.assertEqual(c._verify_iface_by_declaration.call_count, 2)
+
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        for app in apps:
+            name = 'declaration-snap-v2:plugs_deny-connection:%s:foo' % app
+            expected['error'][name] = {"text": "human review required due to 'deny-connection' constraint from base declaration"}
+        for app in ['app1', 'app3']:
+            name = 'declaration-snap-v2:plugs:%s:bar' % app
+            expected['info'][name] = {"text": "OK"}
+        self.check_results(r, expected=expected)
+
+    def test_check_declaration_same_interface_attributes(self):
+        '''Test check_declaration - same interface, other attributes'''
+        plugs = {'iface-foo1': {'interface': 'foo', 'attrib1': 'val1'},
+                 'iface-foo2': {'interface': 'foo', 'attrib1': 'val2'},
+                 'iface-foo3': {'interface': 'foo', 'attrib1': 'val1'}}
+        self.set_test_snap_yaml("plugs", plugs)
+        c = SnapReviewDeclaration(self.test_name)
+        base = {
+            'plugs': {
+                'foo': {
+                    'deny-connection': {
+                        'plug-attributes': {
+                            'attrib1': 'val1'
+                        }
+                    }
+                }
+            }
+        }
+        self._set_base_declaration(c, base)
+        c._verify_iface_by_declaration = \
+            MagicMock(wraps=c._verify_iface_by_declaration)
+        c.check_declaration()
+        r = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 2}
+        self.check_results(r, expected_counts)
+        self.assertEqual(c._verify_iface_by_declaration.call_count, 2)
+
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        for iface in ['iface-foo1', 'iface-foo3']:
+            name = 'declaration-snap-v2:plugs_deny-connection:%s:foo' % iface
+            expected['error'][name] = {"text": "human review required due to 'deny-connection' constraint for 'plug-attributes' from base declaration"}
+        name = 'declaration-snap-v2:plugs:iface-foo2:foo'
+        expected['info'][name] = {"text": "OK"}
+        self.check_results(r, expected=expected)
+
     def test_check_declaration_interface_app_bad_ref(self):
         '''Test check_declaration - interface - app - bad ref'''
         apps = {'app1': {'slots': [{}]}}
@@ -620,6 +620,22 @@ class TestSnapReviewLint(sr_tests.TestSnapReview):
         expected_counts = {'info': 1, 'warn': 0, 'error': 0}
         self.check_results(r, expected_counts)
 
+    def test_check_architecture_specified_needed_other_binary(self):
+        '''Test check_architecture_specified_needed() - other arch binary'''
+        self.set_test_snap_yaml("architectures", ["s390x"])
+        c = SnapReviewLint(self.test_name)
+        c.pkg_bin_files = ["path/to/some/compiled/binary"]
+        c.pkg_bin_arches = {"path/to/some/compiled/binary": "amd64"}
+        c.check_architecture_specified_needed()
+        r = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(r, expected_counts)
+        name = c._get_check_name('architecture_specified_needed',
+                                 extra='s390x')
+        self.assertEqual(r['info'][name]['text'],
+                         "Could not find compiled binaries for architecture "
+                         "'s390x' (found: amd64)")
+
     def test_check_architectures_single_armhf(self):
         '''Test check_architectures() (single arch, armhf)'''
         self.set_test_snap_yaml("architectures", ["armhf"])
@@ -18,11 +18,13 @@ from __future__ import print_function
 from unittest import TestCase
 import os
 import shutil
+import stat
 import tempfile
 
-from clickreviews.common import cleanup_unpack
+from clickreviews.common import cleanup_unpack, unpack_pkg
 from clickreviews.common import check_results as common_check_results
 from clickreviews.sr_security import SnapReviewSecurity
+from clickreviews.squashfs import SquashfsEntry
 import clickreviews.sr_tests as sr_tests
 from clickreviews.tests import utils
 
@@ -856,6 +858,117 @@ brw-rw-rw- root/root                8,12a 2016-03-11 12:25 squashfs-root/foo
         expected['error'][name] = {"text": "malformed lines in unsquashfs output: 'time 'z2:25' malformed for './foo''"}
         self.check_results(report, expected=expected)
 
+    def _create_squashfs_entry(self, path, ftype='-', mode=0o644, uid=0,
+                               gid=0):
+        fmt = {'-': stat.S_IFREG,
+               'd': stat.S_IFDIR,
+               'l': stat.S_IFLNK,
+               'b': stat.S_IFBLK,
+               'c': stat.S_IFCHR,
+               'p': stat.S_IFIFO,
+               's': stat.S_IFSOCK}
+        return SquashfsEntry(path, ftype, fmt[ftype] | mode, uid, gid, 0,
+                             0, None, None, None)
+
+    def test_check_squashfs_files_entries(self):
+        '''Test check_squashfs_files() - squashfs entries'''
+        entries = [self._create_squashfs_entry('.', 'd', 0o775),
+                   self._create_squashfs_entry('./bin', 'd', 0o775),
+                   self._create_squashfs_entry('./bin/echo', '-', 0o775),
+                   self._create_squashfs_entry('./bin/link', 'l', 0o777),
+                   self._create_squashfs_entry('./meta', 'd', 0o775),
+                   self._create_squashfs_entry('./meta/snap.yaml'),
+                   ]
+        self.set_test_squashfs_entries(entries)
+        c = SnapReviewSecurity(self.test_name)
+        c.check_squashfs_files()
+        report = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(report, expected_counts)
+
+    def test_check_squashfs_files_entries_bad_mode_suid(self):
+        '''Test check_squashfs_files() - squashfs entries - suid'''
+        entries = [self._create_squashfs_entry('./foo', '-', 0o4775)]
+        self.set_test_squashfs_entries(entries)
+        c = SnapReviewSecurity(self.test_name)
+        c.check_squashfs_files()
+        report = c.click_report
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'security-snap-v2:squashfs_files'
+        expected['error'][name] = {"text": "found errors in file output: unusual mode 'rwsrwxr-x' for entry './foo'"}
+        self.check_results(report, expected=expected)
+
+    def test_check_squashfs_files_entries_mode_override(self):
+        '''Test check_squashfs_files() - squashfs entries - override'''
+        entries = [self._create_squashfs_entry('./usr/bin/sudo', '-',
+                                               0o4755)]
+        self.set_test_squashfs_entries(entries)
+        self.set_test_snap_yaml("name", "ubuntu-core")
+        c = SnapReviewSecurity(self.test_name)
+        c.check_squashfs_files()
+        report = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(report, expected_counts)
+
+    def test_check_squashfs_files_entries_bad_type_char(self):
+        '''Test check_squashfs_files() - squashfs entries - char device'''
+        entries = [self._create_squashfs_entry('./foo', 'c', 0o666)]
+        self.set_test_squashfs_entries(entries)
+        c = SnapReviewSecurity(self.test_name)
+        c.check_squashfs_files()
+        report = c.click_report
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'security-snap-v2:squashfs_files'
+        expected['error'][name] = {"text": "found errors in file output: file type 'c' not allowed (./foo)"}
+        self.check_results(report, expected=expected)
+
+    def test_check_squashfs_files_entries_type_char_os(self):
+        '''Test check_squashfs_files() - squashfs entries - char device os'''
+        entries = [self._create_squashfs_entry('./foo', 'c', 0o666)]
+        self.set_test_squashfs_entries(entries)
+        self.set_test_snap_yaml("type", "os")
+        c = SnapReviewSecurity(self.test_name)
+        c.check_squashfs_files()
+        report = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(report, expected_counts)
+
+    def test_check_squashfs_files_entries_bad_user(self):
+        '''Test check_squashfs_files() - squashfs entries - bad user'''
+        entries = [self._create_squashfs_entry('./foo', uid=1000)]
+        self.set_test_squashfs_entries(entries)
+        c = SnapReviewSecurity(self.test_name)
+        c.check_squashfs_files()
+        report = c.click_report
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'security-snap-v2:squashfs_files'
+        expected['error'][name] = {"text": "found errors in file output: unusual user/group '1000/root' for './foo'"}
+        self.check_results(report, expected=expected)
+
+    def test_check_squashfs_files_entries_bad_symlink(self):
+        '''Test check_squashfs_files() - squashfs entries - symlink mode'''
+        entries = [self._create_squashfs_entry('./foo', 'l', 0o776)]
+        self.set_test_squashfs_entries(entries)
+        c = SnapReviewSecurity(self.test_name)
+        c.check_squashfs_files()
+        report = c.click_report
+        expected = dict()
+        expected['error'] = dict()
+        expected['warn'] = dict()
+        expected['info'] = dict()
+        name = 'security-snap-v2:squashfs_files'
+        expected['error'][name] = {"text": "found errors in file output: unusual mode 'rwxrwxrw-' for symlink './foo'"}
+        self.check_results(report, expected=expected)
+
 
 class TestSnapReviewSecurityNoMock(TestCase):
     """Tests without mocks where they are not needed."""
@@ -921,7 +1034,9 @@ exit 1
         '''Test check_squashfs_resquash() - unsquashfs failure'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
-        c = SnapReviewSecurity(package)
+        # a tree given by the caller is unsquashed again
+        unpack_dir = unpack_pkg(package, os.path.join(output_dir, 'given'))
+        c = SnapReviewSecurity(package, unpack_dir=unpack_dir)
 
         # fake unsquashfs
         unsquashfs = os.path.join(output_dir, 'unsquashfs')
@@ -977,12 +1092,13 @@ exit 1
         self.check_results(report, expected_counts)
 
     def test_check_squashfs_resquash_sha512sum_fail(self):
-        '''Test check_squashfs_resquash() - sha512sum failure'''
+        '''Test check_squashfs_resquash() - sha512sum not used on snap'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
+        # fake sha512sum. The snap itself is hashed in-process so this never
+        # sees it
         sha512sum = os.path.join(output_dir, 'sha512sum')
         content = '''#!/bin/sh
 bn=`basename "$1"`
@@ -990,6 +1106,7 @@ if [ "$bn" = "test_1.0_all.snap" ]; then
     echo test error: sha512sum failure
     exit 1
 fi
+echo deadbeef $1
 exit 0
 '''
         with open(sha512sum, 'w') as f:
@@ -1005,29 +1122,23 @@ exit 0
         c.check_squashfs_resquash()
         os.environ['PATH'] = old_path
         report = c.click_report
-        expected_counts = {'info': None, 'warn': 0, 'error': 1}
+        expected_counts = {'info': None, 'warn': 0, 'error': 0}
         self.check_results(report, expected_counts)
 
     def test_check_squashfs_resquash_sha512sum_fail_repacked(self):
-        '''Test check_squashfs_resquash() - sha512sum failure (repacked)'''
+        '''Test check_squashfs_resquash() - no checksum of repack'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
-        sha512sum = os.path.join(output_dir, 'sha512sum')
+        # fake mksquashfs that doesn't create the repack
+        mksquashfs = os.path.join(output_dir, 'mksquashfs')
         content = '''#!/bin/sh
-bn=`basename "$1"`
-if [ "$bn" != "test_1.0_all.snap" ]; then
-    echo test error: sha512sum failure
-    exit 1
-fi
-echo deadbeef $1
 exit 0
 '''
-        with open(sha512sum, 'w') as f:
+        with open(mksquashfs, 'w') as f:
             f.write(content)
-        os.chmod(sha512sum, 0o775)
+        os.chmod(mksquashfs, 0o775)
 
         old_path = os.environ['PATH']
         if old_path:
@@ -1047,20 +1158,15 @@ exit 0
         package = utils.make_snap2(output_dir=output_dir)
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
-        sha512sum = os.path.join(output_dir, 'sha512sum')
+        # fake mksquashfs that creates a different image
+        mksquashfs = os.path.join(output_dir, 'mksquashfs')
         content = '''#!/bin/sh
-bn=`basename "$1"`
-if [ "$bn" = "test_1.0_all.snap" ]; then
-    echo beefeeee $1
-else
-    echo deadbeef $1
-fi
+echo different > "$2"
 exit 0
 '''
-        with open(sha512sum, 'w') as f:
+        with open(mksquashfs, 'w') as f:
             f.write(content)
-        os.chmod(sha512sum, 0o775)
+        os.chmod(mksquashfs, 0o775)
 
         old_path = os.environ['PATH']
         if old_path:
@@ -1100,20 +1206,60 @@ type: os
 
         c = SnapReviewSecurity(package)
 
-        # fake sha512sum
-        sha512sum = os.path.join(output_dir, 'sha512sum')
+        # fake mksquashfs that creates a different image
+        mksquashfs = os.path.join(output_dir, 'mksquashfs')
         content = '''#!/bin/sh
-bn=`basename "$1"`
-if [ "$bn" = "test_1.0_all.snap" ]; then
-    echo beefeeee $1
-else
-    echo deadbeef $1
-fi
+echo different > "$2"
 exit 0
 '''
-        with open(sha512sum, 'w') as f:
+        with open(mksquashfs, 'w') as f:
             f.write(content)
-        os.chmod(sha512sum, 0o775)
+        os.chmod(mksquashfs, 0o775)
+
+        old_path = os.environ['PATH']
+        if old_path:
+            os.environ['PATH'] = "%s:%s" % (output_dir, os.environ['PATH'])
+        else:
+            os.environ['PATH'] = output_dir  # pragma: nocover
+
+        c.check_squashfs_resquash()
+        os.environ['PATH'] = old_path
+        report = c.click_report
+        expected_counts = {'info': 1, 'warn': 0, 'error': 0}
+        self.check_results(report, expected_counts)
+
+    def test_check_squashfs_resquash_reuses_unpack_dir(self):
+        '''Test check_squashfs_resquash() - resquashes unpack_dir'''
+        output_dir = self.mkdtemp()
+        package = utils.make_snap2(output_dir=output_dir)
+        c = SnapReviewSecurity(package)
+        unpack_dir = c.unpack_dir
+
+        # fake unsquashfs that only supports -fstime
+        unsquashfs = os.path.join(output_dir, 'unsquashfs')
+        content = '''#!/bin/sh
+if [ "$1" = "-fstime" ]; then
+    echo 0
+    exit 0
+fi
+echo test error: unsquashfs failure
+exit 1
+'''
+        with open(unsquashfs, 'w') as f:
+            f.write(content)
+        os.chmod(unsquashfs, 0o775)
+
+        # fake mksquashfs that records what it squashed and where to
+        mksquashfs = os.path.join(output_dir, 'mksquashfs')
+        content = '''#!/bin/sh
+echo "$1" > %s/squashed
+echo "$2" > %s/repack
+echo repack > "$2"
+exit 0
+''' % (output_dir, output_dir)
+        with open(mksquashfs, 'w') as f:
+            f.write(content)
+        os.chmod(mksquashfs, 0o775)
 
         old_path = os.environ['PATH']
         if old_path:
@@ -1126,6 +1272,15 @@ exit 0
         report = c.click_report
         expected_counts = {'info': 1, 'warn': 0, 'error': 0}
         self.check_results(report, expected_counts)
+        with open(os.path.join(output_dir, 'squashed')) as f:
+            self.assertEqual(f.read().strip(), unpack_dir)
+        # the repack is not kept around
+        with open(os.path.join(output_dir, 'repack')) as f:
+            repack = f.read().strip()
+        if hasattr(os, 'memfd_create'):
+            self.assertTrue(repack.startswith('/proc/%d/fd/' % os.getpid()))
+        else:
+            self.assertFalse(os.path.exists(repack))  # pragma: nocover
 
     def test_check_squashfs_resquash_1555305(self):
         '''Test check_squashfs_resquash()'''
@@ -1149,7 +1304,8 @@ exit 0
         '''Test check_squashfs_resquash() - unsquashfs failure'''
         output_dir = self.mkdtemp()
         package = utils.make_snap2(output_dir=output_dir)
-        c = SnapReviewSecurity(package)
+        unpack_dir = unpack_pkg(package, os.path.join(output_dir, 'given'))
+        c = SnapReviewSecurity(package, unpack_dir=unpack_dir)
 
         # fake unsquashfs
         unsquashfs = os.path.join(output_dir, 'unsquashfs')
@@ -0,0 +1,149 @@
+'''test_unpack_cache.py: tests for the unpack_cache module'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+import fcntl
+import os
+import shutil
+import tempfile
+
+from clickreviews.unpack_cache import UnpackCache
+
+
+class TestUnpackCache(TestCase):
+    """Tests for the persistent unpack cache."""
+    def mkdtemp(self):
+        """Create a temp dir which is cleaned up after test."""
+        tmp_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, tmp_dir)
+        return tmp_dir
+
+    def _make_tree(self, size):
+        d = self.mkdtemp()
+        os.mkdir(os.path.join(d, 'sub'))
+        with open(os.path.join(d, 'sub', 'file'), 'wb') as f:
+            f.write(b'x' * size)
+        return d
+
+    def _lookup(self, cache, key, kind):
+        d = cache.lookup(key, kind)
+        if d is not None:
+            self.addCleanup(shutil.rmtree, d)
+        return d
+
+    def _age(self, cache, key, kind, seconds):
+        entry = os.path.join(cache.path, "%s-%s" % (key, kind))
+        st = os.stat(entry)
+        os.utime(entry, (st.st_atime - seconds, st.st_mtime - seconds))
+
+    def test_insert_lookup(self):
+        '''Test insert() and lookup()'''
+        cache = UnpackCache(os.path.join(self.mkdtemp(), 'cache'))
+        self.assertEqual(cache.lookup('abc', 'unpack'), None)
+
+        d = self._make_tree(10)
+        cache.insert('abc', 'unpack', d)
+        self.assertTrue(os.path.isfile(os.path.join(d, 'sub/file')))
+        tree = self._lookup(cache, 'abc', 'unpack')
+        self.assertFalse(tree.startswith(cache.path))
+        with open(os.path.join(tree, 'sub/file'), 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 10)
+        self.assertEqual(cache.lookup('abc', 'raw'), None)
+
+    def test_lookup_copy(self):
+        '''Test lookup() - changing the tree doesn't alter the cache'''
+        cache = UnpackCache(self.mkdtemp())
+        d = self._make_tree(10)
+        os.chmod(os.path.join(d, 'sub/file'), 0o4751)
+        os.chmod(d, 0o751)
+        cache.insert('abc', 'unpack', d)
+
+        tree = self._lookup(cache, 'abc', 'unpack')
+        for rel in ['.', 'sub', 'sub/file']:
+            self.assertEqual(os.lstat(os.path.join(tree, rel)).st_mode,
+                             os.lstat(os.path.join(d, rel)).st_mode)
+        os.chmod(os.path.join(tree, 'sub/file'), 0o644)
+        with open(os.path.join(tree, 'sub/file'), 'wb') as f:
+            f.write(b'poisoned')
+
+        tree = self._lookup(cache, 'abc', 'unpack')
+        fn = os.path.join(tree, 'sub/file')
+        self.assertEqual(os.stat(fn).st_mode & 0o7777, 0o4751)
+        with open(fn, 'rb') as f:
+            self.assertEqual(f.read(), b'x' * 10)
+
+    def test_insert_existing(self):
+        '''Test insert() - key cached meanwhile'''
+        cache = UnpackCache(self.mkdtemp())
+        cache.insert('abc', 'unpack', self._make_tree(10))
+        d = self._make_tree(20)
+        cache.insert('abc', 'unpack', d)
+        self.assertTrue(os.path.isfile(os.path.join(d, 'sub/file')))
+        tree = self._lookup(cache, 'abc', 'unpack')
+        self.assertEqual(os.path.getsize(os.path.join(tree, 'sub/file')), 10)
+
+    def test_insert_too_big(self):
+        '''Test insert() - tree bigger than the cache'''
+        cache = UnpackCache(self.mkdtemp(), max_size=10)
+        d = self._make_tree(100)
+        cache.insert('abc', 'unpack', d)
+        self.assertTrue(os.path.isfile(os.path.join(d, 'sub/file')))
+        self.assertEqual(cache.lookup('abc', 'unpack'), None)
+
+    def test_evict_lru(self):
+        '''Test least recently used entries are evicted'''
+        cache = UnpackCache(self.mkdtemp(), max_size=250)
+        cache.insert('aaa', 'unpack', self._make_tree(100))
+        self._age(cache, 'aaa', 'unpack', 20)
+        cache.insert('bbb', 'unpack', self._make_tree(100))
+        self._age(cache, 'bbb', 'unpack', 10)
+        # using 'aaa' makes 'bbb' the oldest one
+        self._lookup(cache, 'aaa', 'unpack')
+        cache.insert('ccc', 'unpack', self._make_tree(100))
+
+        self.assertNotEqual(self._lookup(cache, 'aaa', 'unpack'), None)
+        self.assertEqual(self._lookup(cache, 'bbb', 'unpack'), None)
+        self.assertNotEqual(self._lookup(cache, 'ccc', 'unpack'), None)
+
+    def test_evict_in_use(self):
+        '''Test entries being copied by another run aren't evicted'''
+        cache = UnpackCache(self.mkdtemp(), max_size=150)
+        cache.insert('aaa', 'unpack', self._make_tree(100))
+        self._age(cache, 'aaa', 'unpack', 10)
+
+        # another run in the middle of lookup('aaa')
+        fd = cache._lock(os.path.join(cache.path, 'aaa-unpack'),
+                         fcntl.LOCK_SH)
+        try:
+            cache.insert('bbb', 'unpack', self._make_tree(100))
+            self.assertTrue(os.path.isdir(os.path.join(cache.path,
+                                                       'aaa-unpack/tree')))
+        finally:
+            os.close(fd)
+
+        # once done it goes
+        cache.insert('ccc', 'unpack', self._make_tree(100))
+        self.assertEqual(self._lookup(cache, 'aaa', 'unpack'), None)
+        self.assertEqual(sorted(os.listdir(cache.path)),
+                         ['ccc-unpack'])
+
+    def test_invalid_key(self):
+        '''Test keys are validated'''
+        cache = UnpackCache(self.mkdtemp())
+        with self.assertRaises(ValueError):
+            cache.lookup('../abc', 'unpack')
+        with self.assertRaises(ValueError):
+            cache.lookup('abc', 'other')
@@ -0,0 +1,81 @@
+'''test_yaml_loader.py: tests for the yaml_loader module'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from unittest import TestCase
+import io
+import types
+import yaml
+
+import clickreviews.yaml_loader as yaml_loader
+
+HASHES_YAML = '''archive-sha512: abc
+files:
+- name: bin
+  mode: drwxr-xr-x
+- name: bin/foo
+  mode: frwxr-xr-x
+  size: 0x10
+  sha512: def
+- {name: meta/x, mode: frw-r--r--, size: 1, sha512: null}
+other: &anchor [1, 2]
+same: *anchor
+'''
+
+
+class TestYamlLoader(TestCase):
+    """Tests for the YAML loading layer."""
+    def _load_streaming(self, contents, key='files'):
+        return yaml_loader.safe_load_streaming(
+            lambda: io.StringIO(contents), key)
+
+    def test_safe_load(self):
+        '''Test safe_load() is yaml.safe_load()'''
+        self.assertEqual(yaml_loader.safe_load(io.StringIO(HASHES_YAML)),
+                         yaml.safe_load(HASHES_YAML))
+
+    def test_safe_load_unsafe(self):
+        '''Test safe_load() doesn't construct arbitrary objects'''
+        with self.assertRaises(yaml.YAMLError):
+            yaml_loader.safe_load('!!python/object/apply:os.getcwd []')
+
+    def test_safe_load_streaming(self):
+        '''Test safe_load_streaming()'''
+        data = self._load_streaming(HASHES_YAML)
+        self.assertIsInstance(data['files'], types.GeneratorType)
+        data['files'] = list(data['files'])
+        self.assertEqual(data, yaml.safe_load(HASHES_YAML))
+
+    def test_safe_load_streaming_key_first(self):
+        '''Test safe_load_streaming() loads what comes after key'''
+        contents = 'files:\n- name: foo\narchive-sha512: abc\n'
+        data = self._load_streaming(contents)
+        self.assertEqual(data['archive-sha512'], 'abc')
+        self.assertEqual(list(data['files']), [{'name': 'foo'}])
+
+    def test_safe_load_streaming_not_sequence(self):
+        '''Test safe_load_streaming() when key is not a sequence'''
+        for contents in ['files: foo\n', 'files:\n', 'foo: [1]\n',
+                         '- files\n', '']:
+            self.assertEqual(self._load_streaming(contents),
+                             yaml.safe_load(contents))
+
+    def test_safe_load_streaming_invalid(self):
+        '''Test safe_load_streaming() with invalid documents'''
+        for contents in ['files: [1\n', 'a: 1\n---\nb: 2\n', 'a: *foo\n',
+                         # items are loaded one at a time
+                         'files:\n- &foo {a: 1}\n- *foo\n']:
+            with self.assertRaises(yaml.YAMLError):
+                self._load_streaming(contents)
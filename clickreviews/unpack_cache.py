@@ -0,0 +1,193 @@
+'''unpack_cache.py: persistent cache of unpacked packages'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import fcntl
+import os
+import re
+import shutil
+import subprocess
+import tempfile
+
+DEFAULT_MAX_SIZE = 10 * 1024 * 1024 * 1024  # 10GiB
+
+# Cached trees live in '<path>/<key>-<kind>/tree' with the size of the tree
+# in '<path>/<key>-<kind>/size'. The mtime of '<path>/<key>-<kind>' is the
+# last time the entry was used and is what eviction goes by. Runs copying
+# the tree out hold a shared flock() on '<path>/<key>-<kind>/lock', which
+# eviction needs exclusively.
+ENTRY_PATTERN = re.compile(r'^[0-9a-f]+-(unpack|raw)$')
+
+
+def _tree_size(d):
+    '''Return the size of the files in d'''
+    size = 0
+    for root, dirnames, filenames in os.walk(d):
+        for f in filenames:
+            try:
+                size += os.lstat(os.path.join(root, f)).st_size
+            except OSError:
+                pass
+    return size
+
+
+def _rmtree(d):
+    '''Remove d, even if it has read-only directories'''
+    def _onerror(func, path, exc_info):
+        if os.path.isdir(os.path.dirname(path)):
+            os.chmod(os.path.dirname(path), 0o700)
+        if os.path.isdir(path) and not os.path.islink(path):
+            os.chmod(path, 0o700)
+        func(path)
+
+    shutil.rmtree(d, onerror=_onerror)
+
+
+def _copy_tree(src, dst):
+    '''Copy what is in src to the existing directory dst, keeping the
+       modes, times, links and special files, and give dst the modes of
+       src'''
+    try:
+        subprocess.check_output(['cp', '-a', '--reflink=auto',
+                                 os.path.join(src, '.'), dst],
+                                stderr=subprocess.STDOUT)
+    except subprocess.CalledProcessError as e:
+        raise OSError("could not copy '%s': %s" %
+                      (src, e.output.decode('utf-8', 'replace')))
+    shutil.copystat(src, dst)
+
+
+class UnpackCache(object):
+    '''Unpacked trees keyed by the sha512 of the package they come from.
+       Callers only ever get copies of the cached trees, so whatever a
+       check does to its tree doesn't alter the cache.'''
+    def __init__(self, path, max_size=None):
+        self.path = os.path.abspath(path)
+        self.max_size = max_size if max_size is not None \
+            else DEFAULT_MAX_SIZE
+        os.makedirs(self.path, exist_ok=True)
+
+    def _entry(self, key, kind):
+        if not re.search(r'^[0-9a-f]+$', key):
+            raise ValueError("invalid key '%s'" % key)
+        if kind not in ['unpack', 'raw']:
+            raise ValueError("invalid kind '%s'" % kind)
+        return os.path.join(self.path, "%s-%s" % (key, kind))
+
+    def _lock(self, entry, operation):
+        '''Return an fd with the flock() operation done on the lock of entry,
+           or None if entry is gone or, for a non-blocking operation, in
+           use'''
+        try:
+            fd = os.open(os.path.join(entry, 'lock'),
+                         os.O_RDONLY | os.O_CREAT, 0o600)
+        except OSError:
+            return None
+        try:
+            fcntl.flock(fd, operation)
+        except OSError:
+            os.close(fd)
+            return None
+        return fd
+
+    def lookup(self, key, kind='unpack'):
+        '''Return a copy of the cached tree for key in a new temporary
+           directory, which is the caller's to remove, or None'''
+        entry = self._entry(key, kind)
+        tree = os.path.join(entry, 'tree')
+        fd = self._lock(entry, fcntl.LOCK_SH)
+        if fd is None:
+            return None
+        d = None
+        try:
+            # evict() may have moved the entry away while waiting
+            if not os.path.isdir(tree):
+                return None
+            os.utime(entry)
+            d = tempfile.mkdtemp(prefix='review-')
+            _copy_tree(tree, d)
+        except OSError:
+            if d is not None:
+                _rmtree(d)
+            return None
+        finally:
+            os.close(fd)
+        return d
+
+    def insert(self, key, kind, d):
+        '''Cache a copy of the freshly unpacked tree d, which stays the
+           caller's. Nothing is cached if another run cached the same key
+           meanwhile or the copy fails'''
+        entry = self._entry(key, kind)
+        size = _tree_size(d)
+        if size > self.max_size:
+            return
+
+        tmp = tempfile.mkdtemp(prefix='tmp-', dir=self.path)
+        try:
+            os.mkdir(os.path.join(tmp, 'tree'))
+            _copy_tree(d, os.path.join(tmp, 'tree'))
+            with open(os.path.join(tmp, 'size'), 'w') as f:
+                f.write("%d\n" % size)
+            os.rename(tmp, entry)
+        except OSError:
+            _rmtree(tmp)
+            return
+
+        self.evict(keep=entry)
+
+    def _entries(self):
+        '''Return (mtime, size, path) for every entry, least recently used
+           first'''
+        entries = []
+        for name in os.listdir(self.path):
+            if not ENTRY_PATTERN.search(name):
+                continue
+            entry = os.path.join(self.path, name)
+            try:
+                mtime = os.stat(entry).st_mtime
+                with open(os.path.join(entry, 'size')) as f:
+                    size = int(f.read())
+            except (OSError, ValueError):
+                continue
+            entries.append((mtime, size, entry))
+        return sorted(entries)
+
+    def evict(self, keep=None):
+        '''Remove least recently used entries until the cache fits in
+           max_size'''
+        entries = self._entries()
+        total = sum([e[1] for e in entries])
+        for (mtime, size, entry) in entries:
+            if total <= self.max_size:
+                break
+            if entry == keep:
+                continue
+            # skip the entries other runs are copying
+            fd = self._lock(entry, fcntl.LOCK_EX | fcntl.LOCK_NB)
+            if fd is None:
+                continue
+            # move it out of the way of lookup() before removing it
+            tmp = tempfile.mkdtemp(prefix='tmp-', dir=self.path)
+            try:
+                os.rename(entry, os.path.join(tmp, 'entry'))
+            except OSError:
+                _rmtree(tmp)
+                continue
+            finally:
+                os.close(fd)
+            _rmtree(tmp)
+            total -= size
@@ -0,0 +1,171 @@
+'''yaml_loader.py: load YAML with libyaml when available'''
+#
+# Copyright (C) 2018 The UBports Foundation
+#
+# This program is free software: you can redistribute it and/or modify
+# it under the terms of the GNU General Public License as published by
+# the Free Software Foundation; version 3 of the License.
+#
+# This program is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+from __future__ import print_function
+import yaml
+
+try:
+    from yaml import CSafeLoader as SafeLoader
+except ImportError:  # pragma: nocover
+    # PyYAML built without libyaml
+    from yaml import SafeLoader
+
+
+def safe_load(stream):
+    '''Same as yaml.safe_load(), but much faster with libyaml'''
+    return yaml.load(stream, Loader=SafeLoader)
+
+
+def _resolve_tag(loader, kind, event, value=None):
+    if event.tag is None or event.tag == '!':
+        return loader.resolve(kind, value, event.implicit)
+    return event.tag
+
+
+def _compose_node(loader, anchors):
+    '''Compose the node starting at the next event, like yaml's Composer
+       (which the libyaml parser doesn't expose for a part of a document)'''
+    if loader.check_event(yaml.AliasEvent):
+        event = loader.get_event()
+        if event.anchor not in anchors:
+            raise yaml.composer.ComposerError(
+                None, None, "found undefined alias %r" % event.anchor,
+                event.start_mark)
+        return anchors[event.anchor]
+
+    event = loader.get_event()
+    if isinstance(event, yaml.ScalarEvent):
+        node = yaml.ScalarNode(
+            _resolve_tag(loader, yaml.ScalarNode, event, event.value),
+            event.value, event.start_mark, event.end_mark, style=event.style)
+    elif isinstance(event, yaml.SequenceStartEvent):
+        node = yaml.SequenceNode(
+            _resolve_tag(loader, yaml.SequenceNode, event), [],
+            event.start_mark, None, flow_style=event.flow_style)
+    elif isinstance(event, yaml.MappingStartEvent):
+        node = yaml.MappingNode(
+            _resolve_tag(loader, yaml.MappingNode, event), [],
+            event.start_mark, None, flow_style=event.flow_style)
+    else:
+        raise yaml.composer.ComposerError(
+            None, None, "unexpected %s" % event.__class__.__name__,
+            event.start_mark)
+    if event.anchor is not None:
+        anchors[event.anchor] = node
+
+    if isinstance(node, yaml.SequenceNode):
+        while not loader.check_event(yaml.SequenceEndEvent):
+            node.value.append(_compose_node(loader, anchors))
+        node.end_mark = loader.get_event().end_mark
+    elif isinstance(node, yaml.MappingNode):
+        while not loader.check_event(yaml.MappingEndEvent):
+            key = _compose_node(loader, anchors)
+            node.value.append((key, _compose_node(loader, anchors)))
+        node.end_mark = loader.get_event().end_mark
+    return node
+
+
+def _skip_node(loader, check_anchors=False):
+    '''Skip the node starting at the next event'''
+    depth = 0
+    while True:
+        event = loader.get_event()
+        # only node events have an anchor, and an alias is one
+        if check_anchors and getattr(event, 'anchor', None) is not None:
+            # aliases can't be resolved when items are loaded one by one
+            raise yaml.composer.ComposerError(
+                None, None, "anchors and aliases are not supported here",
+                event.start_mark)
+        if isinstance(event, (yaml.SequenceStartEvent,
+                              yaml.MappingStartEvent)):
+            depth += 1
+        elif isinstance(event, (yaml.SequenceEndEvent,
+                                yaml.MappingEndEvent)):
+            depth -= 1
+        if depth == 0:
+            return
+
+
+def _start_document(loader):
+    loader.get_event()  # StreamStartEvent
+    if loader.check_event(yaml.StreamEndEvent):
+        return False
+    loader.get_event()  # DocumentStartEvent
+    return True
+
+
+def _end_document(loader):
+    loader.get_event()  # DocumentEndEvent
+    if not loader.check_event(yaml.StreamEndEvent):
+        event = loader.get_event()
+        raise yaml.composer.ComposerError(
+            "expected a single document in the stream", None,
+            "but found another document", event.start_mark)
+
+
+def _iter_sequence(open_stream, key):
+    '''Yield the items of the sequence under key, one at a time'''
+    loader = SafeLoader(open_stream())
+    try:
+        _start_document(loader)
+        loader.get_event()  # MappingStartEvent
+        while not loader.check_event(yaml.MappingEndEvent):
+            k = loader.construct_document(_compose_node(loader, {}))
+            if k != key:
+                _skip_node(loader)
+                continue
+            loader.get_event()  # SequenceStartEvent
+            while not loader.check_event(yaml.SequenceEndEvent):
+                yield loader.construct_document(_compose_node(loader, {}))
+            return
+    finally:
+        loader.dispose()
+
+
+def safe_load_streaming(open_stream, key):
+    '''
+    Same as safe_load(open_stream()) for a document with a long sequence
+    under key in its top-level mapping (eg, 'files' in a snap v1
+    hashes.yaml), except that sequence is not loaded at once. Instead,
+    key is set to an iterator which loads one item at a time. Everything
+    else is loaded here, wherever it is in the document, so open_stream()
+    is called twice: once here and once by the iterator.
+    '''
+    loader = SafeLoader(open_stream())
+    try:
+        if not _start_document(loader):
+            return None
+        if not loader.check_event(yaml.MappingStartEvent):
+            data = loader.construct_document(_compose_node(loader, {}))
+            _end_document(loader)
+            return data
+
+        data = dict()
+        anchors = dict()
+        loader.get_event()  # MappingStartEvent
+        while not loader.check_event(yaml.MappingEndEvent):
+            k = loader.construct_document(_compose_node(loader, anchors))
+            if k == key and loader.check_event(yaml.SequenceStartEvent):
+                _skip_node(loader, check_anchors=True)
+                data[k] = _iter_sequence(open_stream, key)
+            else:
+                data[k] = loader.construct_document(_compose_node(loader,
+                                                                  anchors))
+        loader.get_event()  # MappingEndEvent
+        _end_document(loader)
+        return data
+    finally:
+        loader.dispose()